@@ -2,8 +2,13 @@
 import os
 import numpy as np
 from mpi4py import MPI
+
+# Imported before LAMMPS so the time spent importing it is reported
+from instrumentation import StageTimer, report_path
+
 from lammps import lammps, PyLammps
 
+from artifact_cache import ArtifactCache
 from utilities import set_path, clear_dir
 
 # --------------------------- CONFIG ---------------------------#
@@ -23,10 +28,19 @@ OUTPUT_DIR = 'min_input'
 POTENTIAL_DIR = '00_potentials'
 POTENTIAL_FILE = 'malerba.fs'
 
+BOUNDARY = 'p f p'
+
 ENERGY_TOL = 1e-6
 FORCE_TOL = 1e-8
+MAX_ITERATIONS = 1000
+MAX_EVALUATIONS = 10000
 BUFF = 2 # Buffer layer in Ang
 
+# Minimised outputs are reused while the input, potential and settings are unchanged
+USE_CACHE = True
+CACHE_DIR = 'artifact_cache' # Inside MASTER_DATA_DIR
+CACHE_MAX_BYTES = 20 * 1024**3 # Least recently used entries are removed beyond this
+
 # --------------------------- MINIMIZATION ---------------------------#
 
 def main():
@@ -36,6 +50,8 @@ def main():
     rank = comm.Get_rank()
     size = comm.Get_size()
 
+    timer = StageTimer(comm, 'minimize')
+
     #--- CREATE AND SET DIRECTORIES ---#
 
     set_path(PROJECT_ROOT)
@@ -63,6 +79,15 @@ def main():
 
         potential_path = os.path.join(POTENTIAL_DIR, POTENTIAL_FILE)
 
+        cache = ArtifactCache(os.path.join(MASTER_DATA_DIR, CACHE_DIR), CACHE_MAX_BYTES) if USE_CACHE else None
+        cache_key = None
+        cache_hit = False
+
+        if cache is not None:
+            with timer.stage('read'):
+                cache_key = cache.key([input_filepath, potential_path], cache_params())
+                cache_hit = cache.fetch(cache_key, {output_file: output_filepath, dump_file: dump_filepath})
+
     else:
         # For other ranks, initialize variables to None or empty strings
         dump_dir = None
@@ -71,14 +96,23 @@ def main():
         output_filepath = None
         dump_filepath = None
         potential_path = None
+        cache_hit = None
 
     # Now broadcast all variables from rank 0 to all ranks
-    dump_dir = comm.bcast(dump_dir, root=0)
-    output_dir = comm.bcast(output_dir, root=0)
-    input_filepath = comm.bcast(input_filepath, root=0)
-    output_filepath = comm.bcast(output_filepath, root=0)
-    dump_filepath = comm.bcast(dump_filepath, root=0)
-    potential_path = comm.bcast(potential_path, root=0)
+    dump_dir = timer.bcast(dump_dir, root=0)
+    output_dir = timer.bcast(output_dir, root=0)
+    input_filepath = timer.bcast(input_filepath, root=0)
+    output_filepath = timer.bcast(output_filepath, root=0)
+    dump_filepath = timer.bcast(dump_filepath, root=0)
+    potential_path = timer.bcast(potential_path, root=0)
+    cache_hit = timer.bcast(cache_hit, root=0)
+
+    if cache_hit:
+        if rank == 0:
+            print(f"Cached minimisation {cache_key[:12]} is up to date, copied to {output_dir}")
+
+        timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR), 'minimize'))
+        return None
 
     #--- LAMMPS SCRIPT ---#
     lmp = lammps()
@@ -89,18 +123,20 @@ def main():
     L.units('metal') # Set units style
     L.atom_style('atomic') # Set atom style
 
-    L.command('boundary p f p') # Set the boundaries of the simulation
+    L.command(f"boundary {BOUNDARY}") # Set the boundaries of the simulation
 
-    L.read_data(input_filepath) # Read input file
+    with timer.stage('read'):
+        L.read_data(input_filepath) # Read input file
 
-    L.pair_style('eam/fs') # Set the potential style
-    L.pair_coeff('*', '*', potential_path, 'Fe') # Select the potential
+        L.pair_style('eam/fs') # Set the potential style
+        L.pair_coeff('*', '*', potential_path, 'Fe') # Select the potential
 
     L.group('fe_atoms', 'type', 1) # Group all atoms
 
     L.compute('peratom', 'all', 'pe/atom') # Set a compute to track the peratom energy
 
-    L.minimize(ENERGY_TOL, FORCE_TOL, 1000, 10000) # Execute minimization
+    with timer.stage('compute'):
+        L.minimize(ENERGY_TOL, FORCE_TOL, MAX_ITERATIONS, MAX_EVALUATIONS) # Execute minimization
 
     """atom_pos = lmp.numpy.extract_atom('x')
     y_pos = atom_pos[:, 1]
@@ -128,13 +164,38 @@ def main():
 
     print("\nWriting outputs...")"""
 
-    L.write_dump('all', 'custom', dump_filepath, 'id', 'x', 'y', 'z', 'c_peratom') # Write a dumpfile containing atom positions and pot energies
-    L.write_data(output_filepath) # Write a lammps input file with minimized configuration for subsequent sims
+    with timer.stage('export'):
+        L.write_dump('all', 'custom', dump_filepath, 'id', 'x', 'y', 'z', 'c_peratom') # Write a dumpfile containing atom positions and pot energies
+        L.write_data(output_filepath) # Write a lammps input file with minimized configuration for subsequent sims
 
     L.close()
 
+    if rank == 0 and cache is not None:
+        with timer.stage('export'):
+            cache.store(cache_key, {output_file: output_filepath, dump_file: dump_filepath}, cache_params())
+
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR), 'minimize'))
+
     return None
 
+# --------------------------- UTILITIES ---------------------------#
+
+def cache_params():
+    """Everything besides the input and potential files that changes the minimised configuration."""
+    return {
+        'stage': 'minimize',
+        'units': 'metal',
+        'atom_style': 'atomic',
+        'boundary': BOUNDARY,
+        'pair_style': 'eam/fs',
+        'elements': ['Fe'],
+        'energy_tol': ENERGY_TOL,
+        'force_tol': FORCE_TOL,
+        'max_iterations': MAX_ITERATIONS,
+        'max_evaluations': MAX_EVALUATIONS,
+        'dump_columns': ['id', 'x', 'y', 'z', 'c_peratom'],
+    }
+
 # --------------------------- ENTRY POINT ---------------------------#
 
 if __name__ == "__main__":
@@ -1,9 +1,19 @@
 # --------------------------- LIBRARIES ---------------------------#
+import json
 import os
+import re
+import time
 from mpi4py import MPI
 import numpy as np
+
+# Imported before LAMMPS so the time spent importing it is reported
+from instrumentation import StageTimer, report_path
+
 from lammps import lammps, PyLammps
 
+from dump_reader import index_dumps, strip_compression, write_partition_stub
+from insitu import (InsituRegistry, TrajectoryHook, AdaptiveDumpHook, TimeSeriesHook, PrecipitateContact,
+                    DislocationPosition, EnergyHistogram, defect_selection, setforce_magnitude, dump_step_expression)
 from utilities import set_path, clear_dir
 
 # --------------------------- CONFIG ---------------------------#
@@ -18,6 +28,7 @@ INPUT_DIR = '02_minimization/min_input'
 INPUT_FILE = 'edge_dislo.lmp'
 
 DUMP_DIR = 'dump_files'
+TRAJECTORY_DIR = 'trajectory_files' # Binary trajectory (DUMP_FORMAT = 'binary'); kept out of DUMP_DIR, which the analyses list as text dumps
 RESTART_DIR = 'restart_files'
 
 POTENTIAL_DIR = '00_potentials'
@@ -30,79 +41,218 @@ FIXED_SURFACE_DEPTH = 5 # Depth of the fixed surface in Angstroms
 DT = 0.001
 TEMPERATURE = 100
 SHEAR_VELOCITY = 1
+VELOCITY_SEED = 1234
 
 RUN_TIME = 100
 THERMO_FREQ = 1000
 DUMP_FREQ = 1000
 RESTART_FREQ = 10000
 
+# Continue from the newest valid restart file instead of starting again from step 0. The run parameters are saved
+# with the restarts and a resume with different ones is refused; clear the restart directory to start again
+RESUME = False
+RUN_PARAMS_FILE = 'run_params.json' # Inside the restart directory
+RESTART_MAGIC = b'LammpS RestartT' # First bytes of every LAMMPS binary restart file
+RESTART_MIN_SIZE_FRACTION = 0.99 # A restart much smaller than the others was cut short while being written
+
+DUMP_FORMAT = 'text' # 'text' for one LAMMPS dump per frame, 'binary' for a single columnar trajectory
+BINARY_TRAJECTORY_FILE = 'trajectory.dtrj'
+DUMP_COMPRESSION = None # Text dumps only: None, 'gz' (LAMMPS custom/gz) or 'zstd' (custom/zstd, needs LAMMPS built with zstd)
+DUMP_COMPRESSION_LEVEL = 3
+DUMP_SUFFIXES = {None: '', 'gz': '.gz', 'zstd': '.zst'} # dump_reader recognises compressed dumps by suffix
+BINARY_FLOAT32_POSITIONS = True
+
+# Text dumps only: write each frame as this many pieces (dump_modify nfile) instead of funnelling it through rank 0
+DUMP_PARTITIONS = None
+PARTITION_DIR = 'partitions' # Inside the dump directory; the dump directory holds one stub per frame listing its pieces
+
+# Adaptive output: sparse frames during free glide, dense frames while the precipitate is loaded
+ADAPTIVE_DUMP = False
+ADAPTIVE_SPARSE_FREQ = 10000
+ADAPTIVE_DENSE_FREQ = 100
+# Thresholds on the total force on the precipitate (eV/Angstrom); tune from the 'trigger' record of a previous run
+ADAPTIVE_FORCE_ON = 50.0
+ADAPTIVE_FORCE_OFF = 25.0
+DUMP_SCHEDULE_FILE = 'dump_schedule.npz'
+
+# Defect-only output: write just the atoms per_atom_threshold.py would keep (above the energy threshold or in the precipitate)
+DEFECT_DUMP = False
+DEFECT_DUMP_THRESHOLD = -4.0
+
+# Write atoms in ascending ID order (dump_modify sort id) so analyses can line frames up without a permutation.
+# LAMMPS then gathers each frame onto one rank, so this costs some dump time on large runs; id_alignment handles unsorted dumps
+SORT_DUMPS = False
+
+# Timestep and atom count of every text dump frame, written to INSITU_DIR after the run so readers can preallocate
+DUMP_INDEX_FILE = 'dump_index.npz'
+
+# In-situ observables computed during the run without dump files: any of 'contact', 'dislocation_position', 'energy_histogram'
+INSITU_HOOKS = []
+INSITU_FREQ = 100
+INSITU_DIR = 'insitu'
+
+CORE_ENERGY_THRESHOLD = -4.0 # Atoms above this energy (eV) count as defect/core atoms
+CONTACT_SHELL = 5 # Distance beyond the precipitate surface counted as contact, in Angstroms
+ENERGY_BINS = np.linspace(-4.3, -3.0, 131)
+
+# Precipitate force and velocity and the pressure tensor, averaged over every step of each TIMESERIES_FREQ-step block
+# and appended to a compact binary series (see timeseries.py); None to disable.
+# Opt-in: the run is split into TIMESERIES_FREQ-step segments for the hook, each with its own setup, so keep it coarse
+TIMESERIES_FREQ = None
+TIMESERIES_FILE = 'precipitate_series.dts'
+# The force comes from the setforce fix: it zeroes the forces the precipitate_force_* reduce computes would see
+TIMESERIES_VALUES = {
+    'fx': 'f_precipitate_freeze[1]', 'fy': 'f_precipitate_freeze[2]', 'fz': 'f_precipitate_freeze[3]',
+    'vx': 'c_precipitate_velocity_x', 'vy': 'c_precipitate_velocity_y', 'vz': 'c_precipitate_velocity_z',
+    'pxx': 'c_press_comp[1]', 'pyy': 'c_press_comp[2]', 'pzz': 'c_press_comp[3]',
+    'pxy': 'c_press_comp[4]', 'pxz': 'c_press_comp[5]', 'pyz': 'c_press_comp[6]',
+}
+
+# In-run stress map: the per-atom stress summed over STRESS_MAP_BIN-wide bins (compute chunk/atom) and divided by the
+# bin volume, averaged over every STRESS_MAP_EVERY steps of each STRESS_MAP_FREQ-step block (fix ave/chunk) and written
+# to INSITU_DIR; None to disable. Read it with stress_field.read_ave_chunk, or bin the dumps with 04_analysis/stress_map.py
+STRESS_MAP_FREQ = None
+STRESS_MAP_EVERY = 100
+STRESS_MAP_BIN = 5.0 # Angstrom
+STRESS_MAP_DIMS = ('x', 'y') # Averaged through the rest, here along the dislocation line
+STRESS_MAP_VALUES = {'sxy': 'c_stress[4]'}
+STRESS_MAP_FILE = 'stress_map.chunk'
+
 # --------------------------- MINIMIZATION ---------------------------#
 
 def main():
 
     #--- INITIALISE MPI ---#
     comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
 
     set_path(PROJECT_ROOT)
 
+    run_simulation(comm, timer=StageTimer(comm, 'simulate'))
+
+    return None
+
+def run_simulation(comm, module_dir=MODULE_DIR, precipitate_radius=PRECIPITATE_RADIUS, temperature=TEMPERATURE,
+                   shear_velocity=SHEAR_VELOCITY, velocity_seed=VELOCITY_SEED, cmdargs=None, timer=None):
+    """
+    Runs one pinning simulation on `comm` with outputs in MASTER_DATA_DIR/module_dir.
+
+    The defaults reproduce the module constants; sweep.py calls this once per
+    parameter set on a sub-communicator. Paths are relative to PROJECT_ROOT.
+    A stage timing report is written next to the log.
+    """
+    rank = comm.Get_rank()
+
+    # Runs after the first in a sweep start their own clock rather than counting from the imports
+    if timer is None:
+        timer = StageTimer(comm, 'simulate', start=time.perf_counter())
+
     if rank == 0:
         os.makedirs(MASTER_DATA_DIR, exist_ok=True)
-        os.makedirs(os.path.join(MASTER_DATA_DIR, MODULE_DIR), exist_ok=True)
+        os.makedirs(os.path.join(MASTER_DATA_DIR, module_dir), exist_ok=True)
 
-        dump_dir = os.path.join(MASTER_DATA_DIR, MODULE_DIR, DUMP_DIR)
-        output_dir = os.path.join(MASTER_DATA_DIR, MODULE_DIR, RESTART_DIR)
+        dump_dir = os.path.join(MASTER_DATA_DIR, module_dir, DUMP_DIR)
+        output_dir = os.path.join(MASTER_DATA_DIR, module_dir, RESTART_DIR)
 
         os.makedirs(dump_dir, exist_ok=True)
         os.makedirs(output_dir, exist_ok=True)
-
-        clear_dir(dump_dir)
-        clear_dir(output_dir)
+        os.makedirs(os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR), exist_ok=True)
+
+        trajectory_dir = os.path.join(MASTER_DATA_DIR, module_dir, TRAJECTORY_DIR)
+        if DUMP_FORMAT == 'binary':
+            os.makedirs(trajectory_dir, exist_ok=True)
+
+        restart_path, resume_step = latest_restart(output_dir) if RESUME else (None, None)
+
+        run_params = {
+            'input_file': os.path.join(INPUT_DIR, INPUT_FILE),
+            'potential_file': POTENTIAL_FILE,
+            'precipitate_radius': precipitate_radius,
+            'temperature': temperature,
+            'shear_velocity': shear_velocity,
+            'velocity_seed': velocity_seed,
+            'dt': DT,
+            'fixed_surface_depth': FIXED_SURFACE_DEPTH,
+        }
+        params_path = os.path.join(output_dir, RUN_PARAMS_FILE)
+
+        if restart_path is None:
+            clear_dir(dump_dir)
+            clear_dir(output_dir)
+            if DUMP_FORMAT == 'binary':
+                clear_dir(trajectory_dir)
+            with open(params_path, 'w') as f:
+                json.dump(run_params, f, indent=1)
+        else:
+            check_run_params(params_path, run_params)
+
+            # Frames after the restart step are written again by this run
+            remove_dumps_after(dump_dir, 'dumpfile_', resume_step)
+            print(f"Resuming from {restart_path} at step {resume_step}")
 
         input_filepath = os.path.join(MASTER_DATA_DIR, INPUT_DIR, INPUT_FILE)
 
-        dump_file = 'dumpfile_*'
+        dump_file = 'dumpfile_*' + DUMP_SUFFIXES[DUMP_COMPRESSION]
         restart_file = 'restart.*'
 
         restart_filepath = os.path.join(output_dir, restart_file)
         dump_filepath = os.path.join(dump_dir, dump_file)
 
+        if DUMP_PARTITIONS:
+            os.makedirs(os.path.join(dump_dir, PARTITION_DIR), exist_ok=True)
+            dump_filepath = os.path.join(dump_dir, PARTITION_DIR, 'dumpfile_*.p%' + DUMP_SUFFIXES[DUMP_COMPRESSION])
+        trajectory_filepath = os.path.join(trajectory_dir, BINARY_TRAJECTORY_FILE)
+
         potential_path = os.path.join(POTENTIAL_DIR, POTENTIAL_FILE)
 
     else:
         # For other ranks, initialize variables to None or empty strings
         dump_dir = None
         output_dir = None
+        restart_path = None
+        resume_step = None
         input_filepath = None
         restart_filepath = None
         dump_filepath = None
+        trajectory_filepath = None
         potential_path = None
 
     # Now broadcast all variables from rank 0 to all ranks
-    dump_dir = comm.bcast(dump_dir, root=0)
-    output_dir = comm.bcast(output_dir, root=0)
-    input_filepath = comm.bcast(input_filepath, root=0)
-    restart_filepath = comm.bcast(restart_filepath, root=0)
-    dump_filepath = comm.bcast(dump_filepath, root=0)
-    potential_path = comm.bcast(potential_path, root=0)
+    dump_dir = timer.bcast(dump_dir, root=0)
+    output_dir = timer.bcast(output_dir, root=0)
+    restart_path = timer.bcast(restart_path, root=0)
+    resume_step = timer.bcast(resume_step, root=0)
+    input_filepath = timer.bcast(input_filepath, root=0)
+    restart_filepath = timer.bcast(restart_filepath, root=0)
+    dump_filepath = timer.bcast(dump_filepath, root=0)
+    trajectory_filepath = timer.bcast(trajectory_filepath, root=0)
+    potential_path = timer.bcast(potential_path, root=0)
 
     #--- LAMMPS Script ---#
     #--- Settings ---#
-    lmp = lammps()
+    lmp = lammps(comm=comm, cmdargs=cmdargs)
     L = PyLammps(ptr=lmp)
 
-    L.log(os.path.join(MASTER_DATA_DIR, MODULE_DIR, 'log.lammps'))
+    if restart_path is None:
+        L.log(os.path.join(MASTER_DATA_DIR, module_dir, 'log.lammps'))
 
-    L.units('metal')
-    L.atom_style('atomic')
+        L.units('metal')
+        L.atom_style('atomic')
 
-    L.command('boundary p f p')
+        L.command('boundary p f p')
 
-    L.read_data(input_filepath)
+        with timer.stage('read'):
+            L.read_data(input_filepath)
+    else:
+        L.log(os.path.join(MASTER_DATA_DIR, module_dir, 'log.lammps'), 'append')
+
+        # Restores units, box, atoms, velocities, groups and the timestep
+        with timer.stage('read'):
+            L.read_restart(restart_path)
 
-    L.pair_style('eam/fs')
-    L.pair_coeff('*', '*', potential_path, 'Fe')
+    # eam/fs does not store its coefficients in restart files
+    with timer.stage('read'):
+        L.pair_style('eam/fs')
+        L.pair_coeff('*', '*', potential_path, 'Fe')
 
     #--- Get box bounds of the simulation ---#
     box_bounds = lmp.extract_box()
@@ -116,22 +266,24 @@ def main():
 
     sim_box_center = [np.mean([xmin, xmax]), np.mean([ymin, ymax]), np.mean([zmin, zmax])]
 
-    #--- Displace Atoms ---#
+    # Groups come from the restart file when resuming; redefining them from regions would pick up atoms that have moved since
+    if restart_path is None:
+        #--- Displace Atoms ---#
 
-    L.group('all', 'type', 1)
+        L.group('all', 'type', 1)
 
-    L.displace_atoms('all', 'move', PRECIPITATE_RADIUS+DISLOCATION_INITIAL_DISPLACEMENT, 0, 0, 'units', 'box')
+        L.displace_atoms('all', 'move', precipitate_radius+DISLOCATION_INITIAL_DISPLACEMENT, 0, 0, 'units', 'box')
 
-    #--- Defining Regions ---#
-    L.region('precipitate_reg', 'sphere', sim_box_center[0], sim_box_center[1], sim_box_center[2], PRECIPITATE_RADIUS)
-    L.region('top_surface_reg', 'block', 'INF', 'INF', (ymax-FIXED_SURFACE_DEPTH), 'INF', 'INF', 'INF')
-    L.region('bottom_surface_reg', 'block', 'INF', 'INF', 'INF', (ymin+FIXED_SURFACE_DEPTH), 'INF', 'INF')
+        #--- Defining Regions ---#
+        L.region('precipitate_reg', 'sphere', sim_box_center[0], sim_box_center[1], sim_box_center[2], precipitate_radius)
+        L.region('top_surface_reg', 'block', 'INF', 'INF', (ymax-FIXED_SURFACE_DEPTH), 'INF', 'INF', 'INF')
+        L.region('bottom_surface_reg', 'block', 'INF', 'INF', 'INF', (ymin+FIXED_SURFACE_DEPTH), 'INF', 'INF')
 
-    #--- Define Groups ---#
-    L.group('top_surface', 'region', 'top_surface_reg')
-    L.group('bottom_surface', 'region', 'bottom_surface_reg')
-    L.group('precipitate', 'region', 'precipitate_reg')
-    L.group('mobile_atoms', 'subtract', 'all', 'precipitate', 'top_surface', 'bottom_surface')
+        #--- Define Groups ---#
+        L.group('top_surface', 'region', 'top_surface_reg')
+        L.group('bottom_surface', 'region', 'bottom_surface_reg')
+        L.group('precipitate', 'region', 'precipitate_reg')
+        L.group('mobile_atoms', 'subtract', 'all', 'precipitate', 'top_surface', 'bottom_surface')
 
     #--- Define Computes ---#
     L.compute('peratom', 'all', 'pe/atom')
@@ -148,40 +300,234 @@ def main():
     L.compute('precipitate_velocity_z', 'precipitate', 'reduce', 'sum', 'vz')
 
     #--- Define Fixes and Velocities ---#
-    L.fix('1', 'all', 'nvt', 'temp', TEMPERATURE, TEMPERATURE, 100.0*DT)
-    
-    L.velocity('mobile_atoms', 'create', TEMPERATURE, 1234, 'mom', 'yes', 'rot', 'yes')
+    # Fixes are redefined with the same IDs so the thermostat state saved in a restart file is picked up again
+    L.fix('1', 'all', 'nvt', 'temp', temperature, temperature, 100.0*DT)
 
     # Define fixes and forces for the top and bottom surfaces
     L.fix('top_surface_freeze', 'top_surface', 'setforce', 0.0, 0.0, 0.0)
     L.fix('bottom_surface_freeze', 'bottom_surface', 'setforce', 0.0, 0.0, 0.0)
-    L.velocity('top_surface', 'set', -(SHEAR_VELOCITY/2), 0.0, 0.0)
-    L.velocity('bottom_surface', 'set', (SHEAR_VELOCITY/2), 0.0, 0.0)
 
     L.fix('precipitate_freeze', 'precipitate', 'setforce', 0.0, 0.0, 0.0)
-    L.velocity('precipitate', 'set', 0.0, 0.0, 0.0)
 
-    #--- Dump ID's for post-processing ---#
-    L.write_dump('precipitate', 'custom', os.path.join(MASTER_DATA_DIR, MODULE_DIR, 'precipitate_ID'), 'id')
+    # Velocities are part of the restart file
+    if restart_path is None:
+        L.velocity('mobile_atoms', 'create', temperature, velocity_seed, 'mom', 'yes', 'rot', 'yes')
+
+        L.velocity('top_surface', 'set', -(shear_velocity/2), 0.0, 0.0)
+        L.velocity('bottom_surface', 'set', (shear_velocity/2), 0.0, 0.0)
+        L.velocity('precipitate', 'set', 0.0, 0.0, 0.0)
+
+        #--- Dump ID's for post-processing ---#
+        L.write_dump('precipitate', 'custom', os.path.join(MASTER_DATA_DIR, module_dir, 'precipitate_ID'), 'id')
 
     #--- Thermo ---#
     L.thermo_style('custom', 'step', 'temp', 'pe', 'etotal', 'c_press_comp[1]', 'c_press_comp[2]', 'c_press_comp[3]', 'c_press_comp[4]', 'c_press_comp[5]', 'c_press_comp[6]')
     L.thermo(THERMO_FREQ)
 
-    #--- Dump Files ---#
-    L.dump('1', 'all', 'custom', DUMP_FREQ, dump_filepath, 'id', 'x', 'y', 'z', 'c_peratom', 'c_stress[4]')
+    #--- In-situ Analysis ---#
+    # Restart files are written by the registry, each after the in-situ outputs up to its step are on disk
+    registry = InsituRegistry(lmp, comm, resume_from=resume_step, restart_every=RESTART_FREQ, restart_path=restart_filepath)
+    register_hooks(L, registry, sim_box_center, precipitate_radius, module_dir)
+
+    if TIMESERIES_FREQ:
+        L.fix('precipitate_series', 'all', 'ave/time', 1, TIMESERIES_FREQ, TIMESERIES_FREQ, *TIMESERIES_VALUES.values())
+        registry.register(L, TimeSeriesHook(comm, TIMESERIES_FREQ, 'precipitate_series', list(TIMESERIES_VALUES),
+                                            os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR, TIMESERIES_FILE),
+                                            resume_from=resume_step))
 
-    #--- Restart Files ---#
-    L.restart(RESTART_FREQ, restart_filepath)
+    if STRESS_MAP_FREQ:
+        define_stress_map(L, os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR, STRESS_MAP_FILE), append=resume_step is not None)
 
-    L.run(RUN_TIME)
+    #--- Dump Files ---#
+    box_flags = ['pp' if p else 'ff' for p in lmp.extract_box()[5]]
+    dump_hook = None
+
+    # Each rank drops non-defect atoms before anything is gathered or written
+    select = defect_selection(DEFECT_DUMP_THRESHOLD) if DEFECT_DUMP else None
+
+    if DUMP_FORMAT == 'binary':
+        dump_hook = TrajectoryHook(comm, DUMP_FREQ, trajectory_filepath, box_flags,
+                                   ['c_peratom', 'c_stress[4]'], BINARY_FLOAT32_POSITIONS, resume_from=resume_step, select=select,
+                                   sort=SORT_DUMPS)
+    elif DUMP_COMPRESSION is not None:
+        L.dump('1', 'all', f"custom/{DUMP_COMPRESSION}", DUMP_FREQ, dump_filepath, 'id', 'x', 'y', 'z', 'c_peratom', 'c_stress[4]')
+        L.dump_modify('1', 'compression_level', DUMP_COMPRESSION_LEVEL)
+    else:
+        L.dump('1', 'all', 'custom', DUMP_FREQ, dump_filepath, 'id', 'x', 'y', 'z', 'c_peratom', 'c_stress[4]')
+
+    if dump_hook is None and DUMP_PARTITIONS:
+        # Each I/O group of ranks writes its own piece of every frame
+        L.dump_modify('1', 'nfile', min(DUMP_PARTITIONS, comm.Get_size()))
+
+    if dump_hook is None and SORT_DUMPS and not DUMP_PARTITIONS:
+        # Partitioned frames are written by several ranks at once and cannot be sorted as a whole
+        L.dump_modify('1', 'sort', 'id')
+
+    if dump_hook is None and DEFECT_DUMP:
+        # thresh cannot combine conditions, so the selection is one atom-style variable (1 for defect atoms)
+        L.variable('defect_atom', 'atom', f"c_peratom>{DEFECT_DUMP_THRESHOLD}||gmask(precipitate)")
+        L.dump_modify('1', 'thresh', 'v_defect_atom', '==', 1)
+
+    if dump_hook is None and ADAPTIVE_DUMP:
+        # The dump reads its next step from this variable, which the adaptive hook redefines when the mode changes.
+        # A variable interval writes nothing on the first step unless asked to, so step 0 is written as with DUMP_FREQ
+        L.variable('adaptive_dump_step', 'equal', dump_step_expression(ADAPTIVE_SPARSE_FREQ))
+        L.dump_modify('1', 'every', 'v_adaptive_dump_step', 'first', 'yes' if restart_path is None else 'no')
+
+    if ADAPTIVE_DUMP:
+        registry.register(L, AdaptiveDumpHook(ADAPTIVE_SPARSE_FREQ, ADAPTIVE_DENSE_FREQ, setforce_magnitude,
+                                              ADAPTIVE_FORCE_ON, ADAPTIVE_FORCE_OFF, output=dump_hook,
+                                              variable='adaptive_dump_step' if dump_hook is None else None,
+                                              output_path=os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR, DUMP_SCHEDULE_FILE)))
+    elif dump_hook is not None:
+        registry.register(L, dump_hook)
+
+    # Only the steps left after a restart are run. Dumps and restart files fall inside this stage; the timing
+    # breakdown at the end of log.lammps splits the dumps out as Output
+    with timer.stage('compute'):
+        registry.run(L, RUN_TIME, upto=True)
+
+    with timer.stage('export'):
+        registry.close()
 
     L.close()
 
+    if DUMP_PARTITIONS and comm.Get_rank() == 0:
+        with timer.stage('export'):
+            write_partition_stubs(dump_dir)
+
+    if DUMP_FORMAT == 'text' and comm.Get_rank() == 0:
+        with timer.stage('export'):
+            write_dump_index(dump_dir, os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR, DUMP_INDEX_FILE))
+
+    timer.barrier()
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, module_dir), 'simulate'))
+
     return None
 
 # --------------------------- UTILITIES ---------------------------#
 
+def register_hooks(L, registry, sim_box_center, precipitate_radius=PRECIPITATE_RADIUS, module_dir=MODULE_DIR):
+    """Registers the in-situ observables listed in INSITU_HOOKS, each journaled as it runs and saved to its own .npz."""
+    insitu_dir = os.path.join(MASTER_DATA_DIR, module_dir, INSITU_DIR)
+
+    for name in INSITU_HOOKS:
+        output_path = os.path.join(insitu_dir, f"{name}.npz")
+
+        if name == 'contact':
+            hook = PrecipitateContact(INSITU_FREQ, sim_box_center, precipitate_radius, CONTACT_SHELL, CORE_ENERGY_THRESHOLD, output_path=output_path)
+        elif name == 'dislocation_position':
+            hook = DislocationPosition(INSITU_FREQ, CORE_ENERGY_THRESHOLD, output_path=output_path)
+        elif name == 'energy_histogram':
+            hook = EnergyHistogram(INSITU_FREQ, ENERGY_BINS, group='mobile_atoms', output_path=output_path)
+        else:
+            raise ValueError(f"Unknown in-situ hook '{name}'")
+
+        registry.register(L, hook)
+
+def define_stress_map(L, output_path, append=False):
+    """
+    Bins STRESS_MAP_VALUES onto a STRESS_MAP_BIN grid in STRESS_MAP_DIMS with fix ave/chunk.
+
+    With `norm none` ave/chunk sums each value over the atoms of a bin, so
+    dividing the per-atom stress by the bin volume first gives the bin's
+    volume-averaged stress. Output is appended to when resuming.
+    """
+    bins = []
+    for dim in STRESS_MAP_DIMS:
+        bins += [dim, 'lower', STRESS_MAP_BIN]
+    L.compute('stress_bins', 'all', 'chunk/atom', f"bin/{len(STRESS_MAP_DIMS)}d", *bins, 'units', 'box')
+
+    # Bins span the whole box in the dimensions that are not binned
+    volume = '*'.join([str(STRESS_MAP_BIN)] * len(STRESS_MAP_DIMS) + [f"l{dim}" for dim in 'xyz' if dim not in STRESS_MAP_DIMS])
+
+    for name, value in STRESS_MAP_VALUES.items():
+        L.variable(f"stress_map_{name}", 'atom', f"{value}/({volume})")
+
+    L.fix('stress_map', 'all', 'ave/chunk', STRESS_MAP_EVERY, STRESS_MAP_FREQ // STRESS_MAP_EVERY, STRESS_MAP_FREQ, 'stress_bins',
+          *[f"v_stress_map_{name}" for name in STRESS_MAP_VALUES], 'norm', 'none', 'append' if append else 'file', output_path)
+
+def check_run_params(params_path, run_params):
+    """Raises if the restarts in a directory were written with other run parameters (or by an unrecorded run)."""
+    if not os.path.isfile(params_path):
+        raise ValueError(f"Cannot resume: {params_path} is missing, so the restarts cannot be matched to this run")
+
+    with open(params_path, 'r') as f:
+        saved = json.load(f)
+
+    changed = {name: (saved.get(name), value) for name, value in run_params.items() if saved.get(name) != value}
+    if changed:
+        details = ', '.join(f"{name} {old} -> {new}" for name, (old, new) in changed.items())
+        raise ValueError(f"Cannot resume: the restarts were written with different parameters ({details}); "
+                         f"clear {os.path.dirname(params_path)} or set RESUME = False")
+
+def latest_restart(restart_dir):
+    """
+    Returns (path, step) of the newest complete restart file, or (None, None).
+
+    A file counts as complete if it starts with the LAMMPS restart magic
+    string and is not much smaller than the largest restart in the directory.
+    A job killed while writing a restart leaves a truncated file behind.
+    """
+    restarts = {}
+    for filename in os.listdir(restart_dir):
+        step = file_step(filename, 'restart.')
+        path = os.path.join(restart_dir, filename)
+
+        if step is not None and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                if f.read(len(RESTART_MAGIC)) == RESTART_MAGIC:
+                    restarts[step] = path
+
+    if not restarts:
+        return None, None
+
+    full_size = max(os.path.getsize(path) for path in restarts.values())
+
+    for step in sorted(restarts, reverse=True):
+        if os.path.getsize(restarts[step]) >= RESTART_MIN_SIZE_FRACTION * full_size:
+            return restarts[step], step
+
+    return None, None
+
+def remove_dumps_after(dump_dir, prefix, step):
+    """Deletes the text dumps (and partition pieces) written after `step` by an earlier job."""
+    for directory in [dump_dir, os.path.join(dump_dir, PARTITION_DIR)]:
+        if not os.path.isdir(directory):
+            continue
+
+        for filename in os.listdir(directory):
+            dump_step = file_step(filename, prefix)
+            if dump_step is not None and dump_step > step:
+                os.remove(os.path.join(directory, filename))
+
+def write_partition_stubs(dump_dir, prefix='dumpfile_'):
+    """Writes one stub per frame in `dump_dir` listing the pieces LAMMPS wrote to PARTITION_DIR."""
+    frames = {}
+    for filename in os.listdir(os.path.join(dump_dir, PARTITION_DIR)):
+        match = re.fullmatch(rf'{re.escape(prefix)}(\d+)\.p(\d+)', strip_compression(filename))
+        if match:
+            frames.setdefault(int(match.group(1)), []).append((int(match.group(2)), filename))
+
+    for step, pieces in frames.items():
+        write_partition_stub(os.path.join(dump_dir, f"{prefix}{step}"),
+                             [os.path.join(PARTITION_DIR, filename) for _, filename in sorted(pieces)])
+
+def write_dump_index(dump_dir, output_path, prefix='dumpfile_'):
+    """Saves the file name, timestep and atom count of every frame in `dump_dir`, in timestep order."""
+    frames = sorted((step, filename) for filename in os.listdir(dump_dir)
+                    if (step := file_step(filename, prefix)) is not None and os.path.isfile(os.path.join(dump_dir, filename)))
+
+    filenames = [filename for _, filename in frames]
+    index = index_dumps([os.path.join(dump_dir, filename) for filename in filenames])
+
+    np.savez(output_path, filename=np.array(filenames), timestep=index['timestep'], n_atoms=index['n_atoms'])
+
+def file_step(filename, prefix):
+    """Timestep in a `<prefix><step>` filename, optionally a compressed or partition piece; None for other files."""
+    match = re.fullmatch(rf'{re.escape(prefix)}(\d+)(?:\.p\d+)?', strip_compression(filename))
+    return int(match.group(1)) if match else None
+
 # --------------------------- ENTRY POINT ---------------------------#
 
 if __name__ == "__main__":
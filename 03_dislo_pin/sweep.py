@@ -0,0 +1,124 @@
+# --------------------------- LIBRARIES ---------------------------#
+import itertools
+import os
+from mpi4py import MPI
+
+# Imported before LAMMPS so the time spent importing it is reported
+from instrumentation import StageTimer, report_path
+
+from scheduler import run_task_queue
+from utilities import set_path
+
+from .simulate import run_simulation, PROJECT_ROOT, MASTER_DATA_DIR, MODULE_DIR
+
+# --------------------------- CONFIG ---------------------------#
+
+SWEEP_DIR = 'sweep' # Inside MASTER_DATA_DIR/03_dislo_pin, one subdirectory per parameter set
+
+RANKS_PER_RUN = 16 # Size of each partition; leftover ranks form one smaller partition
+
+# Every combination of these values is simulated; the keys are run_simulation arguments
+SWEEP = {
+    'precipitate_radius': [20, 30, 40],
+    'temperature': [100, 300],
+    'shear_velocity': [1],
+    'velocity_seed': [1234, 5678],
+}
+
+TIMING_HISTORY_FILE = 'sweep_timing_history.json'
+
+# Short labels used to name each run's output directory
+LABELS = {'precipitate_radius': 'R', 'temperature': 'T', 'shear_velocity': 'V', 'velocity_seed': 'S'}
+
+# --------------------------- SWEEP ---------------------------#
+
+def main():
+    #--- INITIALISE MPI ---#
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    set_path(PROJECT_ROOT)
+
+    # Sweep-wide totals; each run also writes its own stage report next to its log
+    timer = StageTimer(comm, 'sweep')
+
+    configs = build_configs(SWEEP)
+    names = [config_name(config) for config in configs]
+
+    history_path = os.path.join(MASTER_DATA_DIR, MODULE_DIR, SWEEP_DIR, TIMING_HISTORY_FILE)
+
+    if rank == 0:
+        os.makedirs(os.path.join(MASTER_DATA_DIR, MODULE_DIR, SWEEP_DIR), exist_ok=True)
+        print(f"Sweeping {len(configs)} parameter sets on {size} ranks, {RANKS_PER_RUN} ranks per run.\n")
+
+    #--- SPLIT INTO PARTITIONS ---#
+    # Rank 0 dispatches; the other ranks form partitions of RANKS_PER_RUN, each running one LAMMPS instance
+    if size == 1:
+        partition = MPI.COMM_SELF
+    else:
+        color = MPI.UNDEFINED if rank == 0 else (rank - 1) // RANKS_PER_RUN
+        partition = comm.Split(color, key=rank)
+
+    is_leader = size == 1 or (rank != 0 and partition.Get_rank() == 0)
+
+    # Only the dispatcher and one leader per partition take part in the queue
+    queue = comm.Split(0 if rank == 0 or is_leader else MPI.UNDEFINED, key=rank)
+
+    def run_chunk(chunk):
+        with timer.stage('bcast'):
+            partition.bcast(chunk, root=0)
+        with timer.stage('compute'):
+            run_configs(partition, configs, names, chunk)
+
+    #--- RUN ---#
+    if queue != MPI.COMM_NULL:
+        run_task_queue(queue, names, run_chunk, history_path=history_path, timer=timer)
+
+        # Release the rest of the partition
+        if is_leader and size > 1:
+            with timer.stage('bcast'):
+                partition.bcast(None, root=0)
+    else:
+        while True:
+            # Waiting here for the leader to be handed a chunk
+            with timer.stage('wait'):
+                chunk = partition.bcast(None, root=0)
+            if chunk is None:
+                break
+            with timer.stage('compute'):
+                run_configs(partition, configs, names, chunk)
+
+    timer.barrier()
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR, SWEEP_DIR), 'sweep'))
+
+    return None
+
+# --------------------------- UTILITIES ---------------------------#
+
+def run_configs(partition, configs, names, chunk):
+    """Runs the named parameter sets one after another on one partition."""
+    for name in chunk:
+        config = configs[names.index(name)]
+
+        if partition.Get_rank() == 0:
+            print(f"Partition of {partition.Get_size()} ranks starting {name}")
+
+        # Each instance logs to its own directory (set by run_simulation); no default log.lammps, which every
+        # partition would truncate at once, and no screen output, which would interleave between partitions
+        run_simulation(partition, module_dir=os.path.join(MODULE_DIR, SWEEP_DIR, name), cmdargs=['-screen', 'none', '-log', 'none'], **config)
+
+def build_configs(sweep):
+    """Returns every combination of the sweep values as a list of keyword dicts."""
+    keys = list(sweep)
+    return [dict(zip(keys, values)) for values in itertools.product(*(sweep[key] for key in keys))]
+
+def config_name(config):
+    """Directory name for one parameter set, e.g. 'R30_T100_V1_S1234'."""
+    return '_'.join(f"{LABELS.get(key, key)}{value}" for key, value in config.items())
+
+# --------------------------- ENTRY POINT ---------------------------#
+
+if __name__ == "__main__":
+
+        main()
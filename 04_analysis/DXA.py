@@ -1,12 +1,28 @@
 # --------------------------- LIBRARIES ---------------------------#
 import os
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from mpi4py import MPI
 
-from ovito.io import import_file, export_file
+# Imported before OVITO so the time spent importing it is reported
+from instrumentation import StageTimer, report_path
+
+# Cores given to each rank: a node can run fewer ranks with more threads each, e.g. srun --cpus-per-task=4.
+# OVITO sizes its own thread pool from OVITO_THREAD_COUNT when it is first imported
+THREADS_PER_RANK = int(os.environ.get('SLURM_CPUS_PER_TASK', os.environ.get('OMP_NUM_THREADS', 1)))
+os.environ.setdefault('OVITO_THREAD_COUNT', str(THREADS_PER_RANK))
+
+from ovito.io import export_file
 from ovito.modifiers import DislocationAnalysisModifier
 
-from utilities import set_path, clear_dir
+from dislocation_db import build_database
+from dump_reader import read_dump, read_header
+from manifest import Manifest, MANIFEST_FILE
+from ovito_bridge import frame_to_data, static_pipeline
+from scheduler import run_task_queue
+from utilities import set_path
 
 # --------------------------- CONFIG ---------------------------#
 
@@ -22,6 +38,26 @@ INPUT_FILE = 'dumpfile_*'
 OUTPUT_LINES_DIR = 'DXA_lines_files'
 OUTPUT_ATOMS_DIR = 'DXA_atoms_files'
 
+TIMING_HISTORY_FILE = 'DXA_timing_history.json'
+
+# Memory a rank may use for frames in flight; defaults to the SLURM allocation for its cores
+MEMORY_LIMIT_BYTES = int(os.environ.get('SLURM_MEM_PER_CPU', 2048)) * 1024**2 * THREADS_PER_RANK
+BYTES_PER_ATOM = 2048 # Peak DXA working set per atom, including the exported copies; check against the job's memory use
+
+# Only analyse the frames listed by track_dislocation.py instead of every dump
+USE_FRAME_SELECTION = False
+FRAME_SELECTION_FILE = 'DXA_frame_selection.txt' # Inside MASTER_DATA_DIR/MODULE_DIR
+
+# Every frame's lines collected into one indexed file (see dislocation_db.py), rebuilt after each run
+DISLOCATION_DB_FILE = 'dislocation_lines.npz'
+
+# Changing any of these invalidates every frame recorded in the manifest
+MANIFEST_PARAMS = {
+    'analysis': 'DXA',
+    'input_crystal_structure': 'BCC',
+    'atoms_columns': ["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom", "c_csym", "Cluster"],
+}
+
 # --------------------------- ANALYSIS ---------------------------#
 
 def main():
@@ -32,8 +68,15 @@ def main():
 
     set_path(PROJECT_ROOT)
 
+    timer = StageTimer(comm, 'DXA')
+
+    # Kept with the line files; only frames that are new or out of date are reprocessed
+    manifest = Manifest(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR), MANIFEST_PARAMS, rank)
+
     #--- INITIALISE VARIABLE ON ALL RANKS ---#
     dump_files = None
+    input_paths = None
+    history_path = None
 
     #--- CREATE AND SET DIRECTORIES ---#
     if rank == 0:
@@ -47,10 +90,18 @@ def main():
         os.makedirs(output_lines_dir, exist_ok=True)
         os.makedirs(output_atoms_dir, exist_ok=True)
 
-        clear_dir(output_lines_dir)
-        clear_dir(output_atoms_dir)
+        with timer.stage('read'):
+            all_files = get_filenames(input_dir)
+            if USE_FRAME_SELECTION:
+                all_files = selected_frames(all_files)
+            dump_files = manifest.pending(all_files,
+                                          [[os.path.join(input_dir, dump_file)] for dump_file in all_files],
+                                          [output_paths(dump_file) for dump_file in all_files])
+
+        print(f"{len(all_files) - len(dump_files)} of {len(all_files)} frames up to date, processing {len(dump_files)}")
 
-        dump_files = get_filenames(input_dir)
+        input_paths = [os.path.join(input_dir, dump_file) for dump_file in dump_files]
+        history_path = os.path.join(MASTER_DATA_DIR, MODULE_DIR, TIMING_HISTORY_FILE)
 
     else:
         # For other ranks, initialize variables to None or empty strings
@@ -61,43 +112,102 @@ def main():
         dump_filepath = None
 
     #--- BROADCAST AND DISTRIBUTE WORK ---#
-    dump_files = comm.bcast(dump_files, root=0)
+    dump_files = timer.bcast(dump_files, root=0)
 
-    # Each rank gets only its share of files to process
-    start, end = split_indexes(len(dump_files), rank, size)
+    #--- PROCESS FILES ---#
+    # Rank 0 hands out chunks of frames on demand; costlier frames go out in smaller chunks
+    run_task_queue(comm, dump_files, lambda chunk: process_file(chunk, timer, manifest), paths=input_paths,
+                   history_path=history_path, timer=timer)
 
-    print(f"Rank {rank} of size {size} processing files from {start} to {end}")
+    if rank == 0:
+        with timer.stage('export'):
+            manifest.consolidate()
 
-    #--- PROCESS FILES ---#
-    process_file(dump_files[start:end])
+            lines_dir = os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR)
+            ca_paths = [os.path.join(lines_dir, ca_file) for ca_file in get_filenames(lines_dir) if ca_file != MANIFEST_FILE]
+            build_database(ca_paths, os.path.join(MASTER_DATA_DIR, MODULE_DIR, DISLOCATION_DB_FILE))
+
+    timer.barrier()
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR), 'DXA'))
                 
     return None
 
 # --------------------------- UTILITIES ---------------------------#
 
-def process_file(dump_chunk):
+def process_file(dump_chunk, timer, manifest=None):
+    """
+    Runs DXA on each frame of the chunk with at most `frame_slots` frames in memory.
 
+    Frames are parsed by dump_reader on the rank's thread pool ahead of the
+    DXA. OVITO is not documented as thread-safe, so every OVITO call (the
+    conversion to a DataCollection, the DXA and the exports) stays on the
+    main thread. A slot is taken before a frame is read and given back once
+    its exports are written, after which nothing refers to the frame.
+    """
     input_paths = [os.path.join(MASTER_DATA_DIR, INPUT_DIR, dump_file) for dump_file in dump_chunk]
     output_atoms_path = [os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_ATOMS_DIR, dump_file) for dump_file in dump_chunk]
     output_lines_path = [os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR, dump_file) for dump_file in dump_chunk]
 
-    pipeline = import_file(input_paths)
-
     DXA_modifier = DislocationAnalysisModifier()
     DXA_modifier.input_crystal_structure = DislocationAnalysisModifier.Lattice.BCC
 
-    # Add the time-averaging modifier:
-    pipeline.modifiers.append(DXA_modifier)
+    # Frames are fed in one at a time, whatever their format (plain, compressed or partitioned)
+    pipeline = static_pipeline([DXA_modifier])
 
-    for frame in range(pipeline.num_frames):
-        data = pipeline.compute(frame)
+    slots = threading.Semaphore(frame_slots(input_paths[0]))
 
-        export_file(pipeline, output_lines_path[frame], "ca")
-        
-        export_file(data, output_atoms_path[frame], "lammps/dump",
-            columns=["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom", "c_csym", "Cluster"])
-        
-        print(f"Successfully processed frame {frame}...")
+    with ThreadPoolExecutor(max_workers=THREADS_PER_RANK) as pool:
+
+        def read(index):
+            # Parallelism comes from the pool, so each frame is parsed on one thread
+            return read_dump(input_paths[index], n_threads=1)
+
+        reads = deque()
+        next_read = 0
+
+        for frame in range(len(input_paths)):
+            # Read ahead while slots are free; the current frame waits for one
+            with timer.stage('wait'):
+                while next_read < len(input_paths) and slots.acquire(blocking=next_read == frame):
+                    reads.append(pool.submit(read, next_read))
+                    next_read += 1
+
+            try:
+                with timer.stage('read'):
+                    data = frame_to_data(reads.popleft().result())
+
+                with timer.stage('compute'):
+                    pipeline.source.data = data
+                    data = pipeline.compute()
+                    pipeline.source.data = None
+
+                with timer.stage('export'):
+                    export_file(data, output_lines_path[frame], "ca")
+                    export_file(data, output_atoms_path[frame], "lammps/dump", columns=MANIFEST_PARAMS['atoms_columns'])
+                del data
+            finally:
+                slots.release()
+
+            if manifest is not None:
+                manifest.record(dump_chunk[frame], [input_paths[frame]], output_paths(dump_chunk[frame]))
+
+            print(f"Successfully processed frame {frame}...")
+
+def frame_slots(path):
+    """Frames a rank may hold at once (being read, analysed or exported) within MEMORY_LIMIT_BYTES."""
+    frame_bytes = read_header(path)['n_atoms'] * BYTES_PER_ATOM
+    return max(1, int(MEMORY_LIMIT_BYTES // max(frame_bytes, 1)))
+
+def selected_frames(dump_files):
+    """The dump files listed in the frame selection file, in their original order."""
+    with open(os.path.join(MASTER_DATA_DIR, MODULE_DIR, FRAME_SELECTION_FILE), 'r') as f:
+        selection = set(line.strip() for line in f if line.strip())
+    return [dump_file for dump_file in dump_files if dump_file in selection]
+
+def output_paths(dump_file):
+    """Files written for one input frame: the CA line file and the atoms dump."""
+    return [os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR, dump_file),
+            os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_ATOMS_DIR, dump_file)]
 
 def view_information(data):
     
@@ -120,20 +230,6 @@ def natural_sort_key(s):
     # Split the string into digit and non-digit parts, convert digits to int
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
 
-def split_indexes(n_files, rank, size):
-    """Split n_files into contiguous chunks of indexes for each rank."""
-    chunk_size = n_files // size
-    remainder = n_files % size
-
-    if rank < remainder:
-        start = rank * (chunk_size + 1)
-        end = start + chunk_size + 1
-    else:
-        start = rank * chunk_size + remainder
-        end = start + chunk_size
-
-    return [start, end]
-
 # --------------------------- ENTRY POINT ---------------------------#
 
 if __name__ == "__main__":
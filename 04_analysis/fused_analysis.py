@@ -0,0 +1,367 @@
+# --------------------------- LIBRARIES ---------------------------#
+import os
+import re
+from collections import deque
+from mpi4py import MPI
+import numpy as np
+
+# Imported before OVITO so the time spent importing it is reported
+from instrumentation import StageTimer, report_path
+
+from ovito.io import export_file
+from ovito.modifiers import DislocationAnalysisModifier
+
+from dump_reader import prefetch_dumps, write_dump, DumpFrame
+from id_alignment import IDAlignment
+from manifest import Manifest, file_identity
+from ovito_bridge import frame_to_data, static_pipeline
+from precipitate_index import share_precipitate_table, select_precipitate
+from rolling import RollingMean
+from scheduler import run_task_queue
+from utilities import set_path
+from ws_occupancy import share_site_index, CELL_SIZE, point_defects
+
+# --------------------------- CONFIG ---------------------------#
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, '..'))
+
+MASTER_DATA_DIR = '000_output_files'
+MODULE_DIR = '04_analysis'
+
+INPUT_DIR = '03_dislo_pin/dump_files'
+PRECIPITATE_ID_FILE = '03_dislo_pin/precipitate_ID'
+REFERENCE_FILE = '02_minimize_dislo/min_dump/straight_edge_dislo_dump'
+
+# Stages applied to every frame, in order: 'dxa', 'wigner_seitz', 'threshold', 'rolling_average'
+STAGES = ['dxa', 'wigner_seitz', 'threshold', 'rolling_average']
+
+OUTPUT_LINES_DIR = 'DXA_lines_files'
+OUTPUT_ATOMS_DIR = 'DXA_atoms_files'
+OUTPUT_POINT_DEFECT_DIR = 'WS_point_defect_files'
+OUTPUT_THRESHOLD_DIR = 'peratom_threshold_files'
+OUTPUT_AVERAGE_DIR = 'time_averaged_files'
+
+PERATOM_THRESHOLD = -4.0
+AVERAGE_WINDOW = 5
+AVERAGE_COLUMNS = ['c_peratom']
+
+TIMING_HISTORY_FILE = 'fused_timing_history.json'
+
+# --------------------------- ANALYSIS ---------------------------#
+
+def main():
+    #--- INITIALISE MPI ---#
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    set_path(PROJECT_ROOT)
+
+    timer = StageTimer(comm, 'fused_analysis')
+
+    #--- INITIALISE VARIABLE ON ALL RANKS ---#
+    dump_files = None
+    pending_files = None
+    input_paths = None
+    manifest_params = None
+
+    input_dir = os.path.join(MASTER_DATA_DIR, INPUT_DIR)
+    history_path = os.path.join(MASTER_DATA_DIR, MODULE_DIR, TIMING_HISTORY_FILE)
+    manifest_dir = os.path.join(MASTER_DATA_DIR, MODULE_DIR)
+
+    #--- CREATE AND SET DIRECTORIES ---#
+    if rank == 0:
+        os.makedirs(os.path.join(MASTER_DATA_DIR, MODULE_DIR), exist_ok=True)
+
+        for output_dir in output_dirs(STAGES):
+            os.makedirs(output_dir, exist_ok=True)
+
+        manifest_params = build_manifest_params(STAGES)
+        manifest = Manifest(manifest_dir, manifest_params, rank)
+
+        with timer.stage('read'):
+            dump_files = get_filenames(input_dir)
+            pending_files = manifest.pending(dump_files,
+                                             [frame_inputs(dump_files, index) for index in range(len(dump_files))],
+                                             [frame_outputs(dump_files, index) for index in range(len(dump_files))])
+        input_paths = [os.path.join(input_dir, dump_file) for dump_file in pending_files]
+
+        print(f"Found {len(dump_files)} dump files ({len(dump_files) - len(pending_files)} up to date), running stages: {', '.join(STAGES)}")
+
+    #--- BROADCAST AND DISTRIBUTE WORK ---#
+    dump_files = timer.bcast(dump_files, root=0)
+    pending_files = timer.bcast(pending_files, root=0)
+    manifest_params = timer.bcast(manifest_params, root=0)
+
+    manifest = Manifest(manifest_dir, manifest_params, rank)
+
+    with timer.stage('read'):
+        stages = build_stages(comm, STAGES)
+    columns = sorted(set().union(*(stage.columns for stage in stages)))
+    halo = max(stage.halo for stage in stages)
+
+    file_index = {dump_file: index for index, dump_file in enumerate(dump_files)}
+
+    def process_chunk(chunk):
+        chunk_indexes = {file_index[dump_file] for dump_file in chunk}
+
+        # Frames after each chunk frame are read only for stages that look ahead (rolling average)
+        read_indexes = sorted({i for index in chunk_indexes for i in range(index, min(index + halo, len(dump_files) - 1) + 1)})
+
+        # Frames are read and decompressed ahead on a background thread while the stages run
+        frames = prefetch_dumps([os.path.join(input_dir, dump_files[index]) for index in read_indexes], columns=columns)
+
+        for index in read_indexes:
+            with timer.stage('read'):
+                frame = next(frames)
+
+            context = FrameContext(index, dump_files[index], frame, in_chunk=index in chunk_indexes)
+
+            # Stages write their own outputs, so their export time is counted as compute
+            with timer.stage('compute'):
+                for stage in stages:
+                    if context.in_chunk or stage.halo:
+                        stage.process(context)
+
+            print(f"Rank {rank} processed frame {index}...")
+
+        for stage in stages:
+            stage.end_chunk()
+
+        for index in sorted(chunk_indexes):
+            manifest.record(dump_files[index], frame_inputs(dump_files, index), frame_outputs(dump_files, index))
+
+    #--- PROCESS FILES ---#
+    run_task_queue(comm, pending_files, process_chunk, paths=input_paths, history_path=history_path, timer=timer)
+
+    timer.barrier()
+    free_shared_windows(stages)
+
+    if rank == 0:
+        with timer.stage('export'):
+            manifest.consolidate()
+
+    timer.report(report_path(manifest_dir, 'fused_analysis'))
+
+    return None
+
+# --------------------------- STAGES ---------------------------#
+
+class FrameContext:
+    """One frame as seen by the stages; the OVITO DataCollection is built once on first use."""
+
+    def __init__(self, index, dump_file, frame, in_chunk=True):
+        self.index = index
+        self.dump_file = dump_file
+        self.frame = frame
+        self.in_chunk = in_chunk
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = frame_to_data(self.frame)
+        return self._data
+
+class DXAStage:
+    columns = {'id', 'x', 'y', 'z', 'c_peratom'}
+    halo = 0
+    shared_windows = ()
+
+    def __init__(self):
+        DXA_modifier = DislocationAnalysisModifier()
+        DXA_modifier.input_crystal_structure = DislocationAnalysisModifier.Lattice.BCC
+
+        self.pipeline = static_pipeline([DXA_modifier])
+
+    def process(self, context):
+        self.pipeline.source.data = context.data
+        data = self.pipeline.compute()
+
+        export_file(data, os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR, context.dump_file), "ca")
+
+        export_file(data, os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_ATOMS_DIR, context.dump_file), "lammps/dump",
+            columns=["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom", "Cluster"])
+
+    def end_chunk(self):
+        pass
+
+class WignerSeitzStage:
+    columns = {'x', 'y', 'z'}
+    halo = 0
+
+    def __init__(self, site_index, reference_columns, windows):
+        self.site_index = site_index
+        self.reference_columns = reference_columns
+        # Back the shared site index and reference columns for as long as the index is used
+        self.shared_windows = tuple(windows)
+
+    def process(self, context):
+        frame = context.frame
+        defects = point_defects(self.site_index, self.reference_columns, frame)
+
+        write_dump(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_POINT_DEFECT_DIR, context.dump_file),
+                   DumpFrame(frame.timestep, frame.box_bounds, frame.box_flags, defects))
+
+    def end_chunk(self):
+        pass
+
+class ThresholdStage:
+    columns = {'id', 'x', 'y', 'z', 'c_peratom'}
+    halo = 0
+
+    def __init__(self, precipitate_table, window):
+        self.precipitate_table = precipitate_table
+        # Backs the shared table; freed by free_shared_windows once every frame is done
+        self.shared_windows = (window,)
+
+    def process(self, context):
+        atoms = context.frame.atoms
+        selection = select_precipitate(self.precipitate_table, atoms['id']) | (atoms['c_peratom'] > PERATOM_THRESHOLD)
+
+        frame = DumpFrame(context.frame.timestep, context.frame.box_bounds, context.frame.box_flags, atoms[selection])
+        write_dump(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_THRESHOLD_DIR, context.dump_file), frame,
+                   columns=['id', 'x', 'y', 'z', 'c_peratom'])
+
+    def end_chunk(self):
+        pass
+
+class RollingAverageStage:
+    """
+    Rolling mean of AVERAGE_COLUMNS over AVERAGE_WINDOW consecutive frames.
+
+    As in time_average.py, each output holds the last frame of a window with
+    the window averages and is named after the window's first file.
+    """
+
+    columns = {'id', 'x', 'y', 'z', *AVERAGE_COLUMNS}
+    halo = AVERAGE_WINDOW - 1
+    shared_windows = ()
+
+    def __init__(self):
+        self.rolling = RollingMean(AVERAGE_WINDOW, AVERAGE_COLUMNS)
+        self.alignment = IDAlignment()
+        self.window = deque(maxlen=AVERAGE_WINDOW)
+
+    def process(self, context):
+        # Pending frames need not be consecutive; a gap restarts the window
+        if self.window and self.window[-1].index != context.index - 1:
+            self.end_chunk()
+
+        atoms = self.alignment.align(context.frame.atoms)
+        self.rolling.push(atoms)
+        self.window.append(context)
+
+        first = self.window[0]
+        if not self.rolling.full or not first.in_chunk:
+            return
+
+        columns = ['id', 'x', 'y', 'z']
+        for name in AVERAGE_COLUMNS:
+            columns += [name, f"{name}_average"]
+
+        output = np.empty(len(atoms), dtype=[(name, np.int64 if name == 'id' else np.float64) for name in columns])
+        for name in ['id', 'x', 'y', 'z'] + AVERAGE_COLUMNS:
+            output[name] = atoms[name]
+        for name in AVERAGE_COLUMNS:
+            output[f"{name}_average"] = self.rolling.mean(name)
+
+        frame = DumpFrame(context.frame.timestep, context.frame.box_bounds, context.frame.box_flags, output)
+        write_dump(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_AVERAGE_DIR, first.dump_file), frame)
+
+    def end_chunk(self):
+        self.rolling.reset()
+        self.window.clear()
+
+# --------------------------- UTILITIES ---------------------------#
+
+def build_stages(comm, names):
+    """Instantiates the configured stages; collective because the reference and threshold tables are shared."""
+    stages = []
+
+    for name in names:
+        if name == 'dxa':
+            stages.append(DXAStage())
+        elif name == 'wigner_seitz':
+            site_index, reference_columns, windows = share_site_index(comm, os.path.join(MASTER_DATA_DIR, REFERENCE_FILE))
+            stages.append(WignerSeitzStage(site_index, reference_columns, windows))
+        elif name == 'threshold':
+            precipitate_table, window = share_precipitate_table(comm, os.path.join(MASTER_DATA_DIR, PRECIPITATE_ID_FILE))
+            stages.append(ThresholdStage(precipitate_table, window))
+        elif name == 'rolling_average':
+            stages.append(RollingAverageStage())
+        else:
+            raise ValueError(f"Unknown analysis stage '{name}'")
+
+    return stages
+
+def free_shared_windows(stages):
+    """Frees the shared-memory windows behind the stages' tables; collective, and only once no frame is left."""
+    for stage in stages:
+        for window in stage.shared_windows:
+            window.Free()
+        stage.shared_windows = ()
+
+def build_manifest_params(names):
+    """Parameters recorded in the manifest; changing any of them invalidates every frame."""
+    params = {'stages': list(names)}
+
+    if 'wigner_seitz' in names:
+        params['reference_identity'] = file_identity(os.path.join(MASTER_DATA_DIR, REFERENCE_FILE))
+        params['ws_cell_size'] = CELL_SIZE
+    if 'threshold' in names:
+        params['PERATOM_THRESHOLD'] = PERATOM_THRESHOLD
+        params['precipitate_identity'] = file_identity(os.path.join(MASTER_DATA_DIR, PRECIPITATE_ID_FILE))
+    if 'rolling_average' in names:
+        params['AVERAGE_WINDOW'] = AVERAGE_WINDOW
+        params['AVERAGE_COLUMNS'] = AVERAGE_COLUMNS
+
+    return params
+
+def frame_inputs(dump_files, index):
+    """Input files whose contents the outputs of frame `index` depend on."""
+    last = index + (AVERAGE_WINDOW - 1 if 'rolling_average' in STAGES else 0)
+    return [os.path.join(MASTER_DATA_DIR, INPUT_DIR, dump_file) for dump_file in dump_files[index:last + 1]]
+
+def frame_outputs(dump_files, index):
+    """Files the configured stages write for frame `index`."""
+    dump_file = dump_files[index]
+    outputs = []
+
+    if 'dxa' in STAGES:
+        outputs += [os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_LINES_DIR, dump_file),
+                    os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_ATOMS_DIR, dump_file)]
+    if 'wigner_seitz' in STAGES:
+        outputs.append(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_POINT_DEFECT_DIR, dump_file))
+    if 'threshold' in STAGES:
+        outputs.append(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_THRESHOLD_DIR, dump_file))
+    if 'rolling_average' in STAGES and index + AVERAGE_WINDOW <= len(dump_files):
+        outputs.append(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_AVERAGE_DIR, dump_file))
+
+    return outputs
+
+def output_dirs(names):
+    """Returns the output directories written by the configured stages."""
+    stage_dirs = {
+        'dxa': [OUTPUT_LINES_DIR, OUTPUT_ATOMS_DIR],
+        'wigner_seitz': [OUTPUT_POINT_DEFECT_DIR],
+        'threshold': [OUTPUT_THRESHOLD_DIR],
+        'rolling_average': [OUTPUT_AVERAGE_DIR],
+    }
+    return [os.path.join(MASTER_DATA_DIR, MODULE_DIR, d) for name in names for d in stage_dirs[name]]
+
+def get_filenames(dir_path):
+    """Returns a naturally sorted list of filenames (not paths) in the given directory."""
+    files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
+    return sorted(files, key=natural_sort_key)
+
+def natural_sort_key(s):
+    # Split the string into digit and non-digit parts, convert digits to int
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+# --------------------------- ENTRY POINT ---------------------------#
+
+if __name__ == "__main__":
+
+        main()
@@ -3,10 +3,12 @@ import shutil
 import numpy as np
 from mpi4py import MPI
 
-from ovito.io import import_file, export_file
-from ovito.modifiers import DeleteSelectedModifier, InvertSelectionModifier
-
-from utilities import set_path, clear_dir
+from instrumentation import StageTimer, report_path
+from dump_reader import iter_dump, iter_partitions, is_partitioned, write_dump, DumpFrame
+from manifest import Manifest, file_identity
+from precipitate_index import share_precipitate_table, select_precipitate
+from scheduler import run_task_queue
+from utilities import set_path
 
 # --------------------------- CONFIG ---------------------------
 INPUT_DIR = '../03_dislo_pin/dump_files'
@@ -16,6 +18,10 @@ OUTPUT_DIR = 'peratom_threshold_files'
 
 PERATOM_THRESHOLD = -4.0
 
+OUTPUT_COLUMNS = ['id', 'x', 'y', 'z', 'c_peratom']
+
+TIMING_HISTORY_FILE = 'threshold_timing_history.json'
+
 # -------------------------------------------------------------
 
 def main():
@@ -25,87 +31,111 @@ def main():
 
     set_path()
 
+    timer = StageTimer(comm, 'per_atom_threshold')
+
     if rank == 0:
         os.makedirs(OUTPUT_DIR, exist_ok=True)
-        clear_dir(OUTPUT_DIR)
-        precipitate_ids = load_precipitate_ids(PRECIPITATE_ID_FILE)
+
+        # A new threshold or precipitate definition invalidates every recorded file
+        manifest_params = {
+            'analysis': 'peratom_threshold',
+            'PERATOM_THRESHOLD': PERATOM_THRESHOLD,
+            'columns': OUTPUT_COLUMNS,
+            'precipitate_identity': file_identity(PRECIPITATE_ID_FILE),
+        }
+        manifest = Manifest(OUTPUT_DIR, manifest_params, rank)
         
-        dump_files = sorted([
-            f for f in os.listdir(INPUT_DIR)
-            if os.path.isfile(os.path.join(INPUT_DIR, f))
-        ])
+        with timer.stage('read'):
+            all_files = sorted([
+                f for f in os.listdir(INPUT_DIR)
+                if os.path.isfile(os.path.join(INPUT_DIR, f))
+            ])
+            dump_files = manifest.pending(all_files,
+                                          [[os.path.join(INPUT_DIR, f)] for f in all_files],
+                                          [[os.path.join(OUTPUT_DIR, f)] for f in all_files])
+        input_paths = [os.path.join(INPUT_DIR, f) for f in dump_files]
+
+        print(f"{len(all_files) - len(dump_files)} of {len(all_files)} files up to date.")
     else:
-        precipitate_ids = None
+        manifest_params = None
         dump_files = None
+        input_paths = None
 
     # Broadcast data
-    precipitate_ids = comm.bcast(precipitate_ids, root=0)
-    dump_files = comm.bcast(dump_files, root=0)
-
-    # Each rank handles its portion of the files
-    for i, dump_file in enumerate(dump_files):
-        if i % size == rank:
-            print(f"Rank {rank}: Processing file {dump_file} ({i+1}/{len(dump_files)})")
-            process_dump_file(dump_file, precipitate_ids)
+    dump_files = timer.bcast(dump_files, root=0)
+    manifest_params = timer.bcast(manifest_params, root=0)
+
+    manifest = Manifest(OUTPUT_DIR, manifest_params, rank)
+
+    # Built once on rank 0 and shared read-only by all ranks on a node
+    with timer.stage('read'):
+        precipitate_table, precipitate_window = share_precipitate_table(comm, PRECIPITATE_ID_FILE)
+
+    def process_chunk(chunk):
+        for dump_file in chunk:
+            print(f"Rank {rank}: Processing file {dump_file}")
+            process_dump_file(dump_file, precipitate_table, timer)
+            manifest.record(dump_file, [os.path.join(INPUT_DIR, dump_file)], [os.path.join(OUTPUT_DIR, dump_file)])
             print(f"Rank {rank}: Finished {dump_file}")
 
-    comm.Barrier()
+    # Files are handed out on demand by rank 0
+    run_task_queue(comm, dump_files, process_chunk, paths=input_paths, history_path=TIMING_HISTORY_FILE, timer=timer)
+
+    timer.barrier()
     if rank == 0:
+        with timer.stage('export'):
+            manifest.consolidate()
         print("\nAll files processed successfully.")
 
+    timer.report(report_path(OUTPUT_DIR, 'per_atom_threshold'))
+
 # -------------------- Processing Functions --------------------
 
-def process_dump_file(dump_file, precipitate_ids):
+def process_dump_file(dump_file, precipitate_table, timer):
     input_path = os.path.join(INPUT_DIR, dump_file)
     output_path = os.path.join(OUTPUT_DIR, dump_file)
 
-    pipeline = import_file(input_path)
-
-    pipeline.modifiers.append(select_atoms)
-    pipeline.modifiers.append(InvertSelectionModifier())
-    pipeline.modifiers.append(DeleteSelectedModifier())
-
-    for frame in range(pipeline.num_frames):
-        data = pipeline.compute(frame)
-
-        export_file(data, output_path, "lammps/dump", 
-                    columns=["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom"])
+    if is_partitioned(input_path):
+        # Each piece is thresholded on its own, so the whole frame is never held in memory
+        selected = []
+        for piece in timed(iter_partitions(input_path, columns=OUTPUT_COLUMNS), timer):
+            with timer.stage('compute'):
+                selected.append(piece.atoms[select_atoms(piece.atoms, precipitate_table)])
+
+        with timer.stage('export'):
+            write_dump(output_path, DumpFrame(piece.timestep, piece.box_bounds, piece.box_flags, np.concatenate(selected)))
+        return
+
+    for frame in timed(iter_dump(input_path, columns=OUTPUT_COLUMNS), timer):
+        with timer.stage('compute'):
+            frame.atoms = frame.atoms[select_atoms(frame.atoms, precipitate_table)]
+
+        with timer.stage('export'):
+            write_dump(output_path, frame)
+
+def timed(frames, timer):
+    """Yields from a frame iterator with the time spent parsing each frame recorded as 'read'."""
+    frames = iter(frames)
+    while True:
+        with timer.stage('read'):
+            frame = next(frames, None)
+        if frame is None:
+            return
+        yield frame
 
 # -------------------- Selection Function --------------------
 
-def select_atoms(frame, data):
+def select_atoms(atoms, precipitate_table):
     
-    precipitate_IDs = load_precipitate_ids(PRECIPITATE_ID_FILE)
+    ids = atoms['id']
+    peratom = atoms['c_peratom']
     
-    ids = data.particles_['Particle Identifier']
-    peratom = data.particles_['c_peratom']
-    
-    select_precipitate = (np.isin(ids, list(precipitate_IDs))) 
+    select_precipitate_atoms = select_precipitate(precipitate_table, ids)
     select_high_energy_atoms = (peratom > PERATOM_THRESHOLD)
 
-    selection = select_precipitate | select_high_energy_atoms
-
-    data.particles.create_property('Selection', data=selection)
-
-# ------------------------ Utilities ---------------------------
-
-def load_precipitate_ids(filepath):
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-
-    ids = set()
-    reading_atoms = False
-
-    for line in lines:
-        if line.strip().startswith("ITEM: ATOMS"):
-            reading_atoms = True
-            continue
-        elif line.strip().startswith("ITEM:"):
-            reading_atoms = False
-        elif reading_atoms:
-            ids.add(int(line.strip()))
+    selection = select_precipitate_atoms | select_high_energy_atoms
 
-    return ids
+    return selection
 
 # ------------------------ Entrypoint --------------------------
 
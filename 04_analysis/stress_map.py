@@ -0,0 +1,119 @@
+# --------------------------- LIBRARIES ---------------------------#
+import os
+import re
+from mpi4py import MPI
+
+from instrumentation import StageTimer, report_path
+from dump_reader import prefetch_dumps
+from scheduler import run_task_queue
+from stress_field import StressFieldAccumulator, read_ave_chunk, save_fields
+from utilities import set_path
+
+# --------------------------- CONFIG ---------------------------#
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, '..'))
+
+MASTER_DATA_DIR = '000_output_files'
+MODULE_DIR = '04_analysis'
+
+# Full dumps only: defect-only dumps leave most atoms out of the bins
+INPUT_DIR = '03_dislo_pin/dump_files'
+# simulate.py's in-run stress map (STRESS_MAP_FREQ), converted to the same output when present
+INSITU_FILE = '03_dislo_pin/insitu/stress_map.chunk'
+
+BIN_SIZE = 5.0 # Angstrom; use simulate.py's STRESS_MAP_BIN to compare with the in-run map
+BIN_DIMS = ('x', 'y')
+STRESS_COLUMNS = ['c_stress[4]']
+WINDOW = 10 # Frames averaged into each field
+
+OUTPUT_FILE = 'stress_map.npz'
+INSITU_OUTPUT_FILE = 'stress_map_insitu.npz'
+TIMING_HISTORY_FILE = 'stress_map_timing_history.json'
+
+# --------------------------- ANALYSIS ---------------------------#
+
+def main():
+    #--- INITIALISE MPI ---#
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+
+    set_path(PROJECT_ROOT)
+
+    timer = StageTimer(comm, 'stress_map')
+
+    input_dir = os.path.join(MASTER_DATA_DIR, INPUT_DIR)
+
+    if rank == 0:
+        os.makedirs(os.path.join(MASTER_DATA_DIR, MODULE_DIR), exist_ok=True)
+        with timer.stage('read'):
+            dump_files = get_filenames(input_dir)
+        print(f"Binning the stress of {len(dump_files)} frames in windows of {WINDOW}")
+    else:
+        dump_files = None
+
+    dump_files = timer.bcast(dump_files, root=0)
+
+    # Each task is one whole window, so a field never has to be merged across ranks
+    windows = [dump_files[start:start + WINDOW] for start in range(0, len(dump_files), WINDOW)]
+    window_names = [window[0] for window in windows]
+    window_index = {name: index for index, name in enumerate(window_names)}
+
+    fields = {}
+
+    def process_chunk(chunk):
+        for name in chunk:
+            window = windows[window_index[name]]
+            accumulator = StressFieldAccumulator(BIN_SIZE, BIN_DIMS, STRESS_COLUMNS, len(window))
+
+            # Only the per-bin sums outlive each frame
+            frames = prefetch_dumps([os.path.join(input_dir, dump_file) for dump_file in window], columns=['x', 'y', 'z'] + STRESS_COLUMNS)
+
+            for _ in window:
+                with timer.stage('read'):
+                    frame = next(frames)
+
+                with timer.stage('compute'):
+                    field = accumulator.add(frame)
+
+            fields[name] = field
+
+    run_task_queue(comm, window_names, process_chunk, paths=[os.path.join(input_dir, name) for name in window_names],
+                   history_path=os.path.join(MASTER_DATA_DIR, MODULE_DIR, TIMING_HISTORY_FILE), timer=timer)
+
+    with timer.stage('wait'):
+        gathered = comm.gather(fields, root=0)
+
+    if rank == 0:
+        with timer.stage('export'):
+            for part in gathered:
+                fields.update(part)
+
+            save_fields(os.path.join(MASTER_DATA_DIR, MODULE_DIR, OUTPUT_FILE), [fields[name] for name in window_names])
+
+            insitu_path = os.path.join(MASTER_DATA_DIR, INSITU_FILE)
+            if os.path.isfile(insitu_path):
+                save_fields(os.path.join(MASTER_DATA_DIR, MODULE_DIR, INSITU_OUTPUT_FILE), read_ave_chunk(insitu_path))
+
+        print(f"Saved {len(window_names)} stress fields")
+
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR), 'stress_map'))
+
+    return None
+
+# --------------------------- UTILITIES ---------------------------#
+
+def get_filenames(dir_path):
+    """Returns a naturally sorted list of filenames (not paths) in the given directory."""
+    files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
+    return sorted(files, key=natural_sort_key)
+
+def natural_sort_key(s):
+    # Split the string into digit and non-digit parts, convert digits to int
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+# --------------------------- ENTRY POINT ---------------------------#
+
+if __name__ == "__main__":
+
+        main()
@@ -1,12 +1,17 @@
 # --------------------------- LIBRARIES ---------------------------#
 import os
 import re
+import time
 from mpi4py import MPI
+import numpy as np
 
-from ovito.io import import_file, export_file
-from ovito.modifiers import TimeAveragingModifier
-
-from utilities import set_path, clear_dir
+from instrumentation import StageTimer, report_path
+from dump_reader import read_dump, write_dump, DumpFrame
+from id_alignment import IDAlignment
+from manifest import Manifest
+from rolling import RollingMean
+from scheduler import report_utilisation
+from utilities import set_path
 
 # --------------------------- CONFIG ---------------------------#
 
@@ -16,6 +21,18 @@ INPUT_FILE = 'dumpfile_*'
 OUTPUT_DIR = 'time_averaged_files'
 
 AVERAGE_WINDOW = 5
+AVERAGE_COLUMNS = ['c_peratom', 'c_csym']
+
+TAG_HALO = 10
+
+BUSY_STAGES = ('read', 'compute', 'export') # Counted as busy in the per-rank utilisation report
+
+# Changing any of these invalidates every window recorded in the manifest
+MANIFEST_PARAMS = {
+    'analysis': 'time_average',
+    'AVERAGE_WINDOW': AVERAGE_WINDOW,
+    'operate_on': AVERAGE_COLUMNS,
+}
 
 # --------------------------- ANALYSIS ---------------------------#
 
@@ -27,84 +44,169 @@ def main():
 
     set_path()
 
+    timer = StageTimer(comm, 'time_average')
+
+    manifest = Manifest(OUTPUT_DIR, MANIFEST_PARAMS, rank)
+
     #--- INITIALISE VARIABLE ON ALL RANKS ---#
     dump_files = None
+    window_starts = None
 
     #--- CREATE AND SET DIRECTORIES ---#
     if rank == 0:
         os.makedirs(OUTPUT_DIR, exist_ok=True)
-        clear_dir(OUTPUT_DIR)
 
-        dump_files = get_filenames(INPUT_DIR)
+        with timer.stage('read'):
+            dump_files = get_filenames(INPUT_DIR)
 
-        print(f"Found {len(dump_files)} dump files to process.")
+            # One output per complete window, named after the window's first file; a window
+            # is out of date if any of its input files changed
+            all_starts = dump_files[:count_windows(dump_files)]
+            window_starts = manifest.pending(all_starts,
+                                             [window_paths(dump_files, index) for index in range(len(all_starts))],
+                                             [[os.path.join(OUTPUT_DIR, dump_file)] for dump_file in all_starts])
+
+        print(f"Found {len(dump_files)} dump files, {len(all_starts) - len(window_starts)} windows already up to date.")
         print(f"Using {size} ranks for parallel processing.\n")
 
     #--- BROADCAST AND DISTRIBUTE WORK ---#
-    dump_files = comm.bcast(dump_files, root=0)
-
-    # Each rank gets only its share of files to process
-    dump_index_rank = split_indexes(len(dump_files), rank, size)
+    dump_files = timer.bcast(dump_files, root=0)
+    window_starts = timer.bcast(window_starts, root=0)
 
-    print(f"Rank {rank} of size {size} processing {dump_index_rank}")
+    if window_starts:
+        # Only the stretch of the trajectory from the first out-of-date window onwards is read
+        first = dump_files.index(window_starts[0])
+        average_frames(comm, dump_files, first, set(window_starts), manifest, timer)
 
-    comm.Barrier()
+    timer.barrier()
 
-    #--- PROCESS FILES ---#
-    for index in dump_index_rank:
-
-        dump_chunk = dump_files[index:index+AVERAGE_WINDOW]
-        # print(dump_chunk)
+    if rank == 0:
+        with timer.stage('export'):
+            manifest.consolidate()
 
-        if len(dump_chunk) != AVERAGE_WINDOW:
-            print("Ran out of files!")
-            break
+    timer.report(report_path(OUTPUT_DIR, 'time_average'))
 
-        process_files(dump_chunk)
-        print(f"Successfully processe frame {index}...")
-        
     return None
 
 # --------------------------- UTILITIES ---------------------------#
 
-def process_files(dump_chunk):
+def average_frames(comm, dump_files, first, pending, manifest, timer):
+    """
+    Streams frames first..end through a rolling mean, each frame parsed by exactly one rank.
+
+    Frames are split into contiguous ranges per rank. The windows starting near
+    the end of a range need the first AVERAGE_WINDOW-1 frames of the following
+    ranges, which their owners parse anyway and send back as a halo.
+    """
+    rank = comm.Get_rank()
+    size = comm.Get_size()
 
-    input_paths = [os.path.join(INPUT_DIR, dump_file) for dump_file in dump_chunk]
-    output_path = os.path.join(OUTPUT_DIR, dump_chunk[0])
+    n_frames = len(dump_files)
+    ranges = [split_indexes(n_frames - first, r, size) for r in range(size)]
+    ranges = [(first + start, first + end) for start, end in ranges]
+
+    start, end = ranges[rank]
+    halo = AVERAGE_WINDOW - 1
+
+    print(f"Rank {rank} of size {size} reading frames {start} to {end}")
+
+    start_time = time.perf_counter()
+    busy_start = busy_time(timer)
+    n_written = 0
+
+    #--- SEND LEADING FRAMES TO LOWER RANKS ---#
+    with timer.stage('read'):
+        leading = {index: load_frame(dump_files[index]) for index in range(start, min(start + halo, end))}
+
+    requests = []
+    for lower in range(rank):
+        lower_start, lower_end = ranges[lower]
+        if lower_start == lower_end:
+            continue
+        needed = [index for index in leading if lower_end <= index < lower_end + halo]
+        if needed:
+            requests.append(comm.isend({index: leading[index] for index in needed}, dest=lower, tag=TAG_HALO))
+
+    #--- STREAM OWN FRAMES, THEN THE HALO ---#
+    alignment = IDAlignment()
+    rolling = RollingMean(AVERAGE_WINDOW, AVERAGE_COLUMNS)
+
+    def push(index, frame):
+        nonlocal n_written
+
+        with timer.stage('compute'):
+            # Frames line up in ascending ID order; the permutation is only rebuilt if the dump order changes
+            frame.atoms = alignment.align(frame.atoms)
+            rolling.push(frame.atoms)
+
+        window_start = index - halo
+        if rolling.full and window_start >= start and dump_files[window_start] in pending:
+            with timer.stage('export'):
+                write_window(dump_files, window_start, frame, rolling, manifest)
+            n_written += 1
+            print(f"Successfully processed frame {window_start}...")
+
+    for index in range(start, end):
+        if index in leading:
+            frame = leading.pop(index)
+        else:
+            with timer.stage('read'):
+                frame = load_frame(dump_files[index])
+        push(index, frame)
+
+    for upper in range(rank + 1, size if start < end else rank + 1):
+        upper_start, upper_end = ranges[upper]
+        if any(upper_start <= index < upper_end for index in range(end, min(end + halo, n_frames))):
+            with timer.stage('wait'):
+                received = comm.recv(source=upper, tag=TAG_HALO)
+            for index in sorted(received):
+                push(index, received[index])
+
+    with timer.stage('wait'):
+        MPI.Request.waitall(requests)
+
+    # Same per-rank table as the task-queue drivers print; the halo exchange is the only waiting
+    stats = comm.gather((rank, n_written, busy_time(timer) - busy_start, time.perf_counter() - start_time), root=0)
+    if rank == 0:
+        report_utilisation(stats, dispatcher=False)
 
-    # Load the trajectory (make sure it's multiple frames!)
-    pipeline = import_file(input_paths)
+def busy_time(timer):
+    return sum(timer.totals.get(name, 0.0) for name in BUSY_STAGES)
 
-    # Add the time-averaging modifier:
-    pipeline.modifiers.append(
-        TimeAveragingModifier(
-            operate_on = ('property:particles/c_csym', 'property:particles/c_peratom')
-        )
-    )
+def load_frame(dump_file):
+    """Reads the averaged columns of one frame."""
+    return read_dump(os.path.join(INPUT_DIR, dump_file), columns=['id', 'x', 'y', 'z'] + AVERAGE_COLUMNS)
 
-    # Evaluate at the last frame (you can change this)
-    data = pipeline.compute(pipeline.source.num_frames - 1)
+def write_window(dump_files, window_start, frame, rolling, manifest):
+    """Writes the last frame of a window with the window averages, named after its first file."""
+    columns = ['id', 'x', 'y', 'z']
+    for name in AVERAGE_COLUMNS:
+        columns += [name, f"{name}_average"]
 
-    export_file(data, output_path, "lammps/dump",
-                columns=["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom", "c_peratom Average", "c_csym", "c_csym Average"])
+    atoms = np.empty(len(frame.atoms), dtype=[(name, np.int64 if name == 'id' else np.float64) for name in columns])
+    for name in ['id', 'x', 'y', 'z'] + AVERAGE_COLUMNS:
+        atoms[name] = frame.atoms[name]
+    for name in AVERAGE_COLUMNS:
+        atoms[f"{name}_average"] = rolling.mean(name)
 
-def view_information(data):
-    
-    print('')
-    print("Available particle properties:")
-    for prop in data.particles.keys():
-        print(f"  - {prop}")
+    output_path = os.path.join(OUTPUT_DIR, dump_files[window_start])
+    write_dump(output_path, DumpFrame(frame.timestep, frame.box_bounds, frame.box_flags, atoms))
 
-    print("\nAvailable global attributes:")
-    for attr in data.attributes.keys():
-        print(f"  - {attr}")
-    print('')
+    manifest.record(dump_files[window_start], window_paths(dump_files, window_start), [output_path])
 
 def get_filenames(dir_path):
     """Returns a naturally sorted list of filenames (not paths) in the given directory."""
     files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
     return sorted(files, key=natural_sort_key)
 
+def window_paths(dump_files, index):
+    """Input paths of the window starting at `index`."""
+    return [os.path.join(INPUT_DIR, dump_file) for dump_file in dump_files[index:index+AVERAGE_WINDOW]]
+
+def count_windows(dump_files):
+    """Number of complete AVERAGE_WINDOW windows in the file list."""
+    return max(len(dump_files) - AVERAGE_WINDOW + 1, 0)
+
 def natural_sort_key(s):
     # Split the string into digit and non-digit parts, convert digits to int
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
@@ -121,10 +223,10 @@ def split_indexes(n_files, rank, size):
         start = rank * chunk_size + remainder
         end = start + chunk_size
 
-    return list(range(start, end))
+    return [start, end]
 
 # --------------------------- ENTRY POINT ---------------------------#
 
 if __name__ == "__main__":
 
-        main()
\ No newline at end of file
+        main()
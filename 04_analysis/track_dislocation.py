@@ -0,0 +1,129 @@
+# --------------------------- LIBRARIES ---------------------------#
+import os
+import re
+from mpi4py import MPI
+import numpy as np
+
+from instrumentation import StageTimer, report_path
+from dislocation_tracker import track, select_frames, CORE_THRESHOLD, N_X_BINS, N_Z_SLICES, GLIDE_WINDOW
+from dump_reader import prefetch_dumps
+from precipitate_index import share_precipitate_table, select_precipitate
+from scheduler import run_task_queue
+from utilities import set_path
+
+# --------------------------- CONFIG ---------------------------#
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, '..'))
+
+MASTER_DATA_DIR = '000_output_files'
+MODULE_DIR = '04_analysis'
+
+INPUT_DIR = '03_dislo_pin/dump_files'
+PRECIPITATE_ID_FILE = '03_dislo_pin/precipitate_ID'
+
+COLUMNS = ['id', 'x', 'y', 'z', 'c_peratom']
+
+PROFILE_FILE = 'dislocation_profiles.npz'
+TIMING_HISTORY_FILE = 'track_timing_history.json'
+
+# Frames handed to DXA.py (when its USE_FRAME_SELECTION is on): the line moved or changed shape since the last one
+FRAME_SELECTION_FILE = 'DXA_frame_selection.txt'
+SELECT_DISPLACEMENT = 5.0 # Angstrom of mean glide
+SELECT_BOW_CHANGE = 5.0 # Angstrom change in the spread of the line along x
+SELECT_EVERY = None # Also keep every n-th frame
+
+# --------------------------- ANALYSIS ---------------------------#
+
+def main():
+    #--- INITIALISE MPI ---#
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+
+    set_path(PROJECT_ROOT)
+
+    timer = StageTimer(comm, 'track_dislocation')
+
+    input_dir = os.path.join(MASTER_DATA_DIR, INPUT_DIR)
+
+    if rank == 0:
+        os.makedirs(os.path.join(MASTER_DATA_DIR, MODULE_DIR), exist_ok=True)
+        with timer.stage('read'):
+            dump_files = get_filenames(input_dir)
+        print(f"Tracking the dislocation in {len(dump_files)} frames")
+    else:
+        dump_files = None
+
+    dump_files = timer.bcast(dump_files, root=0)
+
+    # Precipitate atoms sit on a high-energy interface and would otherwise count as core atoms
+    with timer.stage('read'):
+        precipitate_table, precipitate_window = share_precipitate_table(comm, os.path.join(MASTER_DATA_DIR, PRECIPITATE_ID_FILE))
+
+    profiles = {}
+
+    def process_chunk(chunk):
+        # The next files are read in the background while this one is binned
+        frames = prefetch_dumps([os.path.join(input_dir, dump_file) for dump_file in chunk], columns=COLUMNS)
+
+        for dump_file in chunk:
+            with timer.stage('read'):
+                frame = next(frames)
+
+            with timer.stage('compute'):
+                exclude = select_precipitate(precipitate_table, frame.atoms['id'])
+                profiles[dump_file] = track(frame, CORE_THRESHOLD, N_X_BINS, N_Z_SLICES, GLIDE_WINDOW, exclude=exclude)
+
+    run_task_queue(comm, dump_files, process_chunk, paths=[os.path.join(input_dir, f) for f in dump_files],
+                   history_path=os.path.join(MASTER_DATA_DIR, MODULE_DIR, TIMING_HISTORY_FILE), timer=timer)
+
+    with timer.stage('wait'):
+        gathered = comm.gather(profiles, root=0)
+
+    if rank == 0:
+        with timer.stage('export'):
+            for part in gathered:
+                profiles.update(part)
+            ordered = [profiles[dump_file] for dump_file in dump_files]
+
+            save_profiles(os.path.join(MASTER_DATA_DIR, MODULE_DIR, PROFILE_FILE), dump_files, ordered)
+
+            selected = select_frames(ordered, SELECT_DISPLACEMENT, SELECT_BOW_CHANGE, SELECT_EVERY)
+            with open(os.path.join(MASTER_DATA_DIR, MODULE_DIR, FRAME_SELECTION_FILE), 'w') as f:
+                f.writelines(f"{dump_files[index]}\n" for index in selected)
+
+        print(f"Selected {len(selected)} of {len(dump_files)} frames for DXA")
+
+    timer.report(report_path(os.path.join(MASTER_DATA_DIR, MODULE_DIR), 'track_dislocation'))
+
+    return None
+
+# --------------------------- UTILITIES ---------------------------#
+
+def save_profiles(path, dump_files, profiles):
+    """One row per frame, in file order."""
+    np.savez(path,
+             filename=np.array(dump_files),
+             timestep=np.array([profile.timestep for profile in profiles], dtype=np.int64),
+             z=profiles[0].z_centres if profiles else np.empty(0),
+             x=np.array([profile.x for profile in profiles]).reshape(len(profiles), -1),
+             counts=np.array([profile.counts for profile in profiles]).reshape(len(profiles), -1),
+             histogram=np.array([profile.histogram for profile in profiles], dtype=np.int32).reshape(len(profiles), N_Z_SLICES, N_X_BINS),
+             mean_x=np.array([profile.mean_x for profile in profiles]),
+             bow=np.array([profile.bow for profile in profiles]),
+             glide_y=np.array([profile.glide_y for profile in profiles]))
+
+def get_filenames(dir_path):
+    """Returns a naturally sorted list of filenames (not paths) in the given directory."""
+    files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
+    return sorted(files, key=natural_sort_key)
+
+def natural_sort_key(s):
+    # Split the string into digit and non-digit parts, convert digits to int
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+# --------------------------- ENTRY POINT ---------------------------#
+
+if __name__ == "__main__":
+
+        main()
@@ -3,11 +3,12 @@ import os
 import re
 from mpi4py import MPI
 
-from ovito.io import import_file, export_file
-from ovito.modifiers import WignerSeitzAnalysisModifier, ExpressionSelectionModifier, DeleteSelectedModifier
-from ovito.pipeline import FileSource
-
-from utilities import set_path, clear_dir
+from instrumentation import StageTimer, report_path
+from dump_reader import prefetch_dumps, write_dump, DumpFrame
+from manifest import Manifest, file_identity
+from scheduler import run_task_queue
+from utilities import set_path
+from ws_occupancy import share_site_index, CELL_SIZE, point_defects
 
 # --------------------------- CONFIG ---------------------------#
 
@@ -19,6 +20,8 @@ OUTPUT_POINT_DEFECT_DIR = 'WS_point_defect_files'
 REFERENCE_DIR = '../04_jog_creation/min_dump'
 REFERENCE_FRAME = 'edge_dislo_1_dump'
 
+TIMING_HISTORY_FILE = 'WS_timing_history.json'
+
 # --------------------------- ANALYSIS ---------------------------#
 
 def main():
@@ -29,67 +32,85 @@ def main():
 
     set_path()
 
+    timer = StageTimer(comm, 'wigner_seitz')
+
     #--- INITIALISE VARIABLE ON ALL RANKS ---#
     dump_files = None
+    input_paths = None
+    manifest_params = None
 
     #--- CREATE AND SET DIRECTORIES ---#
     if rank == 0:
         os.makedirs(OUTPUT_POINT_DEFECT_DIR, exist_ok=True)
-        clear_dir(OUTPUT_POINT_DEFECT_DIR)
 
-        dump_files = get_filenames(INPUT_DIR)
+        # A different reference configuration invalidates every recorded frame
+        reference_path = os.path.join(REFERENCE_DIR, REFERENCE_FRAME)
+        manifest_params = {'analysis': 'wigner_seitz', 'reference': reference_path, 'reference_identity': file_identity(reference_path),
+                           'engine': 'cell_list', 'cell_size': CELL_SIZE}
+
+        manifest = Manifest(OUTPUT_POINT_DEFECT_DIR, manifest_params, rank)
 
-        print(f"Found {len(dump_files)} dump files to process.")
+        with timer.stage('read'):
+            all_files = get_filenames(INPUT_DIR)
+            dump_files = manifest.pending(all_files,
+                                          [[os.path.join(INPUT_DIR, dump_file)] for dump_file in all_files],
+                                          [[os.path.join(OUTPUT_POINT_DEFECT_DIR, dump_file)] for dump_file in all_files])
+
+        input_paths = [os.path.join(INPUT_DIR, dump_file) for dump_file in dump_files]
+
+        print(f"Found {len(all_files)} dump files, {len(all_files) - len(dump_files)} already up to date.")
         print(f"Using {size} ranks for parallel processing.\n")
 
     #--- BROADCAST AND DISTRIBUTE WORK ---#
-    dump_files = comm.bcast(dump_files, root=0)
+    dump_files = timer.bcast(dump_files, root=0)
+    manifest_params = timer.bcast(manifest_params, root=0)
 
-    # Each rank gets only its share of files to process
-    start, end = split_indexes(len(dump_files), rank, size)
+    manifest = Manifest(OUTPUT_POINT_DEFECT_DIR, manifest_params, rank)
 
-    print(f"Rank {rank} of size {size} processing files from {start} to {end}")
+    #--- LOAD REFERENCE ---#
+    # The reference sites and their cell list are built once and shared by all ranks on a node
+    with timer.stage('read'):
+        site_index, reference_columns, windows = share_site_index(comm, os.path.join(REFERENCE_DIR, REFERENCE_FRAME))
 
     #--- PROCESS FILES ---#
-    process_file(dump_files[start:end])
+    # Rank 0 hands out chunks of frames on demand; costlier frames go out in smaller chunks
+    run_task_queue(comm, dump_files, lambda chunk: process_file(chunk, site_index, reference_columns, timer, manifest),
+                   paths=input_paths, history_path=TIMING_HISTORY_FILE, timer=timer)
+
+    if rank == 0:
+        with timer.stage('export'):
+            manifest.consolidate()
+
+    timer.barrier()
+    timer.report(report_path('.', 'wigner_seitz'))
                 
     return None
 
 # --------------------------- UTILITIES ---------------------------#
 
-def process_file(dump_chunk):
+def process_file(dump_chunk, site_index, reference_columns, timer, manifest=None):
     input_paths = [os.path.join(INPUT_DIR, dump_file) for dump_file in dump_chunk]
     output_paths = [os.path.join(OUTPUT_POINT_DEFECT_DIR, dump_file) for dump_file in dump_chunk]
 
-    # Load the input files as a trajectory
-    pipeline = import_file(input_paths)
-
-    # Set up the Wigner-Seitz analysis
-    ws_modifier = WignerSeitzAnalysisModifier()
-    ws_modifier.reference = FileSource()
-    ws_modifier.reference.load(os.path.join(REFERENCE_DIR, REFERENCE_FRAME))
-    pipeline.modifiers.append(ws_modifier)
+    # The next files are read (and decompressed) in the background while this one is analysed
+    frames = prefetch_dumps(input_paths, columns=['x', 'y', 'z'])
 
-    # Set up the Expression Selection
-    exp_modifier = ExpressionSelectionModifier(expression='Occupancy == 1')
-    pipeline.modifiers.append(exp_modifier)
+    for frame_index, input_path in enumerate(input_paths):
+        # Only the time spent waiting on the prefetcher counts as reading
+        with timer.stage('read'):
+            frame = next(frames)
 
-    # Set up the Delete Selection
-    del_modifier = DeleteSelectedModifier()
-    pipeline.modifiers.append(del_modifier)
+        # Reference sites with Occupancy != 1, as exported from OVITO before
+        with timer.stage('compute'):
+            defects = point_defects(site_index, reference_columns, frame)
 
-    for frame in range(pipeline.num_frames):
-        data = pipeline.compute(frame)
+        with timer.stage('export'):
+            write_dump(output_paths[frame_index], DumpFrame(frame.timestep, frame.box_bounds, frame.box_flags, defects))
 
-        # Export only the selected particles using the 'Selection' tag
-        export_file(
-            data,
-            output_paths[frame],
-            "lammps/dump",
-            columns=["Particle Identifier", "Position.X", "Position.Y", "Position.Z", "c_peratom", "Occupancy"],
-        )
+            if manifest is not None:
+                manifest.record(dump_chunk[frame_index], [input_path], [output_paths[frame_index]])
 
-        print(f"Successfully processed frame {frame}...")
+        print(f"Successfully processed frame {frame_index}...")
 
 def view_information(data):
     
@@ -112,20 +133,6 @@ def natural_sort_key(s):
     # Split the string into digit and non-digit parts, convert digits to int
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
 
-def split_indexes(n_files, rank, size):
-    """Split n_files into contiguous chunks of indexes for each rank."""
-    chunk_size = n_files // size
-    remainder = n_files % size
-
-    if rank < remainder:
-        start = rank * (chunk_size + 1)
-        end = start + chunk_size + 1
-    else:
-        start = rank * chunk_size + remainder
-        end = start + chunk_size
-
-    return [start, end]
-
 # --------------------------- ENTRY POINT ---------------------------#
 
 if __name__ == "__main__":
@@ -0,0 +1,344 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import platform
+import time
+import numpy as np
+from mpi4py import MPI
+from lammps import lammps, PyLammps
+
+from thermo_log import read_timings
+from utilities import set_path
+
+# --------------------------- CONFIG ---------------------------#
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, '..'))
+
+MASTER_DATA_DIR = '000_output_files'
+MODULE_DIR = '05_benchmark'
+
+LOG_DIR = 'logs'
+RESULTS_FILE = 'benchmark_results.json' # Every invocation is appended, so older results stay comparable
+
+POTENTIAL_DIR = '00_potentials'
+POTENTIAL_FILE = 'malerba.fs'
+
+# 'eam/fs' (production potential), 'morse' (analytic, no file needed) or 'auto' (eam/fs if the file exists)
+POTENTIAL_STYLE = 'auto'
+MORSE_COEFFS = (0.4174, 1.3885, 2.845) # Girifalco & Weizer Fe: D0 (eV), alpha (1/Angstrom), r0 (Angstrom)
+MORSE_CUTOFF = 6.0
+FE_MASS = 55.845
+
+# Same orientation as the production box: glide along x, glide plane normal along y, dislocation line along z
+LATTICE_CONSTANT = 2.855
+ORIENTATION = {'x': (1, 1, 1), 'y': (-1, 0, 1), 'z': (1, -2, 1)}
+# Lattice spacings along x, y, z (8 atoms per spacing cell); about 5800 atoms. The BCC repeat along [1-21] is 1.5
+# spacings, so the z count must be a multiple of 3 or the periodic z boundary cuts the stacking
+BOX_REPLICAS = (12, 10, 6)
+
+# 'strong': the same box on every rank count; 'weak': the box grows along x in proportion to the rank count
+MODE = 'strong'
+RANK_COUNTS = None # None for 1, 2, 4, ... up to the size of the job
+
+# Each case is (edge dislocation, precipitate)
+CASES = {
+    'perfect': (False, False),
+    'dislocation': (True, False),
+    'dislocation_precipitate': (True, True),
+}
+TASKS = ['minimize', 'md']
+
+MIN_STEPS = 100 # Tolerances are zero, so every minimisation runs exactly this many iterations
+MD_STEPS = 500
+DT = 0.001
+TEMPERATURE = 100
+SHEAR_VELOCITY = 1
+VELOCITY_SEED = 1234
+THERMO_FREQ = 100
+DUMP_FREQ = 100 # None to leave Output out of the timing breakdown
+
+PRECIPITATE_RADIUS = 8
+DISLOCATION_INITIAL_DISPLACEMENT = 5 # Distance of the dislocation core from the precipitate surface, in Angstroms
+FIXED_SURFACE_DEPTH = 5
+POISSON_RATIO = 0.29
+OVERLAP_DISTANCE = 1.5 # Atoms brought closer than this by the dislocation field are deleted
+
+# --------------------------- BENCHMARK ---------------------------#
+
+def main():
+
+    #--- INITIALISE MPI ---#
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    set_path(PROJECT_ROOT)
+
+    output_dir = os.path.join(MASTER_DATA_DIR, MODULE_DIR)
+    log_dir = os.path.join(output_dir, LOG_DIR)
+
+    if rank == 0:
+        os.makedirs(log_dir, exist_ok=True)
+        potential = choose_potential()
+        print(f"{MODE} scaling on up to {size} ranks with the {potential} potential.\n")
+    else:
+        potential = None
+
+    potential = comm.bcast(potential, root=0)
+
+    rank_counts = [n for n in (RANK_COUNTS or powers_of_two(size)) if n <= size]
+    results = []
+
+    #--- RUN EACH RANK COUNT ---#
+    # The first n ranks run while the rest wait; world rank 0 takes part in every run and collects the results
+    for n_ranks in rank_counts:
+        sub = comm.Split(0 if rank < n_ranks else MPI.UNDEFINED, key=rank)
+
+        if sub != MPI.COMM_NULL:
+            replicas = scaled_replicas(n_ranks)
+
+            for case, (dislocation, precipitate) in CASES.items():
+                for task in TASKS:
+                    log_path = os.path.join(log_dir, f"{MODE}_{case}_{task}_n{n_ranks}.lammps")
+
+                    record = run_benchmark(sub, task, replicas, dislocation, precipitate, potential, log_path)
+
+                    if sub.Get_rank() == 0:
+                        record.update({'case': case, 'n_ranks': n_ranks})
+                        results.append(record)
+                        print(f"{case:>24} {task:>8} on {n_ranks:>4} ranks: {record['loop_time']:.3f} s "
+                              f"({record['atom_steps_per_second']:.3e} atom-steps/s)")
+
+            sub.Free()
+
+        comm.Barrier()
+
+    #--- SAVE ---#
+    if rank == 0:
+        add_scaling(results)
+        save_results(os.path.join(output_dir, RESULTS_FILE), potential, results)
+        print(f"\nResults written to {os.path.join(output_dir, RESULTS_FILE)}")
+
+    return None
+
+def run_benchmark(comm, task, replicas, dislocation, precipitate, potential, log_path):
+    """
+    Runs one fixed-length minimisation or MD segment on `comm` and returns
+    its timing record on rank 0 (None elsewhere).
+
+    The LAMMPS timing breakdown is read back from the instance's own log.
+    """
+    lmp = lammps(comm=comm, cmdargs=['-screen', 'none', '-log', log_path])
+    L = PyLammps(ptr=lmp)
+
+    build_box(L, lmp, replicas, dislocation, precipitate, potential)
+
+    L.compute('peratom', 'all', 'pe/atom')
+    L.thermo(THERMO_FREQ)
+
+    if DUMP_FREQ:
+        dump_path = os.path.join(os.path.dirname(log_path), 'dump_' + os.path.splitext(os.path.basename(log_path))[0])
+        L.dump('1', 'all', 'custom', DUMP_FREQ, dump_path, 'id', 'x', 'y', 'z', 'c_peratom')
+        L.dump_modify('1', 'first', 'no')
+
+    comm.Barrier()
+    start = time.perf_counter()
+
+    if task == 'minimize':
+        L.min_style('cg')
+        L.minimize(0.0, 0.0, MIN_STEPS, MIN_STEPS * 10)
+    else:
+        # Same integrator, thermostat, frozen layers and shear as 03_dislo_pin/simulate.py
+        L.timestep(DT)
+        L.fix('1', 'all', 'nvt', 'temp', TEMPERATURE, TEMPERATURE, 100.0*DT)
+        L.velocity('mobile_atoms', 'create', TEMPERATURE, VELOCITY_SEED, 'mom', 'yes', 'rot', 'yes')
+        L.velocity('top_surface', 'set', -(SHEAR_VELOCITY/2), 0.0, 0.0)
+        L.velocity('bottom_surface', 'set', (SHEAR_VELOCITY/2), 0.0, 0.0)
+        L.run(MD_STEPS)
+
+    comm.Barrier()
+    wall_time = time.perf_counter() - start
+
+    n_atoms = lmp.get_natoms()
+    L.close()
+
+    if comm.Get_rank() != 0:
+        return None
+
+    # The last summary in the log belongs to the segment above
+    timing = read_timings(log_path)[-1]
+
+    return {
+        'task': task,
+        'replicas': list(replicas),
+        'atoms': n_atoms,
+        'dislocation': dislocation,
+        'precipitate': precipitate,
+        'steps': timing['steps'],
+        'loop_time': timing['loop_time'],
+        'wall_time': wall_time,
+        'atom_steps_per_second': n_atoms * timing['steps'] / timing['loop_time'] if timing['loop_time'] > 0 else None,
+        'sections': timing['sections'],
+        'log': log_path,
+    }
+
+# --------------------------- SYSTEM SETUP ---------------------------#
+
+def build_box(L, lmp, replicas, dislocation, precipitate, potential):
+    """
+    Creates a BCC Fe box with the production boundaries and frozen surface
+    layers, optionally with an edge dislocation and a frozen precipitate,
+    and sets the potential. Returns the box centre.
+    """
+    L.units('metal')
+    L.atom_style('atomic')
+
+    L.command('boundary p f p')
+
+    orient = [f"orient {axis} {' '.join(str(i) for i in direction)}" for axis, direction in ORIENTATION.items()]
+    L.command(f"lattice bcc {LATTICE_CONSTANT} {' '.join(orient)}")
+
+    L.region('box', 'block', 0, replicas[0], 0, replicas[1], 0, replicas[2])
+    L.create_box(1, 'box')
+    L.create_atoms(1, 'box')
+    L.mass(1, FE_MASS)
+
+    # delete_atoms overlap needs the pair style (and its neighbour list) to be defined
+    set_potential(L, potential)
+
+    box_bounds = lmp.extract_box()
+    box_min, box_max = np.array(box_bounds[0]), np.array(box_bounds[1])
+    centre = (box_min + box_max) / 2
+
+    if dislocation:
+        core_x = centre[0] - (PRECIPITATE_RADIUS + DISLOCATION_INITIAL_DISPLACEMENT if precipitate else 0)
+        insert_edge_dislocation(L, core_x, centre[1])
+
+    #--- Regions and Groups ---#
+    L.region('top_surface_reg', 'block', 'INF', 'INF', (box_max[1]-FIXED_SURFACE_DEPTH), 'INF', 'INF', 'INF')
+    L.region('bottom_surface_reg', 'block', 'INF', 'INF', 'INF', (box_min[1]+FIXED_SURFACE_DEPTH), 'INF', 'INF')
+
+    L.group('top_surface', 'region', 'top_surface_reg')
+    L.group('bottom_surface', 'region', 'bottom_surface_reg')
+
+    L.fix('top_surface_freeze', 'top_surface', 'setforce', 0.0, 0.0, 0.0)
+    L.fix('bottom_surface_freeze', 'bottom_surface', 'setforce', 0.0, 0.0, 0.0)
+
+    if precipitate:
+        L.region('precipitate_reg', 'sphere', centre[0], centre[1], centre[2], PRECIPITATE_RADIUS)
+        L.group('precipitate', 'region', 'precipitate_reg')
+        L.fix('precipitate_freeze', 'precipitate', 'setforce', 0.0, 0.0, 0.0)
+        L.group('mobile_atoms', 'subtract', 'all', 'precipitate', 'top_surface', 'bottom_surface')
+    else:
+        L.group('mobile_atoms', 'subtract', 'all', 'top_surface', 'bottom_surface')
+
+    return centre
+
+def insert_edge_dislocation(L, core_x, core_y):
+    """
+    Displaces every atom by the isotropic elastic field of an edge dislocation
+    along z with its Burgers vector along x.
+
+    The field is not periodic in x, so the structure is only an approximate
+    dislocation; it is meant to give the benchmark a realistic defect load,
+    not a relaxed core. Atoms pushed too close together are removed.
+    """
+    b = LATTICE_CONSTANT * np.sqrt(3) / 2
+    nu = POISSON_RATIO
+    scale = b / (2 * np.pi)
+
+    # Offset the core by a quarter plane spacing so no atom sits on the singularity
+    core_y += LATTICE_CONSTANT * np.sqrt(2) / 8
+
+    L.variable('dx', 'atom', f"x-{core_x}")
+    L.variable('dy', 'atom', f"y-{core_y}")
+    L.variable('r2', 'atom', 'v_dx^2+v_dy^2')
+    L.variable('ux', 'atom', f"{scale}*(atan2(v_dy,v_dx)+v_dx*v_dy/({2*(1-nu)}*v_r2))")
+    L.variable('uy', 'atom', f"-{scale}*({(1-2*nu)/(4*(1-nu))}*ln(v_r2)+(v_dx^2-v_dy^2)/({4*(1-nu)}*v_r2))")
+
+    L.displace_atoms('all', 'move', 'v_ux', 'v_uy', 'NULL', 'units', 'box')
+    L.delete_atoms('overlap', OVERLAP_DISTANCE, 'all', 'all')
+
+    for name in ('dx', 'dy', 'r2', 'ux', 'uy'):
+        L.variable(name, 'delete')
+
+def set_potential(L, potential):
+    if potential == 'eam/fs':
+        L.pair_style('eam/fs')
+        L.pair_coeff('*', '*', os.path.join(POTENTIAL_DIR, POTENTIAL_FILE), 'Fe')
+    else:
+        L.pair_style('morse', MORSE_CUTOFF)
+        L.pair_coeff('*', '*', *MORSE_COEFFS)
+
+def choose_potential():
+    if POTENTIAL_STYLE != 'auto':
+        return POTENTIAL_STYLE
+    return 'eam/fs' if os.path.isfile(os.path.join(POTENTIAL_DIR, POTENTIAL_FILE)) else 'morse'
+
+# --------------------------- RESULTS ---------------------------#
+
+def scaled_replicas(n_ranks):
+    if MODE == 'weak':
+        return (BOX_REPLICAS[0] * n_ranks, BOX_REPLICAS[1], BOX_REPLICAS[2])
+    return tuple(BOX_REPLICAS)
+
+def powers_of_two(size):
+    counts = [1]
+    while counts[-1] * 2 <= size:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != size:
+        counts.append(size)
+    return counts
+
+def add_scaling(results):
+    """
+    Adds speedup and parallel efficiency relative to the smallest rank count
+    of the same case and task. Weak-scaling efficiency is the ratio of loop
+    times; strong scaling also divides by the increase in ranks.
+    """
+    for record in results:
+        base = min((other for other in results if (other['case'], other['task']) == (record['case'], record['task'])),
+                   key=lambda other: other['n_ranks'])
+
+        speedup = base['loop_time'] / record['loop_time'] if record['loop_time'] > 0 else None
+
+        if speedup is None:
+            efficiency = None
+        elif MODE == 'weak':
+            efficiency = speedup
+        else:
+            efficiency = speedup * base['n_ranks'] / record['n_ranks']
+
+        record['speedup'] = speedup
+        record['efficiency'] = efficiency
+
+def save_results(path, potential, results):
+    history = []
+    if os.path.isfile(path):
+        with open(path) as f:
+            history = json.load(f)
+
+    history.append({
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'mode': MODE,
+        'potential': potential,
+        'config': {
+            'box_replicas': list(BOX_REPLICAS),
+            'min_steps': MIN_STEPS,
+            'md_steps': MD_STEPS,
+            'dump_freq': DUMP_FREQ,
+        },
+        'runs': results,
+    })
+
+    with open(path + '.tmp', 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+# --------------------------- ENTRY POINT ---------------------------#
+
+if __name__ == "__main__":
+
+        main()
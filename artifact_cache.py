@@ -0,0 +1,151 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import shutil
+import time
+
+from manifest import file_checksum, file_identity, hash_params
+
+# --------------------------- CONFIG ---------------------------#
+
+META_FILE = 'artifact.json'
+DIGEST_FILE = 'digests.json' # Content digests of inputs, reused while an input's size and mtime are unchanged
+
+MAX_BYTES = 20 * 1024**3
+
+# --------------------------- CACHE ---------------------------#
+
+class ArtifactCache:
+    """
+    Content-addressed store of stage outputs.
+
+    An entry is keyed by the contents of the stage's input files and its
+    parameters, so any change to either misses. Each entry is a directory
+    holding copies of the output files; it is written under a temporary
+    name and renamed into place, so a killed job never leaves a partial
+    entry. Once the cache grows past `max_bytes` the least recently used
+    entries are removed.
+
+    Not safe for concurrent writers; use it from one rank.
+    """
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, input_paths, params):
+        """Hash of the input file contents and a JSON-serialisable parameter dict."""
+        digests = self._digests(input_paths)
+        return hash_params({'inputs': digests, 'params': params})
+
+    def fetch(self, key, outputs):
+        """
+        Copies the cached files of `key` to their destinations and returns
+        True, or returns False on a miss. `outputs` maps each cached file
+        name to its destination path.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        meta = load_meta(entry_dir)
+
+        if meta is None or set(outputs) - set(meta['files']):
+            return False
+
+        for name, destination in outputs.items():
+            shutil.copyfile(os.path.join(entry_dir, name), destination)
+
+        meta['last_used'] = time.time()
+        save_meta(entry_dir, meta)
+
+        return True
+
+    def store(self, key, outputs, params=None):
+        """Copies the files in `outputs` (name -> source path) into the cache under `key`."""
+        entry_dir = os.path.join(self.cache_dir, key)
+        staging_dir = f"{entry_dir}.tmp{os.getpid()}"
+
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+
+        for name, source in outputs.items():
+            shutil.copyfile(source, os.path.join(staging_dir, name))
+
+        now = time.time()
+        save_meta(staging_dir, {
+            'files': sorted(outputs),
+            'size': sum(os.path.getsize(os.path.join(staging_dir, name)) for name in outputs),
+            'params': params,
+            'created': now,
+            'last_used': now,
+        })
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(staging_dir, entry_dir)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            meta = load_meta(os.path.join(self.cache_dir, name))
+            if meta is not None:
+                entries.append((meta['last_used'], meta['size'], name))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            print(f"Evicted cache entry {name} ({size / 1024**2:.1f} MB)")
+
+    def _digests(self, input_paths):
+        """Content digest of each input, rehashed only when its size or mtime changed."""
+        digest_path = os.path.join(self.cache_dir, DIGEST_FILE)
+
+        known = {}
+        if os.path.isfile(digest_path):
+            with open(digest_path, 'r') as f:
+                known = json.load(f)
+
+        digests = []
+        for path in input_paths:
+            path = os.path.abspath(path)
+            identity = file_identity(path)
+
+            recorded = known.get(path)
+            if recorded is None or recorded['identity'] != identity:
+                recorded = {'identity': identity, 'digest': file_checksum(path)}
+                known[path] = recorded
+
+            digests.append(recorded['digest'])
+
+        with open(digest_path + '.tmp', 'w') as f:
+            json.dump(known, f, indent=1)
+        os.replace(digest_path + '.tmp', digest_path)
+
+        return digests
+
+# --------------------------- UTILITIES ---------------------------#
+
+def load_meta(entry_dir):
+    """Returns an entry's metadata, or None if the entry does not exist or is incomplete."""
+    meta_path = os.path.join(entry_dir, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+def save_meta(entry_dir, meta):
+    meta_path = os.path.join(entry_dir, META_FILE)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(meta_path + '.tmp', meta_path)
@@ -0,0 +1,307 @@
+# --------------------------- LIBRARIES ---------------------------#
+import itertools
+import os
+import re
+
+import numpy as np
+
+# --------------------------- CONFIG ---------------------------#
+
+GRID_CELL = 10.0 # Edge of the spatial grid cells in Angstrom
+BURGERS_DECIMALS = 4 # Burgers vectors are grouped after rounding to this many decimals
+
+DB_VERSION = 1
+
+# --------------------------- DATABASE ---------------------------#
+
+class DislocationDB:
+    """
+    Dislocation lines of a whole trajectory in flat, offset-indexed arrays.
+
+    Segments of frame f are rows `segment_start[f]:segment_start[f+1]`, and
+    the points of segment s are `points[point_start[s]:point_start[s+1]]`.
+    Every pair of consecutive points is also stored as an edge, shifted by
+    a periodic image so its midpoint lies in the cell, and the edges are
+    sorted by (frame, grid cell) so spatial queries only look at edges in
+    the grid cells near the query region.
+
+    Cells are treated as orthogonal, as in the simulations here.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as stored:
+            if int(stored['version']) != DB_VERSION:
+                raise ValueError(f"{path}: unsupported dislocation database version {int(stored['version'])}")
+            for name in stored.files:
+                setattr(self, name, stored[name])
+
+        self.n_cells_total = int(np.prod(self.n_cells))
+
+    def __len__(self):
+        return len(self.timestep)
+
+    # ---- Segments ----#
+
+    def frame_segments(self, frame):
+        """Rows of the segments in one frame."""
+        return np.arange(self.segment_start[frame], self.segment_start[frame + 1])
+
+    def segment_points(self, segment):
+        return self.points[self.point_start[segment]:self.point_start[segment + 1]]
+
+    # ---- Whole-trajectory queries ----#
+
+    def line_length(self):
+        """Total dislocation line length in every frame."""
+        return np.bincount(self.segment_frame, weights=self.segment_length, minlength=len(self))
+
+    def length_by_burgers(self, spatial=True):
+        """
+        Returns (burgers_vectors, lengths): the distinct Burgers vectors and,
+        for each, its line length in every frame (shape (n_vectors, n_frames)).
+        """
+        burgers = np.round(self.burgers_spatial if spatial else self.burgers_local, BURGERS_DECIMALS)
+        vectors, group = np.unique(burgers, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+
+        lengths = np.zeros((len(vectors), len(self)))
+        np.add.at(lengths, (group, self.segment_frame), self.segment_length)
+
+        return vectors, lengths
+
+    def length_within(self, centre, radius, frames=None):
+        """Line length inside the sphere (centre, radius) in each of `frames` (default every frame), in ascending frame order."""
+        frames = np.arange(len(self)) if frames is None else np.unique(frames)
+        edges, inside = self._edges_within(centre, radius, frames)
+
+        position = np.searchsorted(frames, self.edge_frame[edges])
+        return np.bincount(position, weights=inside, minlength=len(frames)).astype(float)
+
+    def segments_within(self, centre, radius, frame):
+        """Rows of the segments of one frame that have any length inside the sphere."""
+        edges, inside = self._edges_within(centre, radius, np.array([frame]))
+        return np.unique(self.edge_segment[edges[inside > 0]])
+
+    # ---- Spatial index ----#
+
+    def _edges_within(self, centre, radius, frames):
+        """Candidate edges from the grid and the length of each inside the sphere."""
+        centre = np.asarray(centre, dtype=float)
+        frames = np.asarray(frames, dtype=np.int64)
+
+        # An edge is filed under its midpoint, so the search reaches half the longest edge further
+        reach = radius + 0.5 * float(self.max_edge_length)
+        lo = np.floor((centre - reach - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((centre + reach - self.origin) / self.cell_size).astype(np.int64)
+
+        axes = []
+        for dim in range(3):
+            coords = np.arange(lo[dim], hi[dim] + 1)
+            if self.periodic[dim]:
+                coords = np.unique(coords % self.n_cells[dim])
+            else:
+                coords = np.unique(np.clip(coords, 0, self.n_cells[dim] - 1))
+            axes.append(coords)
+
+        cells = np.array([cell_id(coords, self.n_cells) for coords in itertools.product(*axes)], dtype=np.int64)
+
+        keys = (frames[:, None] * self.n_cells_total + cells[None, :]).ravel()
+        starts = np.searchsorted(self.edge_key, keys, side='left')
+        ends = np.searchsorted(self.edge_key, keys, side='right')
+
+        counts = ends - starts
+        edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        return edges, self._inside_length(edges, centre, radius)
+
+    def _inside_length(self, edges, centre, radius):
+        """Length of each edge inside the sphere, using the periodic image nearest the centre."""
+        start = self.edge_start[edges]
+        vector = self.edge_vector[edges]
+
+        offset = start + 0.5 * vector - centre
+        image = np.where(self.periodic, np.round(offset / self.lengths), 0.0) * self.lengths
+        start = start - centre - image
+
+        # |start + t vector|^2 = radius^2, clipped to the edge (0 <= t <= 1)
+        a = np.einsum('ij,ij->i', vector, vector)
+        b = 2 * np.einsum('ij,ij->i', start, vector)
+        c = np.einsum('ij,ij->i', start, start) - radius**2
+
+        discriminant = b**2 - 4 * a * c
+        root = np.sqrt(np.maximum(discriminant, 0.0))
+        safe_a = np.where(a > 0, a, 1.0)
+
+        t_in = np.clip((-b - root) / (2 * safe_a), 0.0, 1.0)
+        t_out = np.clip((-b + root) / (2 * safe_a), 0.0, 1.0)
+
+        inside = np.where((discriminant > 0) & (a > 0), t_out - t_in, 0.0)
+        return inside * np.sqrt(a)
+
+# --------------------------- BUILDING ---------------------------#
+
+def build_database(ca_paths, output_path, timesteps=None, cell_size=GRID_CELL):
+    """
+    Parses every CA file in `ca_paths` (one frame each, in order) into a
+    single database at `output_path`. Timesteps default to the last number
+    in each file name.
+    """
+    if timesteps is None:
+        timesteps = [filename_step(path) for path in ca_paths]
+
+    frames = [parse_ca(path) for path in ca_paths]
+
+    segment_counts = np.array([len(frame['segment_id']) for frame in frames], dtype=np.int64)
+    segment_start = np.concatenate([[0], np.cumsum(segment_counts)])
+    segment_frame = np.repeat(np.arange(len(frames)), segment_counts)
+
+    def stack(name, shape, dtype):
+        parts = [frame[name] for frame in frames if len(frame[name])]
+        return np.concatenate(parts).astype(dtype) if parts else np.empty((0,) + shape, dtype=dtype)
+
+    segment_id = stack('segment_id', (), np.int64)
+    cluster = stack('cluster', (), np.int64)
+    burgers_local = stack('burgers_local', (3,), np.float64)
+    burgers_spatial = stack('burgers_spatial', (3,), np.float64)
+    point_counts = stack('point_count', (), np.int64)
+    points = stack('points', (3,), np.float64)
+
+    point_start = np.concatenate([[0], np.cumsum(point_counts)])
+
+    # Geometry of the grid from the first frame; every frame is binned on the same grid
+    origin = frames[0]['origin'] if frames else np.zeros(3)
+    lengths = np.diag(frames[0]['matrix']) if frames else np.ones(3)
+    periodic = frames[0]['pbc'] if frames else np.ones(3, dtype=bool)
+    n_cells = np.maximum((lengths // cell_size).astype(np.int64), 1)
+    grid_cell = lengths / n_cells
+
+    #--- Edges ---#
+    point_segment = np.repeat(np.arange(len(point_counts)), point_counts)
+    first = np.flatnonzero(point_segment[:-1] == point_segment[1:])
+
+    edge_start = points[first]
+    edge_vector = points[first + 1] - points[first]
+    edge_segment = point_segment[first]
+    edge_frame = segment_frame[edge_segment]
+    edge_length = np.linalg.norm(edge_vector, axis=1)
+
+    middle = edge_start + 0.5 * edge_vector
+    image = np.where(periodic, np.floor((middle - origin) / lengths), 0.0) * lengths
+    edge_start = edge_start - image
+    middle = middle - image
+
+    coords = np.floor((middle - origin) / grid_cell).astype(np.int64)
+    coords = np.clip(coords, 0, n_cells - 1)
+    edge_key = edge_frame * int(np.prod(n_cells)) + cell_id(coords.T, n_cells)
+
+    order = np.argsort(edge_key, kind='stable')
+
+    segment_length = np.bincount(edge_segment, weights=edge_length, minlength=len(segment_id))
+
+    arrays = {
+        'version': np.array(DB_VERSION),
+        'timestep': np.asarray(timesteps, dtype=np.int64),
+        'origin': origin,
+        'lengths': lengths,
+        'periodic': periodic,
+        'n_cells': n_cells,
+        'cell_size': grid_cell,
+        'segment_start': segment_start,
+        'segment_frame': segment_frame,
+        'segment_id': segment_id,
+        'cluster': cluster,
+        'burgers_local': burgers_local,
+        'burgers_spatial': burgers_spatial,
+        'segment_length': segment_length,
+        'point_start': point_start,
+        'points': points,
+        'edge_key': edge_key[order],
+        'edge_frame': edge_frame[order],
+        'edge_segment': edge_segment[order],
+        'edge_start': edge_start[order],
+        'edge_vector': edge_vector[order],
+        'max_edge_length': np.array(edge_length.max() if len(edge_length) else 0.0),
+    }
+
+    with open(output_path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(output_path + '.tmp', output_path)
+
+def parse_ca(path):
+    """
+    Reads the cell, cluster orientations and dislocation segments of one
+    OVITO crystal analysis (.ca) file. Points keep only x, y, z.
+    """
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()
+
+    origin = np.zeros(3)
+    matrix = np.eye(3)
+    pbc = np.ones(3, dtype=bool)
+    orientations = {}
+
+    segment_id, cluster, burgers, point_count, points = [], [], [], [], []
+
+    cluster_id = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if line.startswith('SIMULATION_CELL_ORIGIN'):
+            origin = np.array(line.split()[1:4], dtype=float)
+        elif line.startswith('SIMULATION_CELL_MATRIX'):
+            matrix = np.array([lines[i + k].split()[:3] for k in range(1, 4)], dtype=float)
+            i += 3
+        elif line.startswith('PBC_FLAGS'):
+            pbc = np.array([int(flag) for flag in line.split()[1:4]], dtype=bool)
+        elif line.startswith('CLUSTER '):
+            cluster_id = int(line.split()[1])
+        elif line.startswith('CLUSTER_ORIENTATION') and cluster_id is not None:
+            orientations[cluster_id] = np.array([lines[i + k].split()[:3] for k in range(1, 4)], dtype=float)
+            i += 3
+        elif line.startswith('DISLOCATIONS'):
+            n_segments = int(line.split()[1])
+            i += 1
+
+            for _ in range(n_segments):
+                segment_id.append(int(lines[i]))
+                burgers.append([float(value) for value in lines[i + 1].split()[:3]])
+                cluster.append(int(lines[i + 2]))
+                n_points = int(lines[i + 3])
+                i += 4
+
+                # Points are 'x y z' or 'x y z core_size'
+                values = np.array(' '.join(lines[i:i + n_points]).split(), dtype=float)
+                points.append(values.reshape(n_points, -1)[:, :3])
+                point_count.append(n_points)
+                i += n_points
+
+            break # Junctions and the defect mesh follow; they are not needed
+
+        i += 1
+
+    burgers_local = np.array(burgers, dtype=float).reshape(-1, 3)
+    burgers_spatial = np.array([orientations.get(c, np.eye(3)) @ b for c, b in zip(cluster, burgers_local)]).reshape(-1, 3)
+
+    return {
+        'origin': origin,
+        'matrix': matrix,
+        'pbc': pbc,
+        'segment_id': np.array(segment_id, dtype=np.int64),
+        'cluster': np.array(cluster, dtype=np.int64),
+        'burgers_local': burgers_local,
+        'burgers_spatial': burgers_spatial,
+        'point_count': np.array(point_count, dtype=np.int64),
+        'points': np.concatenate(points) if points else np.empty((0, 3)),
+    }
+
+# --------------------------- UTILITIES ---------------------------#
+
+def cell_id(coords, n_cells):
+    """Flat grid cell index of (x, y, z) cell coordinates."""
+    return (coords[0] * n_cells[1] + coords[1]) * n_cells[2] + coords[2]
+
+def filename_step(path):
+    """Last number in a file name, e.g. 1000 for 'dumpfile_1000'."""
+    numbers = re.findall(r'\d+', os.path.basename(path))
+    return int(numbers[-1]) if numbers else -1
@@ -0,0 +1,126 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+# --------------------------- CONFIG ---------------------------#
+
+CORE_THRESHOLD = -4.0 # Atoms above this energy (eV) count as core atoms
+N_X_BINS = 200 # Histogram bins along the glide direction
+N_Z_SLICES = 40 # Slices along the line direction, one profile point each
+GLIDE_WINDOW = 6.0 # Half-thickness (Angstrom) of the slab around the glide plane that core atoms must lie in
+
+# --------------------------- TRACKER ---------------------------#
+
+class LineProfile:
+    """
+    Position of the dislocation along x in each z-slice of one frame.
+
+    `x` is the circular mean of the core atoms' x in each slice (NaN for a
+    slice without core atoms), `counts` the number of core atoms per slice
+    and `histogram` the (z-slice, x-bin) counts the profile came from.
+    """
+
+    def __init__(self, timestep, z_centres, x, counts, histogram, glide_y, box_x):
+        self.timestep = timestep
+        self.z_centres = z_centres
+        self.x = x
+        self.counts = counts
+        self.histogram = histogram
+        self.glide_y = glide_y
+        self.box_x = box_x
+
+    @property
+    def mean_x(self):
+        """Circular mean of the slice positions, weighted by their core atom counts."""
+        return circular_mean(self.x[self.counts > 0], self.box_x, self.counts[self.counts > 0])
+
+    @property
+    def bow(self):
+        """Spread of the line along x: largest minus smallest slice offset from the mean."""
+        offsets = minimum_image(self.x[self.counts > 0] - self.mean_x, self.box_x[1] - self.box_x[0])
+        return float(offsets.max() - offsets.min()) if len(offsets) else np.nan
+
+def track(frame, threshold=CORE_THRESHOLD, n_x_bins=N_X_BINS, n_z_slices=N_Z_SLICES, glide_window=GLIDE_WINDOW, exclude=None):
+    """
+    Returns the LineProfile of one DumpFrame with x, y, z and c_peratom.
+
+    Core atoms are those above `threshold` and, if given, not in the boolean
+    mask `exclude` (e.g. the precipitate). Only those within `glide_window`
+    of the glide plane, taken as the median y of the core atoms, are used,
+    so surface or precipitate-interface atoms elsewhere do not pull the
+    profile. Every step is a whole-array NumPy operation.
+    """
+    atoms = frame.atoms
+    box = np.asarray(frame.box_bounds)[:, :2]
+
+    core = atoms['c_peratom'] > threshold
+    if exclude is not None:
+        core &= ~exclude
+
+    glide_y = float(np.median(atoms['y'][core])) if core.any() else np.nan
+    core &= np.abs(atoms['y'] - glide_y) <= glide_window
+
+    x = atoms['x'][core]
+    z = atoms['z'][core]
+
+    x_length = box[0, 1] - box[0, 0]
+    z_length = box[2, 1] - box[2, 0]
+
+    x_bin = np.clip(((x - box[0, 0]) / x_length * n_x_bins).astype(np.int64), 0, n_x_bins - 1)
+    z_slice = np.clip(((z - box[2, 0]) / z_length * n_z_slices).astype(np.int64), 0, n_z_slices - 1)
+
+    histogram = np.bincount(z_slice * n_x_bins + x_bin, minlength=n_z_slices * n_x_bins).reshape(n_z_slices, n_x_bins)
+
+    # Circular mean per slice, so a core straddling the periodic x boundary is not averaged to the box centre
+    angle = 2 * np.pi * (x - box[0, 0]) / x_length
+    cos_sum = np.bincount(z_slice, weights=np.cos(angle), minlength=n_z_slices)
+    sin_sum = np.bincount(z_slice, weights=np.sin(angle), minlength=n_z_slices)
+    counts = np.bincount(z_slice, minlength=n_z_slices)
+
+    position = box[0, 0] + (np.arctan2(sin_sum, cos_sum) % (2 * np.pi)) * x_length / (2 * np.pi)
+    position[counts == 0] = np.nan
+
+    z_centres = box[2, 0] + (np.arange(n_z_slices) + 0.5) * z_length / n_z_slices
+
+    return LineProfile(frame.timestep, z_centres, position, counts, histogram, glide_y, box[0])
+
+def select_frames(profiles, displacement, bow_change, every=None):
+    """
+    Indexes of the frames worth a full DXA: the first and last, and every
+    frame where the mean position has moved by more than `displacement`
+    or the bow has changed by more than `bow_change` since the last
+    selected frame, plus every `every`-th frame if given.
+    """
+    if not profiles:
+        return []
+
+    selected = [0]
+    for index, profile in enumerate(profiles[1:], start=1):
+        last = profiles[selected[-1]]
+        length = profile.box_x[1] - profile.box_x[0]
+
+        moved = abs(minimum_image(profile.mean_x - last.mean_x, length)) > displacement
+        bowed = abs(profile.bow - last.bow) > bow_change
+        scheduled = every is not None and index % every == 0
+
+        # A frame without any core atoms has NaN positions and is never selected by movement
+        if moved or bowed or scheduled:
+            selected.append(index)
+
+    if selected[-1] != len(profiles) - 1:
+        selected.append(len(profiles) - 1)
+
+    return selected
+
+# --------------------------- UTILITIES ---------------------------#
+
+def circular_mean(x, box_x, weights=None):
+    """Mean of periodic coordinates in [box_x[0], box_x[1]); NaN for no values."""
+    if len(x) == 0:
+        return np.nan
+    length = box_x[1] - box_x[0]
+    angle = 2 * np.pi * (np.asarray(x) - box_x[0]) / length
+    mean_angle = np.arctan2(np.average(np.sin(angle), weights=weights), np.average(np.cos(angle), weights=weights))
+    return float(box_x[0] + (mean_angle % (2 * np.pi)) * length / (2 * np.pi))
+
+def minimum_image(dx, length):
+    return dx - length * np.round(dx / length)
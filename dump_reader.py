@@ -0,0 +1,450 @@
+# --------------------------- LIBRARIES ---------------------------#
+import io
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --------------------------- CONFIG ---------------------------#
+
+# Columns LAMMPS writes as integers; every other column is read as a float
+INTEGER_COLUMNS = ('id', 'type', 'mol', 'proc', 'procp1')
+
+N_THREADS = int(os.environ.get('OMP_NUM_THREADS', 1))
+MIN_CHUNK_BYTES = 4 * 1024 * 1024 # Atom blocks smaller than this are parsed in one go
+
+# Compressed dumps are recognised by suffix: '.gz' (LAMMPS custom/gz or block gzip) and '.zst' (LAMMPS custom/zstd)
+GZIP_LEVEL = 6
+GZIP_BLOCK_BYTES = 4 * 1024 * 1024 # Uncompressed size of each independently compressed gzip member
+GZIP_BLOCK_FIELD = b'DP' # Extra-field ID holding each member's compressed size, so members can be found without inflating
+ZSTD_LEVEL = 3
+
+PREFETCH_DEPTH = 2 # Files read ahead by prefetch_dumps
+HEADER_BYTES = 64 * 1024 # Read (and decompressed) from the start of a file by read_header
+
+# A partitioned frame is a small JSON stub, named like an ordinary dump, listing the per-group pieces LAMMPS wrote
+PARTITION_FORMAT = 'partitioned-dump'
+PARTITION_MAGIC = b'{"format": "partitioned-dump"'
+
+# --------------------------- READER ---------------------------#
+
+class DumpFile:
+    """
+    Memory-mapped LAMMPS text dump.
+
+    The `ITEM:` headers of every frame are indexed once when the file is
+    opened; atom data is only parsed when a frame is read, and only for
+    the requested columns. Compressed dumps ('.gz', '.zst') are inflated
+    into memory first, block gzip members in parallel.
+    """
+
+    def __init__(self, path, n_threads=N_THREADS):
+        self.path = path
+
+        if compression_of(path) is None:
+            with open(path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = read_compressed(path, n_threads)
+
+        self.frames = index_frames(self._buffer)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def read(self, frame=0, columns=None, n_threads=N_THREADS):
+        """Returns a DumpFrame holding the selected columns of one frame."""
+        header = self.frames[frame]
+        dtype, usecols = column_dtype(header['columns'], columns)
+
+        atoms = parse_atoms(self._buffer, header['data_start'], header['data_end'], dtype, usecols, n_threads)
+
+        if len(atoms) != header['n_atoms']:
+            raise ValueError(f"{self.path}: expected {header['n_atoms']} atoms in frame {frame}, found {len(atoms)}")
+
+        return DumpFrame(header['timestep'], header['box_bounds'], header['box_flags'], atoms)
+
+class DumpFrame:
+    """A single dump frame: timestep, box and a structured array of atoms."""
+
+    def __init__(self, timestep, box_bounds, box_flags, atoms):
+        self.timestep = timestep
+        self.box_bounds = box_bounds
+        self.box_flags = box_flags
+        self.atoms = atoms
+
+    @property
+    def n_atoms(self):
+        return len(self.atoms)
+
+    @property
+    def columns(self):
+        return list(self.atoms.dtype.names)
+
+def read_dump(path, columns=None, frame=0, n_threads=N_THREADS):
+    """Reads one frame of a LAMMPS dump file, keeping only `columns`."""
+    if is_partitioned(path):
+        return read_partitioned(path, columns, n_threads)
+
+    with DumpFile(path, n_threads) as dump:
+        return dump.read(frame, columns, n_threads)
+
+def iter_dump(path, columns=None, n_threads=N_THREADS):
+    """Yields every frame of a LAMMPS dump file in order."""
+    if is_partitioned(path):
+        yield read_partitioned(path, columns, n_threads)
+        return
+
+    with DumpFile(path, n_threads) as dump:
+        for frame in range(len(dump)):
+            yield dump.read(frame, columns, n_threads)
+
+def read_header(path):
+    """
+    Returns the `ITEM:` header of the first frame (timestep, n_atoms,
+    box_bounds, box_flags, columns) without reading the atoms. For a
+    partitioned frame n_atoms is the total over its pieces.
+    """
+    if is_partitioned(path):
+        pieces = [read_header(piece) for piece in partition_paths(path)]
+        header = pieces[0]
+        header['n_atoms'] = sum(piece['n_atoms'] for piece in pieces)
+        return header
+
+    compression = compression_of(path)
+
+    with open(path, 'rb') as f:
+        if compression == 'zst':
+            head = zstd_module().ZstdDecompressor().stream_reader(f).read(HEADER_BYTES)
+        elif compression == 'gz':
+            head = zlib.decompressobj(wbits=31).decompress(f.read(HEADER_BYTES), HEADER_BYTES)
+        else:
+            head = f.read(HEADER_BYTES)
+
+    header = index_frames(head)[0]
+    for key in ('data_start', 'data_end'):
+        del header[key]
+
+    return header
+
+def index_dumps(paths):
+    """Timestep and atom count of the first frame of each file, read from the headers only."""
+    index = np.empty(len(paths), dtype=[('timestep', np.int64), ('n_atoms', np.int64)])
+    for i, path in enumerate(paths):
+        header = read_header(path)
+        index[i] = (header['timestep'], header['n_atoms'])
+    return index
+
+def prefetch_dumps(paths, columns=None, depth=PREFETCH_DEPTH, n_threads=N_THREADS):
+    """
+    Yields the first frame of each file in `paths`, in order, while the next
+    `depth` files are read and decompressed on a background thread.
+    """
+    paths = iter(paths)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = deque(pool.submit(read_dump, path, columns, 0, n_threads) for _, path in zip(range(depth), paths))
+
+        while pending:
+            frame = pending.popleft().result()
+
+            path = next(paths, None)
+            if path is not None:
+                pending.append(pool.submit(read_dump, path, columns, 0, n_threads))
+
+            yield frame
+
+# --------------------------- PARTITIONED DUMPS ---------------------------#
+
+def is_partitioned(path):
+    """True if `path` is a partition stub rather than a dump."""
+    with open(path, 'rb') as f:
+        return f.read(len(PARTITION_MAGIC)) == PARTITION_MAGIC
+
+def partition_paths(path):
+    """Paths of the pieces of a partitioned frame, relative to the stub's directory."""
+    with open(path, 'r') as f:
+        stub = json.load(f)
+    return [os.path.join(os.path.dirname(path), piece) for piece in stub['partitions']]
+
+def iter_partitions(path, columns=None, n_threads=N_THREADS):
+    """
+    Yields each piece of a frame as its own DumpFrame (an ordinary dump
+    yields itself), for analyses that do not need the whole frame at once.
+    """
+    paths = partition_paths(path) if is_partitioned(path) else [path]
+    yield from prefetch_dumps(paths, columns, n_threads=n_threads)
+
+def read_partitioned(path, columns=None, n_threads=N_THREADS):
+    """Reassembles a partitioned frame, reading its pieces on up to n_threads threads."""
+    paths = partition_paths(path)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(n_threads, len(paths)))) as pool:
+        pieces = list(pool.map(lambda piece: read_dump(piece, columns, n_threads=1), paths))
+
+    first = pieces[0]
+    return DumpFrame(first.timestep, first.box_bounds, first.box_flags, np.concatenate([piece.atoms for piece in pieces]))
+
+def write_partition_stub(path, partitions):
+    """Writes the stub for one partitioned frame; `partitions` are paths relative to the stub."""
+    stub = {'format': PARTITION_FORMAT, 'partitions': list(partitions)}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(stub, f)
+    os.replace(path + '.tmp', path)
+
+# --------------------------- WRITER ---------------------------#
+
+def write_dump(path, frame, columns=None, float_format='%.6f', n_threads=N_THREADS):
+    """Writes a DumpFrame (or the selected columns of it) as a LAMMPS text dump, compressed if `path` ends in .gz or .zst."""
+    columns = columns or frame.columns
+    atoms = frame.atoms[columns]
+
+    fmt = ['%d' if atoms.dtype[name].kind in 'iu' else float_format for name in columns]
+    header = format_header(frame.timestep, len(atoms), frame.box_bounds, frame.box_flags, columns)
+
+    compression = compression_of(path)
+
+    if compression is None:
+        with open(path, 'w') as f:
+            f.write(header)
+            np.savetxt(f, atoms, fmt=fmt)
+        return
+
+    text = io.BytesIO()
+    text.write(header.encode('ascii'))
+    np.savetxt(text, atoms, fmt=fmt)
+
+    with open(path, 'wb') as f:
+        f.write(compress(text.getbuffer(), compression, n_threads))
+
+def format_header(timestep, n_atoms, box_bounds, box_flags, columns):
+    """Returns the `ITEM:` header block for one dump frame."""
+    lines = ["ITEM: TIMESTEP", str(timestep), "ITEM: NUMBER OF ATOMS", str(n_atoms)]
+
+    lines.append(f"ITEM: BOX BOUNDS {' '.join(box_flags)}")
+    lines.extend(' '.join(f"{value:.16e}" for value in bounds) for bounds in box_bounds)
+
+    lines.append(f"ITEM: ATOMS {' '.join(columns)}")
+
+    return '\n'.join(lines) + '\n'
+
+# --------------------------- COMPRESSION ---------------------------#
+
+def compression_of(path):
+    """Returns 'gz', 'zst' or None from a file's suffix."""
+    if path.endswith('.gz'):
+        return 'gz'
+    if path.endswith('.zst'):
+        return 'zst'
+    return None
+
+def strip_compression(filename):
+    """Filename without a '.gz' or '.zst' suffix."""
+    compression = compression_of(filename)
+    return filename[:-len(compression) - 1] if compression else filename
+
+def read_compressed(path, n_threads=N_THREADS):
+    """Returns the decompressed contents of a .gz or .zst file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if compression_of(path) == 'zst':
+        return zstd_module().ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True).readall()
+
+    members = gzip_members(data)
+
+    # Block gzip written by write_dump: every member inflates independently (zlib releases the GIL)
+    if members is not None and len(members) > 1 and n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            view = memoryview(data)
+            return b''.join(pool.map(lambda span: zlib.decompress(view[span[0]:span[1]], wbits=31), members))
+
+    # A single stream (LAMMPS custom/gz) or members without a size field
+    blocks = []
+    while data:
+        inflater = zlib.decompressobj(wbits=31)
+        blocks.append(inflater.decompress(data))
+        data = inflater.unused_data
+    return b''.join(blocks)
+
+def compress(data, compression, n_threads=N_THREADS):
+    """Compresses `data` as block gzip ('gz') or zstd ('zst')."""
+    if compression == 'zst':
+        return zstd_module().ZstdCompressor(level=ZSTD_LEVEL, threads=n_threads if n_threads > 1 else 0).compress(data)
+
+    data = memoryview(data)
+    blocks = [data[start:start + GZIP_BLOCK_BYTES] for start in range(0, len(data), GZIP_BLOCK_BYTES)] or [data]
+
+    with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as pool:
+        return b''.join(pool.map(gzip_member, blocks))
+
+def gzip_member(block):
+    """One gzip member whose extra field records its own compressed size (as BGZF does)."""
+    deflater = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -15)
+    body = deflater.compress(block) + deflater.flush()
+
+    size = 20 + len(body) + 8
+    header = (b'\x1f\x8b\x08\x04' + b'\0' * 4 + b'\0\xff'
+              + struct.pack('<H', 8) + GZIP_BLOCK_FIELD + struct.pack('<HI', 4, size))
+
+    return header + body + struct.pack('<II', zlib.crc32(block), len(block) & 0xffffffff)
+
+def gzip_members(data):
+    """Byte spans of the gzip members in `data`, or None if any member lacks the size field."""
+    members = []
+    pos = 0
+
+    while pos < len(data):
+        if data[pos:pos + 3] != b'\x1f\x8b\x08' or not data[pos + 3] & 0x04:
+            return None
+
+        xlen, = struct.unpack_from('<H', data, pos + 10)
+        extra = data[pos + 12:pos + 12 + xlen]
+
+        size = None
+        offset = 0
+        while offset + 4 <= len(extra):
+            field, field_len = extra[offset:offset + 2], struct.unpack_from('<H', extra, offset + 2)[0]
+            if field == GZIP_BLOCK_FIELD and field_len == 4:
+                size, = struct.unpack_from('<I', extra, offset + 4)
+            offset += 4 + field_len
+
+        if size is None:
+            return None
+
+        members.append((pos, pos + size))
+        pos += size
+
+    return members
+
+def zstd_module():
+    if zstandard is None:
+        raise ImportError("Reading or writing .zst dumps requires the 'zstandard' package")
+    return zstandard
+
+# --------------------------- UTILITIES ---------------------------#
+
+def index_frames(buffer):
+    """Parses the `ITEM:` headers of every frame in a dump buffer."""
+    frames = []
+    pos = 0
+    size = len(buffer)
+
+    while pos < size:
+        header = {'timestep': None, 'n_atoms': None, 'box_bounds': None, 'box_flags': None, 'columns': None}
+
+        while header['columns'] is None:
+            line, pos = read_line(buffer, pos)
+
+            if pos > size and not line:
+                raise ValueError(f"Truncated dump header at byte {pos}")
+
+            if line.startswith('ITEM: TIMESTEP'):
+                value, pos = read_line(buffer, pos)
+                header['timestep'] = int(value)
+            elif line.startswith('ITEM: NUMBER OF ATOMS'):
+                value, pos = read_line(buffer, pos)
+                header['n_atoms'] = int(value)
+            elif line.startswith('ITEM: BOX BOUNDS'):
+                bounds = []
+                for _ in range(3):
+                    value, pos = read_line(buffer, pos)
+                    bounds.append([float(v) for v in value.split()])
+                header['box_bounds'] = np.array(bounds)
+                header['box_flags'] = line.split()[3:]
+            elif line.startswith('ITEM: ATOMS'):
+                header['columns'] = line.split()[2:]
+            elif line.startswith('ITEM:'):
+                _, pos = read_line(buffer, pos) # Skip optional items such as UNITS or TIME
+
+        header['data_start'] = pos
+
+        next_frame = buffer.find(b'ITEM: TIMESTEP', pos)
+        pos = size if next_frame == -1 else next_frame
+        header['data_end'] = pos
+
+        frames.append(header)
+
+    return frames
+
+def read_line(buffer, pos):
+    """Returns the stripped line starting at `pos` and the offset of the next line."""
+    end = buffer.find(b'\n', pos)
+    if end == -1:
+        end = len(buffer)
+    return buffer[pos:end].decode('ascii').strip(), end + 1
+
+def column_dtype(file_columns, columns=None):
+    """Builds the structured dtype and `usecols` for a column selection."""
+    columns = list(columns) if columns is not None else list(file_columns)
+
+    missing = [name for name in columns if name not in file_columns]
+    if missing:
+        raise KeyError(f"Columns {missing} not found in dump (available: {file_columns})")
+
+    dtype = np.dtype([(name, np.int64 if name in INTEGER_COLUMNS else np.float64) for name in columns])
+    usecols = [file_columns.index(name) for name in columns]
+
+    return dtype, usecols
+
+def parse_atoms(buffer, start, end, dtype, usecols, n_threads=N_THREADS):
+    """Parses the atom lines in buffer[start:end] into a structured array."""
+    # A frame with no atoms (e.g. an empty partition piece or defect output) has no lines to split
+    if start >= end:
+        return np.empty(0, dtype=dtype)
+
+    bounds = split_lines(buffer, start, end, n_threads)
+
+    def parse(span):
+        text = buffer[span[0]:span[1]].decode('ascii')
+        if not text or text.isspace():
+            return np.empty(0, dtype=dtype)
+        return np.loadtxt(io.StringIO(text), dtype=dtype, usecols=usecols, ndmin=1)
+
+    spans = list(zip(bounds[:-1], bounds[1:]))
+
+    if not spans:
+        return np.empty(0, dtype=dtype)
+    if len(spans) == 1:
+        return parse(spans[0])
+
+    with ThreadPoolExecutor(max_workers=len(spans)) as pool:
+        return np.concatenate(list(pool.map(parse, spans)))
+
+def split_lines(buffer, start, end, n_chunks):
+    """Splits buffer[start:end] into at most n_chunks line-aligned spans."""
+    n_chunks = max(1, min(n_chunks, (end - start) // MIN_CHUNK_BYTES))
+    step = (end - start) // n_chunks
+
+    bounds = [start]
+    for i in range(1, n_chunks):
+        cut = buffer.find(b'\n', start + i * step, end)
+        if cut == -1:
+            break
+        if cut + 1 > bounds[-1]:
+            bounds.append(cut + 1)
+
+    if bounds[-1] != end:
+        bounds.append(end)
+
+    return bounds
@@ -0,0 +1,79 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+# --------------------------- ALIGNMENT ---------------------------#
+
+class IDAlignment:
+    """
+    Puts the atoms of successive frames in one reference order.
+
+    The reference is `reference_ids`, or if not given the ascending IDs of
+    the first frame seen. The permutation from a frame's rows to the
+    reference is built once with a dense ID table (no sorting) and kept:
+    the next frame is only compared against the last IDs seen, and while
+    the dump order does not change the kept permutation is reused. When a
+    frame is already in reference order, as for ID-sorted dumps, no
+    permutation is applied at all.
+
+    Every frame must hold exactly the reference atoms.
+    """
+
+    def __init__(self, reference_ids=None):
+        self.reference_ids = None if reference_ids is None else np.asarray(reference_ids)
+        self.rebuilds = 0
+        self._ids = None
+        self._order = None
+
+    def order(self, ids):
+        """Rows of `ids` in reference order, or None if they already are."""
+        ids = np.asarray(ids)
+
+        if self.reference_ids is None:
+            self.reference_ids = ids[id_order(ids)]
+
+        if self._ids is not None and np.array_equal(ids, self._ids):
+            return self._order
+
+        self._order = None if np.array_equal(ids, self.reference_ids) else permutation(self.reference_ids, ids)
+        self._ids = ids.copy()
+        self.rebuilds += 1
+
+        return self._order
+
+    def align(self, atoms, key='id'):
+        """`atoms` (a structured array) in reference order; the same array if it already is."""
+        order = self.order(atoms[key])
+        return atoms if order is None else atoms[order]
+
+# --------------------------- UTILITIES ---------------------------#
+
+def id_order(ids):
+    """Rows of `ids` in ascending ID order, by a counting sort over the ID range."""
+    ids = np.asarray(ids)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    table = np.full(ids.max() + 1, -1, dtype=np.int64)
+    table[ids] = np.arange(len(ids))
+    order = table[table >= 0]
+
+    if len(order) != len(ids):
+        raise ValueError("Atom IDs are not unique")
+
+    return order
+
+def permutation(reference_ids, ids):
+    """Rows of `ids` such that ids[rows] == reference_ids."""
+    if len(ids) != len(reference_ids):
+        raise ValueError(f"Frame has {len(ids)} atoms, the reference {len(reference_ids)}")
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    table = np.full(max(ids.max(), reference_ids.max()) + 1, -1, dtype=np.int64)
+    table[ids] = np.arange(len(ids))
+    rows = table[reference_ids]
+
+    if (rows < 0).any():
+        raise ValueError("Frame does not hold the same atoms as the reference")
+
+    return rows
@@ -0,0 +1,579 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+
+import numpy as np
+from lammps import LMP_STYLE_ATOM, LMP_STYLE_GLOBAL, LMP_TYPE_ARRAY, LMP_TYPE_VECTOR, LMP_VAR_ATOM
+from mpi4py import MPI
+
+from id_alignment import id_order
+from timeseries import TimeSeriesWriter
+from trajectory import TrajectoryWriter
+
+# --------------------------- REGISTRY ---------------------------#
+
+class InsituRegistry:
+    """
+    Runs registered Python hooks every `hook.every` steps of an MD run.
+
+    The run is split into segments that end on the next step a hook is due
+    (`run N pre no post no`, so neighbour lists and fixes are not rebuilt
+    between segments) and the due hooks are called with a LocalState giving
+    zero-copy NumPy views of each rank's atoms. Hooks that need per-atom
+    compute values list them in `hook.peratom`; a `fix ave/atom 1 1 every`
+    is defined for them so the values are current on the steps the hook runs.
+
+    `resume_from` is the timestep a resumed run restarts at; hook outputs
+    from the earlier job are kept up to that step. With `restart_every`,
+    the registry writes the restart files itself (`write_restart`, with a
+    '*' in `restart_path` replaced by the timestep, as `restart` does),
+    each one only after every hook has flushed its output, so a run
+    resumed from any restart file continues the hook outputs without a gap.
+    """
+
+    def __init__(self, lmp, comm, resume_from=None, restart_every=None, restart_path=None):
+        self.lmp = lmp
+        self.comm = comm
+        self.resume_from = resume_from
+        self.restart_every = restart_every
+        self.restart_path = restart_path
+        self.hooks = []
+        self.fix_ids = []
+        self.group_variables = {}
+
+    def register(self, L, hook):
+        """Adds a hook; must be called after the computes it reads are defined."""
+        fix_id = None
+        if hook.peratom:
+            fix_id = f"insitu_{len(self.hooks)}"
+            L.fix(fix_id, 'all', 'ave/atom', 1, 1, hook.every, *hook.peratom)
+
+        hook.open(self.comm, self.resume_from)
+
+        self.hooks.append(hook)
+        self.fix_ids.append(fix_id)
+
+    def run(self, L, n_steps, upto=False):
+        """Equivalent of `run n_steps [upto]`, with the registered hooks called on their steps."""
+        if upto:
+            n_steps -= self.lmp.extract_global('ntimestep')
+
+        if not self.hooks and not self.restart_every:
+            L.run(n_steps)
+            return
+
+        # Set up once, so hooks due on the first step see the initial configuration
+        L.run(0)
+        self.call_hooks()
+
+        steps_done = 0
+        while steps_done < n_steps:
+            timestep = self.lmp.extract_global('ntimestep')
+            intervals = [hook.every for hook in self.hooks] + ([self.restart_every] if self.restart_every else [])
+            next_due = min(timestep + every - timestep % every for every in intervals)
+
+            segment = min(next_due - timestep, n_steps - steps_done)
+            steps_done += segment
+
+            L.run(segment, 'pre', 'no', 'post', 'yes' if steps_done == n_steps else 'no')
+            self.call_hooks()
+
+            if self.restart_every and self.lmp.extract_global('ntimestep') % self.restart_every == 0:
+                self.write_restart(L)
+
+    def call_hooks(self):
+        timestep = self.lmp.extract_global('ntimestep')
+
+        for hook, fix_id in zip(self.hooks, self.fix_ids):
+            if timestep % hook.every == 0:
+                hook(LocalState(self.lmp, self.comm, self.group_variables, fix_id, hook.peratom))
+
+    def write_restart(self, L):
+        for hook in self.hooks:
+            hook.flush()
+        L.write_restart(self.restart_path)
+
+    def close(self):
+        for hook in self.hooks:
+            hook.close(self.comm)
+
+class LocalState:
+    """
+    Atoms owned by this rank at the current step.
+
+    Arrays are views into LAMMPS memory and are only valid until the next
+    run segment; hooks must copy anything they want to keep.
+    """
+
+    def __init__(self, lmp, comm, group_variables, fix_id=None, peratom=()):
+        self.lmp = lmp
+        self.comm = comm
+        self.group_variables = group_variables
+        self.fix_id = fix_id
+        self.peratom_names = list(peratom)
+
+        self.nlocal = lmp.extract_global('nlocal')
+        self.timestep = lmp.extract_global('ntimestep')
+
+        box = lmp.extract_box()
+        self.box_lo = np.array(box[0])
+        self.box_hi = np.array(box[1])
+        self.periodic = np.array(box[5], dtype=bool)
+
+    def atom(self, name):
+        """Per-atom property such as 'x', 'f', 'v' or 'id' for local atoms."""
+        return self.lmp.numpy.extract_atom(name)[:self.nlocal]
+
+    def peratom(self, name):
+        """Current value of one of the hook's `peratom` compute references for local atoms."""
+        if len(self.peratom_names) == 1:
+            return self.lmp.numpy.extract_fix(self.fix_id, LMP_STYLE_ATOM, LMP_TYPE_VECTOR)[:self.nlocal]
+
+        values = self.lmp.numpy.extract_fix(self.fix_id, LMP_STYLE_ATOM, LMP_TYPE_ARRAY)[:self.nlocal]
+        return values[:, self.peratom_names.index(name)]
+
+    def group_mask(self, group):
+        """
+        Boolean mask of the local atoms in `group`, evaluated by LAMMPS through
+        an atom-style `gmask(group)` variable rather than from the group's
+        mask bit, whose position cannot be read reliably from Python.
+
+        The variable is defined on first use, so every rank must ask for the
+        same groups in the same order (all hooks do).
+        """
+        name = self.group_variables.get(group)
+        if name is None:
+            name = f"insitu_group_{len(self.group_variables)}"
+            self.lmp.command(f"variable {name} atom gmask({group})")
+            self.group_variables[group] = name
+
+        return self.lmp.numpy.extract_variable(name, 'all', LMP_VAR_ATOM)[:self.nlocal] != 0
+
+    def allreduce(self, value, op=MPI.SUM):
+        return self.comm.allreduce(value, op=op)
+
+# --------------------------- HOOKS ---------------------------#
+
+class Hook:
+    """
+    Base in-situ hook: observables are reduced across ranks in `__call__`
+    and stored with `record()` on rank 0. Each record is appended to the
+    hook's RecordJournal as it is made, and the journal is saved as one
+    .npz per hook at the end of the run (one array per observable, first
+    axis over the sampled steps). Arrays in `constants` are saved
+    alongside unchanged. A job that is killed leaves its records in the
+    journal; the resumed run continues it and writes the .npz.
+    """
+
+    peratom = []
+
+    def __init__(self, every, output_path=None):
+        self.every = every
+        self.output_path = output_path
+        self.journal = None
+        self.constants = {}
+
+    def __call__(self, state):
+        raise NotImplementedError
+
+    def open(self, comm, resume_from=None):
+        """Called on registration; opens the journal on rank 0, continuing it after `resume_from` if given."""
+        if comm.Get_rank() != 0 or self.output_path is None:
+            return
+
+        self.journal = RecordJournal(journal_path(self.output_path), resume_from)
+
+        # The earlier job recorded every step before the restart, unless it lost some
+        if resume_from is not None:
+            expected = (resume_from - 1) // self.every * self.every
+            report_gap(self.journal.path, self.journal.last_timestep, expected, resume_from)
+
+    def record(self, state, **values):
+        if self.journal is not None:
+            self.journal.append(state.timestep, values)
+
+    def flush(self):
+        """Writes out any buffered output; called before each restart file is written."""
+        return None
+
+    def close(self, comm):
+        if self.journal is None:
+            return
+
+        self.journal.close()
+        np.savez(self.output_path, **read_records(self.journal.path), **self.constants)
+
+class PrecipitateContact(Hook):
+    """
+    Counts high-energy (defect) atoms outside the precipitate within `shell`
+    of its surface; a non-zero count means the dislocation touches it.
+    """
+
+    peratom = ['c_peratom']
+
+    def __init__(self, every, centre, radius, shell, threshold, group='precipitate', output_path=None):
+        super().__init__(every, output_path)
+        self.centre = np.asarray(centre, dtype=float)
+        self.radius = radius
+        self.shell = shell
+        self.threshold = threshold
+        self.group = group
+
+    def __call__(self, state):
+        delta = state.atom('x') - self.centre
+        lengths = state.box_hi - state.box_lo
+        for dim in np.flatnonzero(state.periodic):
+            delta[:, dim] -= lengths[dim] * np.round(delta[:, dim] / lengths[dim])
+
+        distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+        in_shell = (distance < self.radius + self.shell) & ~state.group_mask(self.group)
+        count = state.allreduce(int(np.count_nonzero(in_shell & (state.peratom('c_peratom') > self.threshold))))
+
+        self.record(state, contact_atoms=count, contact=count > 0)
+
+class DislocationPosition(Hook):
+    """
+    Proxy for the dislocation glide position: the circular mean of x over
+    atoms whose energy exceeds `threshold`, so a core that wraps across the
+    periodic x boundary is still located correctly.
+    """
+
+    peratom = ['c_peratom']
+
+    def __init__(self, every, threshold, group='mobile_atoms', output_path=None):
+        super().__init__(every, output_path)
+        self.threshold = threshold
+        self.group = group
+
+    def __call__(self, state):
+        core = state.group_mask(self.group) & (state.peratom('c_peratom') > self.threshold)
+
+        length = state.box_hi[0] - state.box_lo[0]
+        angle = 2 * np.pi * (state.atom('x')[core, 0] - state.box_lo[0]) / length
+
+        local = np.array([np.cos(angle).sum(), np.sin(angle).sum(), np.count_nonzero(core)])
+        total = np.zeros_like(local)
+        state.comm.Allreduce(local, total, op=MPI.SUM)
+
+        mean_angle = np.arctan2(total[1], total[0]) % (2 * np.pi)
+        position = state.box_lo[0] + mean_angle * length / (2 * np.pi) if total[2] else np.nan
+
+        self.record(state, x=position, n_core_atoms=int(total[2]))
+
+class EnergyHistogram(Hook):
+    """Histogram of per-atom potential energy, summed over ranks on rank 0."""
+
+    peratom = ['c_peratom']
+
+    def __init__(self, every, bins, group='all', output_path=None):
+        super().__init__(every, output_path)
+        self.bins = np.asarray(bins, dtype=float)
+        self.group = group
+        self.constants['bins'] = self.bins
+
+    def __call__(self, state):
+        energies = state.peratom('c_peratom')
+        if self.group != 'all':
+            energies = energies[state.group_mask(self.group)]
+
+        local, _ = np.histogram(energies, bins=self.bins)
+        total = np.zeros_like(local) if state.comm.Get_rank() == 0 else None
+        state.comm.Reduce(local, total, op=MPI.SUM, root=0)
+
+        self.record(state, counts=total)
+
+class TrajectoryHook(Hook):
+    """
+    Gathers positions and per-atom values onto rank 0 and appends them as one
+    frame of a binary trajectory (see trajectory.py). With `select`, only the
+    atoms it picks are written (see defect_selection); with `sort`, atoms are
+    written in ascending ID order.
+    """
+
+    def __init__(self, comm, every, path, box_flags, peratom, float32_positions=True, resume_from=None, select=None, sort=False):
+        super().__init__(every)
+        self.peratom = list(peratom)
+        self.select = select
+        self.sort = sort
+
+        position_dtype = np.float32 if float32_positions else np.float64
+        self.dtypes = {'id': np.int64, 'x': position_dtype, 'y': position_dtype, 'z': position_dtype}
+        self.dtypes.update({name: np.float64 for name in self.peratom})
+
+        self.writer = None
+        if comm.Get_rank() == 0:
+            self.writer = TrajectoryWriter(path, list(self.dtypes.items()), box_flags, resume_from=resume_from)
+
+    def __call__(self, state):
+        arrays = gather_frame(state, self.dtypes, self.peratom, self.select, self.sort)
+
+        if self.writer is not None:
+            self.writer.append(state.timestep, np.column_stack([state.box_lo, state.box_hi]), arrays)
+
+    def close(self, comm):
+        if self.writer is not None:
+            self.writer.close()
+
+class TimeSeriesHook(Hook):
+    """
+    Appends the global vector of a `fix ave/time` to a binary time series
+    (see timeseries.py), one record per call.
+
+    The fix does the per-step sampling and averaging inside LAMMPS, so the
+    hook only has to run every `nfreq` steps of the fix; `columns` names
+    the fix's values in order. The call on the first step of a run is
+    skipped, as the fix has no average to report yet. Buffered rows are
+    written out before each restart file (see InsituRegistry).
+    """
+
+    def __init__(self, comm, every, fix_id, columns, path, resume_from=None):
+        super().__init__(every)
+        self.fix_id = fix_id
+        self.columns = list(columns)
+        self.first_step = None
+
+        self.writer = None
+        if comm.Get_rank() == 0:
+            self.writer = TimeSeriesWriter(path, self.columns, resume_from=resume_from)
+
+            # The record at the restart step is kept, so the series should reach the last block before it
+            if resume_from is not None:
+                report_gap(path, self.writer.last_timestep, resume_from // every * every, resume_from)
+
+    def __call__(self, state):
+        if self.first_step is None:
+            self.first_step = state.timestep
+
+        if self.writer is not None and state.timestep != self.first_step:
+            values = [state.lmp.extract_fix(self.fix_id, LMP_STYLE_GLOBAL, LMP_TYPE_VECTOR, i) for i in range(len(self.columns))]
+            self.writer.append(state.timestep, values)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self, comm):
+        if self.writer is not None:
+            self.writer.close()
+
+class AdaptiveDumpHook(Hook):
+    """
+    Switches output between sparse and dense.
+
+    `trigger(state)` is evaluated every `dense_every` steps. Output becomes
+    dense (every `dense_every` steps) once it exceeds `on` and returns to
+    sparse (every `sparse_every` steps, a multiple of `dense_every`) only
+    once it falls below `off`, so a trigger hovering around one threshold
+    does not flip the mode every call. A new mode applies from the step
+    after the trigger crossed the threshold.
+
+    A native LAMMPS dump is switched through `variable`, the equal-style
+    variable its `dump_modify every v_<variable>` reads the next dump step
+    from (see dump_step_expression): the hook redefines it when the mode
+    changes and LAMMPS evaluates it again at the start of the next run
+    segment. Otherwise `output`, a Python output hook such as
+    TrajectoryHook, is called on the dump steps. The trigger value, the
+    mode and whether a frame was written are recorded per call as the
+    dump schedule.
+    """
+
+    def __init__(self, sparse_every, dense_every, trigger, on, off, output=None, variable=None, output_path=None):
+        if (output is None) == (variable is None):
+            raise ValueError("AdaptiveDumpHook needs exactly one of an output hook or a dump variable")
+        if sparse_every % dense_every != 0:
+            raise ValueError(f"Sparse interval {sparse_every} is not a multiple of the dense interval {dense_every}")
+
+        super().__init__(dense_every, output_path)
+        self.output = output
+        self.variable = variable
+        self.peratom = output.peratom if output is not None else []
+        self.sparse_every = sparse_every
+        self.trigger = trigger
+        self.on = on
+        self.off = off
+        self.dense = False
+
+    def __call__(self, state):
+        # Whether this step is written was settled by the mode up to now, as LAMMPS already knows its next dump step
+        dumped = self.dense or state.timestep % self.sparse_every == 0
+        if dumped and self.output is not None:
+            self.output(state)
+
+        value = self.trigger(state)
+
+        dense = self.dense
+        if dense and value < self.off:
+            dense = False
+        elif not dense and value > self.on:
+            dense = True
+
+        if dense != self.dense and self.variable is not None:
+            every = self.every if dense else self.sparse_every
+            state.lmp.command(f"variable {self.variable} equal {dump_step_expression(every)}")
+        self.dense = dense
+
+        self.record(state, trigger=value, dense=self.dense, dumped=dumped)
+
+    def open(self, comm, resume_from=None):
+        if self.output is not None:
+            self.output.open(comm, resume_from)
+        super().open(comm, resume_from)
+
+    def flush(self):
+        if self.output is not None:
+            self.output.flush()
+
+    def close(self, comm):
+        if self.output is not None:
+            self.output.close(comm)
+        super().close(comm)
+
+# --------------------------- RECORDS ---------------------------#
+
+class RecordJournal:
+    """
+    Append-only record of a hook's observables: one JSON line per call,
+    holding the timestep and every recorded value (arrays as lists).
+
+    Each line is flushed as soon as it is written, so a job that is killed
+    keeps every record up to the kill, and a partial last line is ignored
+    when reading. With `resume_from`, an existing journal is reopened and
+    the records at or after that timestep, which the resumed run records
+    again, are dropped; `last_timestep` is then the last record kept.
+    """
+
+    def __init__(self, path, resume_from=None):
+        self.path = path
+        self.last_timestep = None
+
+        if resume_from is not None and os.path.isfile(path):
+            self._resume(resume_from)
+            return
+
+        self._file = open(path, 'w')
+
+    def append(self, timestep, values):
+        record = {'timestep': int(timestep)}
+        record.update({name: np.asarray(value).tolist() for name, value in values.items()})
+
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self.last_timestep = int(timestep)
+
+    def close(self):
+        self._file.close()
+
+    def _resume(self, timestep):
+        """Reopens the journal at `self.path` for appending, truncated before `timestep`."""
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n') or record['timestep'] >= timestep:
+                    break
+                end += len(line)
+                self.last_timestep = record['timestep']
+
+        self._file = open(self.path, 'r+')
+        self._file.truncate(end)
+        self._file.seek(end)
+
+# --------------------------- TRIGGERS ---------------------------#
+
+def setforce_magnitude(state, fix_id='precipitate_freeze'):
+    """
+    Magnitude of the total force a `fix setforce` removed on the last step.
+
+    setforce zeroes the forces on its group, so `compute reduce` of fx/fy/fz
+    over that group reads zero; the fix's own global vector holds the sum
+    of the forces before they were zeroed. Must be called on every rank.
+    """
+    force = [state.lmp.extract_fix(fix_id, LMP_STYLE_GLOBAL, LMP_TYPE_VECTOR, i) for i in range(3)]
+    return float(np.linalg.norm(force))
+
+# --------------------------- SELECTIONS ---------------------------#
+
+def defect_selection(threshold, group='precipitate', peratom='c_peratom'):
+    """
+    Selector for output hooks keeping the atoms per_atom_threshold.py keeps:
+    those with `peratom` above `threshold` or in `group`. The hook must
+    list `peratom` among its per-atom values.
+    """
+    def select(state):
+        return (state.peratom(peratom) > threshold) | state.group_mask(group)
+    return select
+
+# --------------------------- UTILITIES ---------------------------#
+
+def dump_step_expression(every):
+    """Equal-style expression for the first multiple of `every` after the current step, for `dump_modify every v_name`."""
+    return f"(floor(step/{every})+1)*{every}"
+
+def journal_path(output_path):
+    """The journal a hook writes its records to before they are saved at `output_path`."""
+    return os.path.splitext(output_path)[0] + '.records'
+
+def read_records(path):
+    """
+    Reads a RecordJournal into one array per observable, first axis over
+    the records; also gives the records of a job that was killed.
+    """
+    records = {}
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            for name, value in json.loads(line).items():
+                records.setdefault(name, []).append(value)
+
+    return {name: np.asarray(values) for name, values in records.items()}
+
+def report_gap(path, last_timestep, expected, resume_from):
+    """Reports a resumed output that stops short of the last step expected before the restart."""
+    if expected > 0 and (last_timestep is None or last_timestep < expected):
+        print(f"{path} ends at step {last_timestep}, before step {expected}; "
+              f"the output between them was lost and is not recomputed when resuming from step {resume_from}")
+
+def gather_frame(state, dtypes, peratom, select=None, sort=False):
+    """
+    Gathers id, positions and the hook's per-atom values onto rank 0; other
+    ranks get None. With `select`, each rank sends only the atoms it picks;
+    with `sort`, rank 0 puts the atoms in ascending ID order.
+    """
+    positions = state.atom('x')
+
+    local = {'id': state.atom('id'), 'x': positions[:, 0], 'y': positions[:, 1], 'z': positions[:, 2]}
+    local.update({name: state.peratom(name) for name in peratom})
+
+    if select is not None:
+        mask = select(state)
+        local = {name: values[mask] for name, values in local.items()}
+
+    arrays = {name: gather_column(state.comm, local[name], dtype) for name, dtype in dtypes.items()}
+
+    if state.comm.Get_rank() != 0:
+        return None
+
+    if sort:
+        order = id_order(arrays['id'])
+        arrays = {name: values[order] for name, values in arrays.items()}
+
+    return arrays
+
+def gather_column(comm, values, dtype, root=0):
+    """Gathers a per-atom column from every rank onto `root`; other ranks get None."""
+    values = np.ascontiguousarray(values, dtype=dtype)
+    counts = comm.gather(len(values), root=root)
+
+    if comm.Get_rank() != root:
+        comm.Gatherv(values, None, root=root)
+        return None
+
+    gathered = np.empty(sum(counts), dtype=dtype)
+    comm.Gatherv(values, [gathered, counts], root=root)
+
+    return gathered
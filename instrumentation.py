@@ -0,0 +1,155 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Taken when this module is first imported; scripts import it before their heavy libraries
+PROCESS_START = time.perf_counter()
+
+# --------------------------- CONFIG ---------------------------#
+
+# Where wall time can go; any other stage name is accepted and reported under 'other'
+CATEGORIES = {
+    'import': 'setup',
+    'bcast': 'communication',
+    'read': 'io',
+    'export': 'io',
+    'compute': 'compute',
+    'wait': 'idle',
+}
+
+UNTIMED = 'untimed' # Wall time outside every stage
+
+# --------------------------- STAGE TIMER ---------------------------#
+
+class StageTimer:
+    """
+    Accumulates the wall time one rank spends in named stages.
+
+    Stages are timed with `with timer.stage('read'): ...` and may repeat;
+    their times and counts add up. The time between importing this module
+    and creating the timer is recorded as the 'import' stage. `report` is
+    collective: it reduces the totals across ranks and writes the JSON
+    report on rank 0.
+    """
+
+    def __init__(self, comm, job, start=PROCESS_START):
+        self.comm = comm
+        self.job = job
+        self.start = start
+        self.totals = {}
+        self.counts = {}
+
+        self.add('import', time.perf_counter() - start)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds, count=1):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def bcast(self, value, root=0):
+        with self.stage('bcast'):
+            return self.comm.bcast(value, root=root)
+
+    def barrier(self):
+        """Waits for every rank; the time spent here is the rank's load imbalance."""
+        with self.stage('wait'):
+            self.comm.Barrier()
+
+    def report(self, path=None):
+        """
+        Reduces every stage across ranks and returns the summary on rank 0
+        (None elsewhere), also saving it to `path` and printing a table.
+
+        For each stage: min/mean/max seconds over ranks and imbalance, the
+        ratio of the slowest rank to the mean (1.0 is perfectly balanced).
+        """
+        wall_time = time.perf_counter() - self.start
+        totals = dict(self.totals)
+        totals[UNTIMED] = max(wall_time - sum(totals.values()), 0.0)
+
+        ranks = self.comm.gather({'wall_time': wall_time, 'totals': totals, 'counts': self.counts}, root=0)
+
+        if self.comm.Get_rank() != 0:
+            return None
+
+        names = sorted({name for entry in ranks for name in entry['totals']}, key=stage_order)
+        wall = max(entry['wall_time'] for entry in ranks)
+
+        stages = {}
+        for name in names:
+            times = np.array([entry['totals'].get(name, 0.0) for entry in ranks])
+            mean = float(times.mean())
+            stages[name] = {
+                'category': CATEGORIES.get(name, 'other'),
+                'min': float(times.min()),
+                'mean': mean,
+                'max': float(times.max()),
+                'imbalance': float(times.max() / mean) if mean > 0 else 1.0,
+                'fraction': mean / wall if wall > 0 else 0.0,
+                'calls': int(sum(entry['counts'].get(name, 0) for entry in ranks)),
+            }
+
+        categories = {}
+        for name, summary in stages.items():
+            category = 'idle' if name == UNTIMED else summary['category']
+            categories[category] = categories.get(category, 0.0) + summary['mean']
+
+        summary = {
+            'job': self.job,
+            'job_id': os.environ.get('SLURM_JOB_ID'),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'n_ranks': len(ranks),
+            'wall_time': wall,
+            'stages': stages,
+            'categories': categories,
+            'ranks': ranks,
+        }
+
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(summary, f, indent=1)
+            os.replace(path + '.tmp', path)
+
+        print_report(summary)
+
+        return summary
+
+# --------------------------- UTILITIES ---------------------------#
+
+def report_path(directory, job):
+    """One report per job: '<job>_timing_<SLURM job id or start time>.json'."""
+    job_id = os.environ.get('SLURM_JOB_ID') or time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f"{job}_timing_{job_id}.json")
+
+def stage_order(name):
+    # Stages in CATEGORIES first, in their listed order, then the rest alphabetically, then the untimed remainder
+    order = list(CATEGORIES)
+    if name == UNTIMED:
+        return (2, name)
+    return (0, f"{order.index(name):03d}") if name in CATEGORIES else (1, name)
+
+def print_report(summary):
+    print('')
+    print(f"Stage timing for {summary['job']} on {summary['n_ranks']} ranks ({summary['wall_time']:.2f} s wall)")
+    print(f"{'Stage':>10} {'Min (s)':>10} {'Mean (s)':>10} {'Max (s)':>10} {'Max/mean':>9} {'Wall (%)':>9}")
+
+    for name, stage in summary['stages'].items():
+        print(f"{name:>10} {stage['min']:>10.2f} {stage['mean']:>10.2f} {stage['max']:>10.2f} "
+              f"{stage['imbalance']:>9.2f} {100 * stage['fraction']:>9.1f}")
+
+    wall = summary['wall_time']
+    if wall > 0:
+        print('  '.join(f"{category}: {100 * seconds / wall:.1f}%" for category, seconds in summary['categories'].items()))
+    print('')
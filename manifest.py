@@ -0,0 +1,144 @@
+# --------------------------- LIBRARIES ---------------------------#
+import glob
+import hashlib
+import json
+import os
+import time
+
+# --------------------------- CONFIG ---------------------------#
+
+MANIFEST_FILE = 'manifest.json'
+JOURNAL_DIR = '.manifest_journal'
+
+CHECKSUM_BLOCK = 4 * 1024 * 1024
+
+# --------------------------- MANIFEST ---------------------------#
+
+class Manifest:
+    """
+    Record of which outputs in a directory are up to date.
+
+    Each entry is keyed by a task name (normally the input dump file) and
+    stores the identity of its input files, a hash of the analysis
+    parameters and the checksum of every output file. A rerun only has to
+    process keys for which `is_current()` is False.
+
+    Ranks never write the same file: `record()` appends to a journal owned
+    by the calling rank, and `consolidate()` (called on one rank after a
+    barrier) folds the journals into `manifest.json` with an atomic rename.
+    Journals left behind by a job that was killed are picked up on the
+    next load, so completed frames are never lost.
+    """
+
+    def __init__(self, manifest_dir, params, rank=0):
+        self.manifest_dir = manifest_dir
+        self.params = params
+        self.params_hash = hash_params(params)
+        self.rank = rank
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = load_entries(self.manifest_dir)
+        return self._entries
+
+    def is_current(self, key, input_paths, output_paths, verify=False):
+        """True if `key` was produced from these inputs with the same parameters and its outputs are intact."""
+        entry = self.entries.get(key)
+
+        if entry is None or entry['params_hash'] != self.params_hash:
+            return False
+
+        if entry['inputs'] != {os.path.basename(path): file_identity(path) for path in input_paths}:
+            return False
+
+        for path in output_paths:
+            recorded = entry['outputs'].get(os.path.basename(path))
+            if recorded is None or not os.path.isfile(path) or os.path.getsize(path) != recorded['size']:
+                return False
+            if verify and file_checksum(path) != recorded['checksum']:
+                return False
+
+        return True
+
+    def pending(self, keys, input_paths, output_paths, verify=False):
+        """Returns the keys whose outputs are missing or out of date; paths are given per key."""
+        return [key for key, inputs, outputs in zip(keys, input_paths, output_paths)
+                if not self.is_current(key, inputs, outputs, verify)]
+
+    def record(self, key, input_paths, output_paths):
+        """Appends an entry for `key` to this rank's journal."""
+        entry = {
+            'key': key,
+            'params_hash': self.params_hash,
+            'inputs': {os.path.basename(path): file_identity(path) for path in input_paths},
+            'outputs': {os.path.basename(path): {'size': os.path.getsize(path), 'checksum': file_checksum(path)}
+                        for path in output_paths},
+            'recorded': time.time(),
+        }
+
+        journal_dir = os.path.join(self.manifest_dir, JOURNAL_DIR)
+        os.makedirs(journal_dir, exist_ok=True)
+
+        with open(os.path.join(journal_dir, f"rank_{self.rank:05d}.jsonl"), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+
+    def consolidate(self):
+        """Merges all journals into manifest.json and removes them; call on a single rank."""
+        entries = load_entries(self.manifest_dir)
+
+        manifest = {'params': self.params, 'params_hash': self.params_hash, 'entries': entries}
+
+        path = os.path.join(self.manifest_dir, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+        for journal in glob.glob(os.path.join(self.manifest_dir, JOURNAL_DIR, '*.jsonl')):
+            os.remove(journal)
+
+        self._entries = entries
+
+# --------------------------- UTILITIES ---------------------------#
+
+def load_entries(manifest_dir):
+    """Reads manifest.json and any journals; the most recently recorded entry per key wins."""
+    entries = {}
+
+    path = os.path.join(manifest_dir, MANIFEST_FILE)
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            entries.update(json.load(f)['entries'])
+
+    for journal in sorted(glob.glob(os.path.join(manifest_dir, JOURNAL_DIR, '*.jsonl'))):
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Last line of a journal cut short by a killed job
+
+                current = entries.get(entry['key'])
+                if current is None or entry['recorded'] >= current['recorded']:
+                    entries[entry['key']] = entry
+
+    return entries
+
+def file_identity(path):
+    """Cheap identity of an input file: size and modification time."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def file_checksum(path):
+    """BLAKE2b digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_params(params):
+    """Stable hash of a JSON-serialisable parameter dict."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
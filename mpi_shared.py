@@ -0,0 +1,45 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+from mpi4py import MPI
+
+# --------------------------- SHARED MEMORY ---------------------------#
+
+def share_array(comm, array=None):
+    """
+    Places a copy of `array` (given on rank 0) in one MPI shared-memory
+    window per node and returns a read-only view of it on every rank.
+
+    Only the first rank on each node allocates memory, so the footprint per
+    node does not grow with the number of ranks. The window is returned
+    alongside the array and must be kept alive for as long as the array is
+    used.
+    """
+    rank = comm.Get_rank()
+
+    meta = (array.shape, array.dtype.str) if rank == 0 else None
+    shape, dtype = comm.bcast(meta, root=0)
+    dtype = np.dtype(dtype)
+
+    node = comm.Split_type(MPI.COMM_TYPE_SHARED, key=rank)
+    is_leader = node.Get_rank() == 0
+
+    n_bytes = int(np.prod(shape)) * dtype.itemsize if is_leader else 0
+    window = MPI.Win.Allocate_shared(n_bytes, dtype.itemsize, comm=node)
+
+    buffer, _ = window.Shared_query(0)
+    shared = np.ndarray(shape, dtype=dtype, buffer=buffer)
+
+    # Node leaders are ordered by global rank, so rank 0 is root of the leader communicator
+    leaders = comm.Split(0 if is_leader else MPI.UNDEFINED, key=rank)
+
+    if is_leader:
+        if rank == 0:
+            shared[...] = array
+        leaders.Bcast(shared, root=0)
+        leaders.Free()
+
+    node.Barrier()
+
+    shared.flags.writeable = False
+
+    return shared, window
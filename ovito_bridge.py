@@ -0,0 +1,53 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+from ovito.data import DataCollection
+from ovito.pipeline import Pipeline, StaticSource
+
+# --------------------------- CONFIG ---------------------------#
+
+# Dump columns that map onto OVITO standard properties
+STANDARD_PROPERTIES = {
+    'id': 'Particle Identifier',
+    'type': 'Particle Type',
+}
+
+POSITION_COLUMNS = ('x', 'y', 'z')
+
+# --------------------------- CONVERSION ---------------------------#
+
+def frame_to_data(frame):
+    """
+    Builds an OVITO DataCollection from a dump_reader/trajectory frame.
+
+    Positions become the `Position` property, `id` and `type` their standard
+    counterparts, and every other column a user property of the same name.
+    """
+    data = DataCollection()
+
+    bounds = np.asarray(frame.box_bounds)[:, :2]
+    matrix = np.zeros((3, 4))
+    matrix[:, :3] = np.diag(bounds[:, 1] - bounds[:, 0])
+    matrix[:, 3] = bounds[:, 0]
+
+    data.create_cell(matrix, pbc=[flag.startswith('p') for flag in frame.box_flags])
+
+    atoms = frame.atoms
+    particles = data.create_particles(count=len(atoms))
+    particles.create_property('Position', data=np.column_stack([atoms[name] for name in POSITION_COLUMNS]))
+
+    for name in atoms.dtype.names:
+        if name in POSITION_COLUMNS:
+            continue
+        particles.create_property(STANDARD_PROPERTIES.get(name, name), data=atoms[name])
+
+    return data
+
+def static_pipeline(modifiers, data=None):
+    """Returns a pipeline over a StaticSource whose data can be swapped frame by frame."""
+    pipeline = Pipeline(source=StaticSource(data=data))
+
+    for modifier in modifiers:
+        pipeline.modifiers.append(modifier)
+
+    return pipeline
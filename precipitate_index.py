@@ -0,0 +1,32 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+from dump_reader import read_dump
+from mpi_shared import share_array
+
+# --------------------------- MEMBERSHIP TABLE ---------------------------#
+
+def build_precipitate_table(filepath):
+    """
+    Builds a dense boolean table indexed by atom ID from the `precipitate_ID`
+    dump written by simulate.py; table[id] is True for precipitate atoms.
+    """
+    ids = read_dump(filepath, columns=['id']).atoms['id']
+
+    table = np.zeros(ids.max() + 1 if len(ids) else 1, dtype=bool)
+    table[ids] = True
+
+    return table
+
+def share_precipitate_table(comm, filepath):
+    """Builds the table on rank 0 and shares it read-only with every rank on each node."""
+    table = build_precipitate_table(filepath) if comm.Get_rank() == 0 else None
+
+    return share_array(comm, table)
+
+def select_precipitate(table, ids):
+    """Returns a boolean mask of the atoms in `ids` that belong to the precipitate."""
+    ids = np.asarray(ids)
+
+    # IDs beyond the table are clipped onto its last entry and then masked out
+    return table.take(ids, mode='clip') & (ids < len(table))
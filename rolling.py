@@ -0,0 +1,66 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+# --------------------------- CONFIG ---------------------------#
+
+# The running sum is rebuilt from the buffer this often (in multiples of the window) to stop rounding drift
+RESYNC_WINDOWS = 64
+
+# --------------------------- ROLLING MEAN ---------------------------#
+
+class RollingMean:
+    """
+    Rolling mean over the last `window` frames of ID-aligned per-atom columns.
+
+    Frames are copied into a fixed (window, n_atoms) ring buffer per column
+    and a running sum is updated in place: the oldest frame is subtracted
+    and the newest added, so each push costs O(n_atoms) regardless of the
+    window length and nothing is reallocated after the first frame.
+    """
+
+    def __init__(self, window, columns):
+        self.window = window
+        self.columns = list(columns)
+        self.reset()
+
+    def reset(self):
+        self._buffer = None
+        self._sum = None
+        self._head = 0
+        self._count = 0
+        self._pushes = 0
+
+    @property
+    def full(self):
+        return self._count == self.window
+
+    def push(self, values):
+        """Adds one frame; `values` maps each column to an array aligned with earlier frames."""
+        if self._buffer is None:
+            n_atoms = len(values[self.columns[0]])
+            self._buffer = {name: np.zeros((self.window, n_atoms)) for name in self.columns}
+            self._sum = {name: np.zeros(n_atoms) for name in self.columns}
+
+        slot = self._head
+
+        for name in self.columns:
+            buffer = self._buffer[name]
+            total = self._sum[name]
+
+            if self._count == self.window:
+                total -= buffer[slot]
+
+            buffer[slot] = values[name]
+            total += buffer[slot]
+
+        self._head = (self._head + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+        self._pushes += 1
+
+        if self._pushes % (RESYNC_WINDOWS * self.window) == 0:
+            for name in self.columns:
+                self._buffer[name][:self._count].sum(axis=0, out=self._sum[name])
+
+    def mean(self, name):
+        """Mean of `name` over the frames currently in the window."""
+        return self._sum[name] / self._count
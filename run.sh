@@ -16,4 +16,17 @@ source activate mol_dynamics_lmp
 export OMP_NUM_THREADS=$SLURM_CPUS_PER_TASK
 
 # Run python script
-mpirun -np $SLURM_NTASKS python -m 03_dislo_pin.simulate
\ No newline at end of file
+mpirun -np $SLURM_NTASKS python -m 03_dislo_pin.simulate
+
+# Parameter sweep: many smaller runs packed into the same allocation (see 03_dislo_pin/sweep.py)
+# mpirun -np $SLURM_NTASKS python -m 03_dislo_pin.sweep
+
+# Scaling benchmark of minimisation and MD on synthetic boxes (see 05_benchmark/benchmark.py)
+# mpirun -np $SLURM_NTASKS python -m 05_benchmark.benchmark
+
+# DXA: for large frames, run fewer ranks with several threads each (e.g. --ntasks=64 --cpus-per-task=4);
+# each rank parses frames ahead on its own threads, OVITO uses them for the DXA, and as many frames are kept in memory as --mem-per-cpu allows
+# mpirun -np $SLURM_NTASKS python -m 04_analysis.DXA
+
+# Windowed shear-stress maps binned from the dumps (see 04_analysis/stress_map.py)
+# mpirun -np $SLURM_NTASKS python -m 04_analysis.stress_map
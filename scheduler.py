@@ -0,0 +1,186 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import time
+from contextlib import nullcontext
+
+import numpy as np
+from mpi4py import MPI
+
+# --------------------------- CONFIG ---------------------------#
+
+TAG_REQUEST = 1
+TAG_WORK = 2
+
+# Each chunk aims for remaining_cost / (CHUNK_FACTOR * n_workers), so chunks shrink as the queue drains
+CHUNK_FACTOR = 2
+
+# --------------------------- TASK QUEUE ---------------------------#
+
+def run_task_queue(comm, tasks, worker, paths=None, history_path=None, timer=None):
+    """
+    Processes `tasks` with a dynamic master/worker queue.
+
+    Rank 0 only dispatches; every other rank repeatedly asks it for the next
+    contiguous chunk of tasks and calls `worker(chunk)` on it. Chunk sizes
+    are cost-aware: costs come from the timing history at `history_path`
+    when available, otherwise from the size of the files in `paths`, and
+    expensive stretches of the task list are handed out in smaller chunks.
+    With a single rank the tasks are processed serially.
+
+    `tasks` must be the same list on every rank. At the end the measured
+    per-task times are saved to `history_path` and per-rank utilisation is
+    printed on rank 0. With an instrumentation.StageTimer as `timer`, time
+    spent dispatching or waiting for work is recorded as its 'wait' stage.
+    """
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    start_time = time.perf_counter()
+    busy_time = 0.0
+    n_done = 0
+    timings = {}
+
+    if size == 1:
+        costs = estimate_costs(tasks, paths, history_path)
+        for chunk in plan_chunks(costs, 1):
+            chunk_time = run_chunk(worker, [tasks[i] for i in chunk])
+            record_timings(timings, tasks, chunk, costs, chunk_time)
+            busy_time += chunk_time
+            n_done += len(chunk)
+
+    elif rank == 0:
+        costs = estimate_costs(tasks, paths, history_path)
+        chunks = iter(plan_chunks(costs, size - 1))
+        active_workers = size - 1
+        status = MPI.Status()
+
+        while active_workers:
+            with waiting(timer):
+                finished = comm.recv(source=MPI.ANY_SOURCE, tag=TAG_REQUEST, status=status)
+
+            if finished is not None:
+                chunk, chunk_time = finished
+                record_timings(timings, tasks, chunk, costs, chunk_time)
+
+            chunk = next(chunks, None)
+            comm.send(chunk, dest=status.Get_source(), tag=TAG_WORK)
+
+            if chunk is None:
+                active_workers -= 1
+
+    else:
+        finished = None
+
+        while True:
+            with waiting(timer):
+                comm.send(finished, dest=0, tag=TAG_REQUEST)
+                chunk = comm.recv(source=0, tag=TAG_WORK)
+
+            if chunk is None:
+                break
+
+            chunk_time = run_chunk(worker, [tasks[i] for i in chunk])
+            finished = (chunk, chunk_time)
+            busy_time += chunk_time
+            n_done += len(chunk)
+
+    wall_time = time.perf_counter() - start_time
+
+    stats = comm.gather((rank, n_done, busy_time, wall_time), root=0)
+
+    if rank == 0:
+        if history_path:
+            save_history(history_path, timings)
+        report_utilisation(stats, dispatcher=size > 1)
+
+    return None
+
+# --------------------------- UTILITIES ---------------------------#
+
+def run_chunk(worker, chunk):
+    """Runs the worker on one chunk and returns the elapsed time."""
+    start = time.perf_counter()
+    worker(chunk)
+    return time.perf_counter() - start
+
+def waiting(timer):
+    return timer.stage('wait') if timer is not None else nullcontext()
+
+def plan_chunks(costs, n_workers):
+    """Yields contiguous lists of task indexes sized by the remaining cost."""
+    costs = np.asarray(costs, dtype=float)
+    remaining = costs.sum()
+    start = 0
+
+    while start < len(costs):
+        target = remaining / (CHUNK_FACTOR * n_workers)
+
+        end = start + 1
+        chunk_cost = costs[start]
+        while end < len(costs) and chunk_cost + costs[end] <= target:
+            chunk_cost += costs[end]
+            end += 1
+
+        yield list(range(start, end))
+
+        remaining -= chunk_cost
+        start = end
+
+def estimate_costs(tasks, paths=None, history_path=None):
+    """
+    Returns a relative cost per task.
+
+    Tasks timed in a previous run use their recorded time. The rest are
+    estimated from their file size, scaled by the median seconds per byte
+    of the timed tasks. Without any information all tasks cost the same.
+    """
+    history = load_history(history_path)
+
+    if paths is None:
+        fallback = [1.0] * len(tasks)
+    else:
+        fallback = [float(max(os.path.getsize(path), 1)) for path in paths]
+
+    rates = [history[str(task)] / size for task, size in zip(tasks, fallback) if str(task) in history]
+    scale = float(np.median(rates)) if rates else 1.0
+
+    return [history.get(str(task), size * scale) for task, size in zip(tasks, fallback)]
+
+def record_timings(timings, tasks, chunk, costs, chunk_time):
+    """Splits a chunk's time over its tasks in proportion to their estimated cost."""
+    total = sum(costs[i] for i in chunk)
+    for i in chunk:
+        timings[str(tasks[i])] = chunk_time * costs[i] / total if total > 0 else chunk_time / len(chunk)
+
+def load_history(history_path):
+    if not history_path or not os.path.isfile(history_path):
+        return {}
+    with open(history_path, 'r') as f:
+        return json.load(f)
+
+def save_history(history_path, timings):
+    """Merges new task timings into the history file."""
+    history = load_history(history_path)
+    history.update(timings)
+
+    with open(history_path, 'w') as f:
+        json.dump(history, f, indent=1)
+
+def report_utilisation(stats, dispatcher=True):
+    """Prints tasks, busy time and utilisation for every rank."""
+    print('')
+    print(f"{'Rank':>6} {'Tasks':>7} {'Busy (s)':>10} {'Wall (s)':>10} {'Util (%)':>9}")
+
+    for rank, n_done, busy_time, wall_time in stats:
+        role = ' (dispatcher)' if dispatcher and rank == 0 else ''
+        utilisation = 100 * busy_time / wall_time if wall_time > 0 else 0.0
+        print(f"{rank:>6} {n_done:>7} {busy_time:>10.2f} {wall_time:>10.2f} {utilisation:>9.1f}{role}")
+
+    workers = stats[1:] if dispatcher else stats
+    busy = [s[2] for s in workers]
+    wall = max(s[3] for s in stats)
+
+    if busy and wall > 0:
+        print(f"Mean worker utilisation: {100 * np.mean(busy) / wall:.1f}%  (max/mean busy: {max(busy) / max(np.mean(busy), 1e-12):.2f})")
+    print('')
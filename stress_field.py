@@ -0,0 +1,161 @@
+# --------------------------- LIBRARIES ---------------------------#
+import numpy as np
+
+# --------------------------- CONFIG ---------------------------#
+
+BIN_SIZE = 5.0 # Angstrom, along each binned dimension
+BIN_DIMS = ('x', 'y') # Binned dimensions; the others are averaged through, e.g. along the dislocation line
+STRESS_COLUMNS = ['c_stress[4]'] # Per-atom stress (pressure*volume units, as from compute stress/atom)
+WINDOW = 10 # Frames per time window
+
+DIMS = ('x', 'y', 'z')
+
+# --------------------------- ACCUMULATOR ---------------------------#
+
+class StressField:
+    """
+    Volume-normalised stress of each bin, averaged over a time window.
+
+    `values` maps each stress column to an array with one axis per binned
+    dimension; `counts` is the mean number of atoms per bin and `edges`
+    the lower bin edges along each binned dimension. The last bin may
+    extend past the box and is still divided by the full bin volume, as
+    LAMMPS does, so choose a bin size that divides the box.
+    """
+
+    def __init__(self, timesteps, edges, values, counts):
+        self.timesteps = timesteps
+        self.edges = edges
+        self.values = values
+        self.counts = counts
+
+class StressFieldAccumulator:
+    """
+    Streams dump frames into windowed, binned stress fields.
+
+    Bins are `bin_size` wide from the lower box bound, as for
+    `compute chunk/atom bin/1d|2d|3d ... lower` with `units box`, so the
+    fields match simulate.py's in-run stress map. Each frame's per-atom
+    stress is summed per bin with np.bincount and divided by the bin
+    volume (the bin's extent in the binned dimensions times the box length
+    in the others); `window` frames are averaged into one StressField.
+    Only the per-bin sums are kept between frames, never the atoms.
+    """
+
+    def __init__(self, bin_size=BIN_SIZE, dims=BIN_DIMS, columns=STRESS_COLUMNS, window=WINDOW):
+        self.bin_size = bin_size
+        self.dims = [DIMS.index(dim) for dim in dims]
+        self.columns = list(columns)
+        self.window = window
+
+        self.shape = None
+        self.reset()
+
+    def reset(self):
+        self._sums = None
+        self._counts = None
+        self._timesteps = []
+
+    def add(self, frame):
+        """Adds one DumpFrame; returns the StressField once `window` frames are in, else None."""
+        box = np.asarray(frame.box_bounds, dtype=np.float64)[:, :2]
+        lengths = box[:, 1] - box[:, 0]
+
+        if self.shape is None:
+            self.shape = tuple(max(1, int(np.ceil(lengths[dim] / self.bin_size))) for dim in self.dims)
+            self.origin = box[self.dims, 0]
+
+        n_bins = int(np.prod(self.shape))
+        if self._sums is None:
+            self._sums = {name: np.zeros(n_bins) for name in self.columns}
+            self._counts = np.zeros(n_bins)
+
+        # Atoms a little outside the box (not yet rewrapped) go into the edge bins
+        flat = np.zeros(frame.n_atoms, dtype=np.int64)
+        for axis, dim in enumerate(self.dims):
+            index = np.floor((frame.atoms[DIMS[dim]] - box[dim, 0]) / self.bin_size).astype(np.int64)
+            flat = flat * self.shape[axis] + np.clip(index, 0, self.shape[axis] - 1)
+
+        through = [dim for dim in range(3) if dim not in self.dims]
+        bin_volume = self.bin_size ** len(self.dims) * np.prod(lengths[through])
+
+        for name in self.columns:
+            self._sums[name] += np.bincount(flat, weights=frame.atoms[name], minlength=n_bins) / bin_volume
+        self._counts += np.bincount(flat, minlength=n_bins)
+        self._timesteps.append(frame.timestep)
+
+        if len(self._timesteps) == self.window:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Returns the StressField of the frames added since the last one (None if there are none) and starts a new window."""
+        if not self._timesteps:
+            return None
+
+        n_frames = len(self._timesteps)
+        edges = [self.origin[axis] + self.bin_size * np.arange(n) for axis, n in enumerate(self.shape)]
+
+        field = StressField(np.array(self._timesteps),
+                            edges,
+                            {name: (total / n_frames).reshape(self.shape) for name, total in self._sums.items()},
+                            (self._counts / n_frames).reshape(self.shape))
+        self.reset()
+
+        return field
+
+# --------------------------- IN-RUN OUTPUT ---------------------------#
+
+def read_ave_chunk(path):
+    """
+    Reads the stress map written by simulate.py's `fix ave/chunk` into one
+    StressField per output step. The values are already volume-normalised
+    and time-averaged by LAMMPS; bins are placed on the grid by their
+    coordinates, which must be those of a bin/1d, bin/2d or bin/3d chunking.
+    """
+    with open(path, 'r') as f:
+        lines = [line.split() for line in f if line.strip()]
+
+    header = [line for line in lines if line[0] == '#']
+    names = header[-1][1:]
+    coord_names = [name for name in names if name.startswith('Coord')]
+    columns = [name for name in names if name not in coord_names and name not in ('Chunk', 'Ncount')]
+
+    rows = [line for line in lines if line[0] != '#']
+
+    fields = []
+    position = 0
+    while position < len(rows):
+        timestep, n_chunks = int(rows[position][0]), int(rows[position][1])
+        block = np.array(rows[position + 1:position + 1 + n_chunks], dtype=np.float64)
+        position += 1 + n_chunks
+
+        grid = [np.unique(block[:, names.index(name)], return_inverse=True) for name in coord_names]
+        shape = tuple(len(centres) for centres, _ in grid)
+        flat = np.ravel_multi_index([inverse for _, inverse in grid], shape)
+
+        def on_grid(values):
+            out = np.full(int(np.prod(shape)), np.nan)
+            out[flat] = values
+            return out.reshape(shape)
+
+        # Bin centres are half a bin above the lower edges
+        edges = [centres - (centres[1] - centres[0]) / 2 if len(centres) > 1 else centres for centres, _ in grid]
+
+        fields.append(StressField(np.array([timestep]), edges,
+                                  {name: on_grid(block[:, names.index(name)]) for name in columns},
+                                  on_grid(block[:, names.index('Ncount')])))
+
+    return fields
+
+# --------------------------- UTILITIES ---------------------------#
+
+def save_fields(path, fields):
+    """Stacks the fields of consecutive windows into one .npz, one leading row per window."""
+    np.savez(path,
+             first_timestep=np.array([field.timesteps[0] for field in fields], dtype=np.int64),
+             last_timestep=np.array([field.timesteps[-1] for field in fields], dtype=np.int64),
+             n_frames=np.array([len(field.timesteps) for field in fields], dtype=np.int64),
+             counts=np.array([field.counts for field in fields]),
+             **{f"edges_{axis}": edge for axis, edge in enumerate(fields[0].edges if fields else [])},
+             **{name: np.array([field.values[name] for field in fields]) for name in (fields[0].values if fields else [])})
@@ -0,0 +1,35 @@
+import numpy as np
+
+from dump_reader import read_dump, iter_dump, write_dump, DumpFrame
+
+BOX = np.array([[0.0, 10.0], [0.0, 10.0], [0.0, 10.0]])
+
+def empty_frame(timestep):
+    atoms = np.empty(0, dtype=[('id', np.int64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+    return DumpFrame(timestep, BOX, ['pp', 'pp', 'pp'], atoms)
+
+def test_empty_frame(tmp_path):
+    path = tmp_path / 'dump.0'
+    write_dump(str(path), empty_frame(0))
+
+    frame = read_dump(str(path), n_threads=4)
+
+    assert frame.timestep == 0
+    assert frame.n_atoms == 0
+    assert frame.atoms.dtype.names == ('id', 'x', 'y', 'z')
+
+def test_empty_last_frame(tmp_path):
+    path = tmp_path / 'dump.multi'
+    atoms = np.zeros(3, dtype=[('id', np.int64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+    atoms['id'] = [1, 2, 3]
+
+    with open(path, 'w') as f:
+        for frame in (DumpFrame(0, BOX, ['pp', 'pp', 'pp'], atoms), empty_frame(100)):
+            single = tmp_path / 'single'
+            write_dump(str(single), frame)
+            f.write(single.read_text())
+
+    frames = list(iter_dump(str(path), n_threads=4))
+
+    assert [frame.timestep for frame in frames] == [0, 100]
+    assert [frame.n_atoms for frame in frames] == [3, 0]
@@ -0,0 +1,224 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import re
+
+import numpy as np
+
+from manifest import file_identity
+
+# --------------------------- CONFIG ---------------------------#
+
+CHUNK_BYTES = 16 * 1024 * 1024 # Log text read per iteration
+
+CACHE_SUFFIX = '.thermo.npz'
+CACHE_VERSION = 1
+
+# Header of a thermo block, the line that closes it, and the commands that start one
+MARKER = re.compile(rb'^[ \t]*(?:(?P<header>Step\s.*)|(?P<end>Loop time of.*)|(?P<command>(?:minimize|run)\s.*))$', re.M)
+
+# Lines inside a block that hold numbers (warnings and other messages can be interleaved)
+DATA_LINE = re.compile(rb'^[ \t]*[-+]?(?:\d|\.\d|nan|inf).*$', re.M | re.I)
+
+INTEGER_COLUMNS = {'Step', 'Elapsed', 'Atoms'}
+
+# Summary printed after every run/minimize, and the rows of its "MPI task timing breakdown" table
+LOOP_LINE = re.compile(rb'^Loop time of (?P<time>\S+) on (?P<procs>\d+) procs for (?P<steps>\d+) steps with (?P<atoms>\d+) atoms', re.M)
+SECTION_LINE = re.compile(rb'^(?P<name>Pair|Bond|Kspace|Neigh|Comm|Output|Modify|Other)\s*\|(?P<values>.*)$', re.M)
+SECTION_FIELDS = ('min', 'avg', 'max', 'varavg', 'percent')
+
+# --------------------------- THERMO BLOCKS ---------------------------#
+
+class ThermoBlock:
+    """
+    One block of thermo output: `kind` is the command that produced it
+    ('run' or 'minimize') and `data` a structured array with one field per
+    thermo column, so `pandas.DataFrame(block.data)` gives the usual table.
+    """
+
+    def __init__(self, kind, columns, data):
+        self.kind = kind
+        self.columns = columns
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"ThermoBlock({self.kind!r}, {len(self)} rows, columns={self.columns})"
+
+def read_thermo(path, cache=True, chunk_bytes=CHUNK_BYTES):
+    """
+    Returns every thermo block in a LAMMPS log, in order.
+
+    With `cache`, the parsed blocks are saved next to the log as a binary
+    sidecar and reused for as long as the log's size and mtime are unchanged.
+    """
+    cache_path = path + CACHE_SUFFIX
+
+    if cache:
+        blocks = load_cache(cache_path, path)
+        if blocks is not None:
+            return blocks
+
+    blocks = list(iter_thermo(path, chunk_bytes))
+
+    if cache:
+        save_cache(cache_path, path, blocks)
+
+    return blocks
+
+def iter_thermo(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Streams a log chunk by chunk and yields each ThermoBlock as it closes.
+
+    Only whole lines are scanned; the numeric rows between a header and its
+    `Loop time` line are filtered with one regex per chunk and converted to
+    floats in a single call, never line by line.
+    """
+    kind = 'run'
+    columns = None
+    parts = []
+    carry = b''
+
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            text = carry + chunk
+
+            if chunk:
+                cut = text.rfind(b'\n') + 1
+                text, carry = text[:cut], text[cut:]
+
+            pos = 0
+            for match in MARKER.finditer(text):
+                if columns is not None:
+                    parts.append(parse_rows(text[pos:match.start()], len(columns)))
+
+                if match.group('command'):
+                    kind = match.group('command').split()[0].decode()
+                elif match.group('header'):
+                    if columns is not None:
+                        yield build_block(kind, columns, parts)
+                    columns = match.group('header').decode().split()
+                    parts = []
+                elif columns is not None:
+                    yield build_block(kind, columns, parts)
+                    columns = None
+
+                pos = match.end()
+
+            if columns is not None:
+                parts.append(parse_rows(text[pos:], len(columns)))
+
+            if not chunk:
+                break
+
+    # A log cut short by a killed job still returns the rows written so far
+    if columns is not None:
+        yield build_block(kind, columns, parts)
+
+def merge_blocks(blocks, kind='run'):
+    """
+    Concatenates consecutive blocks of the same kind and columns into one.
+
+    Segmented runs (see insitu.py) print one block per segment, each
+    repeating the last step of the previous one; repeated steps are dropped.
+    """
+    merged = []
+
+    for block in blocks:
+        if block.kind != kind:
+            continue
+
+        if merged and merged[-1].columns == block.columns:
+            previous = merged[-1]
+            data = block.data
+            if 'Step' in block.columns and len(previous) and len(data):
+                data = data[data['Step'] > previous.data['Step'][-1]]
+            previous.data = np.concatenate([previous.data, data])
+        else:
+            merged.append(ThermoBlock(block.kind, block.columns, block.data.copy()))
+
+    return merged
+
+def read_timings(path):
+    """
+    Returns the timing summary of every run/minimize in a LAMMPS log, in order.
+
+    Each entry holds the loop time, rank count, steps and atoms from the
+    `Loop time of` line, and `sections` mapping each row of the timing
+    breakdown (Pair, Neigh, Comm, Output, ...) to its min/avg/max time across
+    ranks, %varavg and % of the total. Fields LAMMPS leaves blank are None.
+    """
+    with open(path, 'rb') as f:
+        text = f.read()
+
+    timings = []
+    loops = list(LOOP_LINE.finditer(text))
+
+    for index, loop in enumerate(loops):
+        end = loops[index + 1].start() if index + 1 < len(loops) else len(text)
+
+        sections = {}
+        for row in SECTION_LINE.finditer(text, loop.end(), end):
+            values = [field.strip() for field in row.group('values').decode().split('|')]
+            sections[row.group('name').decode()] = {name: float(value) if value else None
+                                                    for name, value in zip(SECTION_FIELDS, values)}
+
+        timings.append({
+            'loop_time': float(loop.group('time')),
+            'procs': int(loop.group('procs')),
+            'steps': int(loop.group('steps')),
+            'atoms': int(loop.group('atoms')),
+            'sections': sections,
+        })
+
+    return timings
+
+# --------------------------- UTILITIES ---------------------------#
+
+def parse_rows(text, n_columns):
+    """Parses the numeric lines of a piece of thermo output into an (n, n_columns) float array."""
+    values = np.fromstring(b'\n'.join(DATA_LINE.findall(text)).decode(), dtype=np.float64, sep=' ')
+
+    # A row cut short (end of a killed job's log) is dropped rather than shifting every later row
+    n_rows = len(values) // n_columns
+    return values[:n_rows * n_columns].reshape(n_rows, n_columns)
+
+def build_block(kind, columns, parts):
+    values = np.concatenate(parts) if parts else np.empty((0, len(columns)))
+
+    dtype = [(name, np.int64 if name in INTEGER_COLUMNS else np.float64) for name in columns]
+    data = np.empty(len(values), dtype=dtype)
+    for index, name in enumerate(columns):
+        data[name] = values[:, index]
+
+    return ThermoBlock(kind, columns, data)
+
+def load_cache(cache_path, log_path):
+    """Returns the cached blocks if the sidecar matches the current log, else None."""
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path) as cached:
+            meta = json.loads(str(cached['meta']))
+            if meta['version'] != CACHE_VERSION or meta['source'] != file_identity(log_path):
+                return None
+            return [ThermoBlock(kind, columns, cached[f"block_{index}"])
+                    for index, (kind, columns) in enumerate(meta['blocks'])]
+    except (OSError, ValueError, KeyError):
+        return None # Unreadable or partly written sidecar; parse the log again
+
+def save_cache(cache_path, log_path, blocks):
+    meta = {
+        'version': CACHE_VERSION,
+        'source': file_identity(log_path),
+        'blocks': [[block.kind, block.columns] for block in blocks],
+    }
+    arrays = {f"block_{index}": block.data for index, block in enumerate(blocks)}
+
+    with open(cache_path + '.tmp', 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(cache_path + '.tmp', cache_path)
@@ -0,0 +1,167 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import struct
+
+import numpy as np
+
+# --------------------------- CONFIG ---------------------------#
+
+MAGIC = b'DIPPITSR'
+VERSION = 1
+ALIGNMENT = 8 # Records start on an 8-byte boundary so the file can be viewed in place
+
+FLUSH_ROWS = 256 # Rows buffered in memory before they are written, unless flush() is called first
+
+# --------------------------- WRITER ---------------------------#
+
+class TimeSeriesWriter:
+    """
+    Append-only binary time series of global scalars.
+
+    After a small JSON header, every sample is one fixed-size record: an
+    int64 timestep followed by one float64 per column. Rows are buffered and
+    written `flush_rows` at a time or on `flush()`, so a run that is killed
+    loses the rows appended since the last flush, and a write cut short
+    leaves a partial last record, which the reader ignores. Call `flush()`
+    before every restart file is written (InsituRegistry does) so that a
+    run resumed from it finds every row up to the restart step.
+
+    With `resume_from`, an existing series is reopened and every record
+    after that timestep is dropped; `last_timestep` is then the last record
+    kept. Unlike a trajectory frame, the record at the restart step is kept:
+    it averages the block that ended there, which the resumed run does not
+    sample again.
+    """
+
+    def __init__(self, path, columns, resume_from=None, flush_rows=FLUSH_ROWS):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = record_dtype(self.columns)
+        self.flush_rows = flush_rows
+        self.last_timestep = None
+        self._buffer = []
+
+        if resume_from is not None and os.path.isfile(path):
+            self._resume(resume_from)
+            return
+
+        header = json.dumps({'columns': self.columns}).encode()
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + struct.pack('<II', VERSION, len(header)) + header)
+        self._file.write(b'\0' * (-self._file.tell() % ALIGNMENT))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, timestep, values):
+        """Adds one sample; `values` holds one number per column, in order."""
+        if len(values) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values, got {len(values)}")
+
+        self._buffer.append((timestep, *values))
+        self.last_timestep = timestep
+
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(np.array(self._buffer, dtype=self.dtype).tobytes())
+            self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def _resume(self, timestep):
+        """Reopens the series at `self.path` for appending, truncated after `timestep`."""
+        existing = TimeSeries(self.path)
+
+        if existing.columns != self.columns:
+            raise ValueError(f"{self.path} has columns {existing.columns}, cannot resume with {self.columns}")
+
+        n_kept = int(np.sum(existing.timesteps <= timestep))
+        end = existing.offset + n_kept * self.dtype.itemsize
+        if n_kept:
+            self.last_timestep = int(existing.timesteps[n_kept - 1])
+        del existing
+
+        self._file = open(self.path, 'r+b')
+        self._file.truncate(end)
+        self._file.seek(end)
+
+# --------------------------- READER ---------------------------#
+
+class TimeSeries:
+    """
+    Memory-mapped reader for series written by TimeSeriesWriter.
+
+    `data` is a read-only structured array with a 'timestep' field and one
+    float64 field per column, so `series['fx']` or `series.data[mask]` read
+    the whole run without parsing anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            head = f.read(len(MAGIC) + 8)
+            if head[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a binary time series")
+
+            version, header_size = struct.unpack('<II', head[len(MAGIC):])
+            if version != VERSION:
+                raise ValueError(f"{path}: unsupported time series version {version}")
+
+            self.columns = json.loads(f.read(header_size))['columns']
+
+        self.dtype = record_dtype(self.columns)
+        self.offset = aligned(len(MAGIC) + 8 + header_size)
+
+        # A partial last record from an interrupted write is left out
+        n_records = (os.path.getsize(path) - self.offset) // self.dtype.itemsize
+        if n_records > 0:
+            self.data = np.memmap(path, dtype=self.dtype, mode='r', offset=self.offset, shape=(n_records,))
+        else:
+            self.data = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    @property
+    def timesteps(self):
+        return self.data['timestep']
+
+    def window(self, start=None, stop=None):
+        """Records with start <= timestep < stop, as a view."""
+        lo = 0 if start is None else np.searchsorted(self.timesteps, start, side='left')
+        hi = len(self) if stop is None else np.searchsorted(self.timesteps, stop, side='left')
+        return self.data[lo:hi]
+
+# --------------------------- UTILITIES ---------------------------#
+
+def record_dtype(columns):
+    return np.dtype([('timestep', np.int64)] + [(name, np.float64) for name in columns])
+
+def aligned(n_bytes):
+    return -(-n_bytes // ALIGNMENT) * ALIGNMENT
+
+def read_timeseries(path):
+    """Returns the whole series at `path` as an in-memory structured array."""
+    return np.array(TimeSeries(path).data)
+
+def is_timeseries(path):
+    """Returns True if `path` starts with the binary time series magic."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
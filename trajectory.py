@@ -0,0 +1,199 @@
+# --------------------------- LIBRARIES ---------------------------#
+import json
+import os
+import struct
+
+import numpy as np
+
+from dump_reader import DumpFrame
+
+# --------------------------- CONFIG ---------------------------#
+
+MAGIC = b'DIPPITRJ'
+VERSION = 1
+ALIGNMENT = 64 # Every column block starts on a 64-byte boundary so it can be viewed in place
+
+INDEX_SUFFIX = '.index'
+INDEX_DTYPE = np.dtype([
+    ('timestep', np.int64),
+    ('n_atoms', np.int64),
+    ('offset', np.int64),
+    ('box_bounds', np.float64, (3, 2)),
+])
+
+# --------------------------- WRITER ---------------------------#
+
+class TrajectoryWriter:
+    """
+    Append-only columnar trajectory.
+
+    Frames are stored column by column in a single data file. A fixed-size
+    record per frame is appended to `<path>.index` only once the frame's
+    data is on disk, so an interrupted run leaves a readable trajectory.
+
+    With `resume_from`, an existing trajectory is reopened instead and every
+    frame at or after that timestep is dropped, so a run restarted from a
+    restart file continues it without duplicate frames.
+    """
+
+    def __init__(self, path, columns, box_flags, resume_from=None):
+        self.path = path
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.box_flags = list(box_flags)
+
+        header = json.dumps({
+            'columns': [[name, dtype.str] for name, dtype in self.columns],
+            'box_flags': self.box_flags,
+        }).encode()
+
+        if resume_from is not None and os.path.isfile(path) and os.path.isfile(path + INDEX_SUFFIX):
+            self._resume(resume_from)
+            return
+
+        self._data = open(path, 'wb')
+        self._data.write(MAGIC + struct.pack('<II', VERSION, len(header)) + header)
+        self._pad()
+
+        self._index = open(path + INDEX_SUFFIX, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def append(self, timestep, box_bounds, arrays):
+        """Writes one frame; `arrays` maps every column name to a 1D array."""
+        n_atoms = len(arrays[self.columns[0][0]])
+        offset = self._data.tell()
+
+        for name, dtype in self.columns:
+            values = np.ascontiguousarray(arrays[name], dtype=dtype)
+
+            if len(values) != n_atoms:
+                raise ValueError(f"Column '{name}' has {len(values)} values, expected {n_atoms}")
+
+            self._data.write(values.tobytes())
+            self._pad()
+
+        self._data.flush()
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['timestep'] = timestep
+        record['n_atoms'] = n_atoms
+        record['offset'] = offset
+        record['box_bounds'] = np.asarray(box_bounds, dtype=np.float64)
+
+        self._index.write(record.tobytes())
+        self._index.flush()
+
+    def _pad(self):
+        self._data.write(b'\0' * (-self._data.tell() % ALIGNMENT))
+
+    def _resume(self, timestep):
+        """Reopens the trajectory at `self.path` for appending, truncated before `timestep`."""
+        existing = Trajectory(self.path)
+
+        if list(existing.dtypes.items()) != self.columns:
+            raise ValueError(f"{self.path} has columns {list(existing.dtypes)}, cannot resume with {[name for name, _ in self.columns]}")
+
+        keep = existing.index[existing.index['timestep'] < timestep]
+        if len(keep):
+            end = int(keep['offset'][-1]) + existing._frame_size(int(keep['n_atoms'][-1]))
+        else:
+            _, header_size = struct.unpack('<II', bytes(existing._data[len(MAGIC):len(MAGIC) + 8]))
+            end = aligned(len(MAGIC) + 8 + header_size)
+        del existing
+
+        self._data = open(self.path, 'r+b')
+        self._data.truncate(end)
+        self._data.seek(end)
+
+        self._index = open(self.path + INDEX_SUFFIX, 'r+b')
+        self._index.truncate(len(keep) * INDEX_DTYPE.itemsize)
+        self._index.seek(0, os.SEEK_END)
+
+# --------------------------- READER ---------------------------#
+
+class Trajectory:
+    """
+    Memory-mapped reader for trajectories written by TrajectoryWriter.
+
+    `column()` and `columns()` return zero-copy views into the mapped file;
+    `read()` copies the selected columns into a DumpFrame so the result can
+    be used wherever a frame from dump_reader is expected.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+
+        if bytes(self._data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a binary trajectory")
+
+        version, header_size = struct.unpack('<II', bytes(self._data[len(MAGIC):len(MAGIC) + 8]))
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported trajectory version {version}")
+
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(self._data[start:start + header_size]))
+
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in header['columns']}
+        self.box_flags = header['box_flags']
+
+        index = np.fromfile(path + INDEX_SUFFIX, dtype=INDEX_DTYPE)
+        self.index = index[index['offset'] + self._frame_size(index['n_atoms']) <= len(self._data)]
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timesteps(self):
+        return self.index['timestep']
+
+    def column(self, name, frame):
+        """Returns a read-only view of one column of one frame."""
+        record = self.index[frame]
+        n_atoms = int(record['n_atoms'])
+        offset = int(record['offset'])
+
+        for column, dtype in self.dtypes.items():
+            if column == name:
+                return self._data[offset:offset + n_atoms * dtype.itemsize].view(dtype)
+            offset += aligned(n_atoms * dtype.itemsize)
+
+        raise KeyError(f"Column '{name}' not found in trajectory (available: {list(self.dtypes)})")
+
+    def columns(self, frame, names=None):
+        """Returns a dict of read-only column views for one frame."""
+        return {name: self.column(name, frame) for name in (names or self.dtypes)}
+
+    def read(self, frame, columns=None):
+        """Copies the selected columns of one frame into a DumpFrame."""
+        views = self.columns(frame, columns)
+
+        atoms = np.empty(int(self.index[frame]['n_atoms']), dtype=[(name, self.dtypes[name]) for name in views])
+        for name, values in views.items():
+            atoms[name] = values
+
+        return DumpFrame(int(self.index[frame]['timestep']), self.index[frame]['box_bounds'], self.box_flags, atoms)
+
+    def _frame_size(self, n_atoms):
+        return sum(aligned(n_atoms * dtype.itemsize) for dtype in self.dtypes.values())
+
+# --------------------------- UTILITIES ---------------------------#
+
+def aligned(n_bytes):
+    """Rounds a byte count up to the column alignment."""
+    return -(-n_bytes // ALIGNMENT) * ALIGNMENT
+
+def is_trajectory(path):
+    """Returns True if `path` starts with the binary trajectory magic."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,180 @@
+# --------------------------- LIBRARIES ---------------------------#
+import itertools
+
+import numpy as np
+
+from dump_reader import read_dump
+from mpi_shared import share_array
+
+# --------------------------- CONFIG ---------------------------#
+
+# Cell edge lower bound in Angstrom; must exceed the largest atom-to-nearest-site distance
+# (about 0.56 a for BCC), so one lattice constant of Fe is safe
+CELL_SIZE = 3.0
+
+BATCH_SIZE = 65536 # Atoms assigned per vectorised batch
+
+NEIGHBOUR_OFFSETS = np.array(list(itertools.product((-1, 0, 1), repeat=3)))
+
+# --------------------------- SITE INDEX ---------------------------#
+
+class SiteIndex:
+    """
+    Periodic cell list over the reference sites of a Wigner-Seitz analysis.
+
+    `sites` holds the reference positions and `cell_table` the site indexes in
+    every cell, padded with -1 to the fullest cell. Both are flat arrays, so
+    they can live in MPI shared memory (see share_site_index) while the small
+    geometry attributes are copied to every rank.
+    """
+
+    def __init__(self, sites, cell_table, origin, lengths, n_cells, periodic):
+        self.sites = sites
+        self.cell_table = cell_table
+        self.origin = np.asarray(origin, dtype=float)
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.n_cells = np.asarray(n_cells, dtype=np.int64)
+        self.periodic = np.asarray(periodic, dtype=bool)
+
+    @classmethod
+    def build(cls, sites, box_bounds, box_flags, cell_size=CELL_SIZE):
+        """Bins the reference sites into cells of at least `cell_size` per side."""
+        box_bounds = np.asarray(box_bounds)[:, :2]
+        origin = box_bounds[:, 0]
+        lengths = box_bounds[:, 1] - box_bounds[:, 0]
+        n_cells = np.maximum((lengths // cell_size).astype(np.int64), 1)
+        periodic = [flag.startswith('p') for flag in box_flags]
+
+        index = cls(np.ascontiguousarray(sites, dtype=float), None, origin, lengths, n_cells, periodic)
+
+        cell_ids = index.cell_ids(index.cell_coords(index.sites))
+        order = np.argsort(cell_ids, kind='stable')
+        counts = np.bincount(cell_ids, minlength=int(np.prod(n_cells)))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        sorted_ids = cell_ids[order]
+        slots = np.arange(len(order)) - starts[sorted_ids]
+
+        index.cell_table = np.full((len(counts), max(int(counts.max()), 1)), -1, dtype=np.int64)
+        index.cell_table[sorted_ids, slots] = order
+
+        return index
+
+    @property
+    def geometry(self):
+        """The small, picklable part of the index."""
+        return {'origin': self.origin, 'lengths': self.lengths, 'n_cells': self.n_cells, 'periodic': self.periodic}
+
+    def cell_coords(self, positions):
+        """Integer cell coordinates, wrapped in periodic and clipped in fixed directions."""
+        coords = np.floor((positions - self.origin) / self.lengths * self.n_cells).astype(np.int64)
+        return self.wrap(coords)
+
+    def wrap(self, coords):
+        coords = coords.copy()
+        for dim in range(3):
+            if self.periodic[dim]:
+                coords[:, dim] %= self.n_cells[dim]
+            else:
+                np.clip(coords[:, dim], 0, self.n_cells[dim] - 1, out=coords[:, dim])
+        return coords
+
+    def cell_ids(self, coords):
+        return (coords[:, 0] * self.n_cells[1] + coords[:, 1]) * self.n_cells[2] + coords[:, 2]
+
+    def nearest(self, positions, batch_size=BATCH_SIZE):
+        """Index of the nearest reference site (minimum image) for every position."""
+        positions = np.asarray(positions, dtype=float)
+        nearest = np.empty(len(positions), dtype=np.int64)
+
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            nearest[start:start + len(batch)] = self._nearest_batch(batch)
+
+        return nearest
+
+    def occupancy(self, positions):
+        """Number of atoms assigned to every reference site."""
+        return np.bincount(self.nearest(positions), minlength=len(self.sites))
+
+    def _nearest_batch(self, positions):
+        coords = self.cell_coords(positions)
+        rows = np.arange(len(positions))
+
+        best_d2 = np.full(len(positions), np.inf)
+        best = np.full(len(positions), -1, dtype=np.int64)
+
+        for offset in NEIGHBOUR_OFFSETS:
+            candidates = self.cell_table[self.cell_ids(self.wrap(coords + offset))]
+
+            delta = self.sites[candidates] - positions[:, None, :]
+            for dim in np.flatnonzero(self.periodic):
+                delta[..., dim] -= self.lengths[dim] * np.round(delta[..., dim] / self.lengths[dim])
+
+            d2 = np.einsum('ijk,ijk->ij', delta, delta)
+            d2[candidates < 0] = np.inf
+
+            slot = np.argmin(d2, axis=1)
+            closest = d2[rows, slot]
+
+            improved = closest < best_d2
+            best_d2[improved] = closest[improved]
+            best[improved] = candidates[rows, slot][improved]
+
+        return best
+
+# --------------------------- SHARED INDEX ---------------------------#
+
+def share_site_index(comm, reference_path, columns=('id', 'c_peratom'), cell_size=CELL_SIZE):
+    """
+    Builds the site index from a reference dump on rank 0 and places it, with
+    the requested reference columns, in shared memory once per node.
+
+    Returns the index, a dict of the shared reference columns and the MPI
+    windows backing them, which must be kept alive while the index is used.
+    """
+    index = None
+    reference = None
+
+    if comm.Get_rank() == 0:
+        reference = read_dump(reference_path, columns=['x', 'y', 'z', *columns])
+        sites = np.column_stack([reference.atoms['x'], reference.atoms['y'], reference.atoms['z']])
+        index = SiteIndex.build(sites, reference.box_bounds, reference.box_flags, cell_size)
+
+    geometry = comm.bcast(index.geometry if index is not None else None, root=0)
+
+    sites, sites_window = share_array(comm, index.sites if index is not None else None)
+    cell_table, table_window = share_array(comm, index.cell_table if index is not None else None)
+    windows = [sites_window, table_window]
+
+    reference_columns = {}
+    for name in columns:
+        values, window = share_array(comm, np.ascontiguousarray(reference.atoms[name]) if reference is not None else None)
+        reference_columns[name] = values
+        windows.append(window)
+
+    return SiteIndex(sites, cell_table, **geometry), reference_columns, windows
+
+# --------------------------- ANALYSIS ---------------------------#
+
+def point_defects(index, reference_columns, frame):
+    """
+    Wigner-Seitz analysis of one frame: returns the reference sites whose
+    occupancy is not 1 (vacancies and interstitial sites) as a structured
+    array with the reference `id`, site position, any other reference
+    columns and `Occupancy`, matching the OVITO export used previously.
+    """
+    positions = np.column_stack([frame.atoms['x'], frame.atoms['y'], frame.atoms['z']])
+    occupancy = index.occupancy(positions)
+
+    defects = np.flatnonzero(occupancy != 1)
+
+    names = ['id', 'x', 'y', 'z'] + [name for name in reference_columns if name != 'id'] + ['Occupancy']
+    output = np.empty(len(defects), dtype=[(name, np.int64 if name in ('id', 'Occupancy') else np.float64) for name in names])
+
+    output['x'], output['y'], output['z'] = index.sites[defects].T
+    for name, values in reference_columns.items():
+        output[name] = values[defects]
+    output['Occupancy'] = occupancy[defects]
+
+    return output